@@ -0,0 +1,83 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Generic, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+# Bounded LRU of live agents with an idle TTL. Lookups refresh both recency and idle time.
+class AgentCache(Generic[T]):
+    def __init__(self, max_size: int = 8, idle_ttl: Optional[float] = 1800.0):
+        self.max_size = max_size
+        self.idle_ttl = idle_ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, list]" = OrderedDict()
+        self._build_locks: Dict[str, threading.Lock] = {}
+        self._generations: Dict[str, int] = {}
+        self._lock = threading.RLock()
+
+    def _expired(self, last_used: float, now: float) -> bool:
+        return self.idle_ttl is not None and now - last_used > self.idle_ttl
+
+    def get(self, name: str) -> Optional[T]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None:
+                return None
+            if self._expired(entry[1], now):
+                del self._entries[name]
+                return None
+            entry[1] = now
+            self._entries.move_to_end(name)
+            return entry[0]
+
+    def put(self, name: str, value: T):
+        now = time.monotonic()
+        with self._lock:
+            self._entries[name] = [value, now]
+            self._entries.move_to_end(name)
+            for stale in [key for key, (_, last_used) in self._entries.items() if self._expired(last_used, now)]:
+                del self._entries[stale]
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def get_or_create(self, name: str, factory: Callable[[], T]) -> T:
+        value = self.get(name)
+        if value is not None:
+            with self._lock:
+                self.hits += 1
+            return value
+        with self._lock:
+            build_lock = self._build_locks.setdefault(name, threading.Lock())
+        # Only one thread builds a given agent; the others wait and reuse it
+        with build_lock:
+            value = self.get(name)
+            if value is not None:
+                with self._lock:
+                    self.hits += 1
+                return value
+            with self._lock:
+                self.misses += 1
+                generation = self._generations.get(name, 0)
+            value = factory()
+            with self._lock:
+                # Skip caching if the agent was invalidated while it was being built
+                if self._generations.get(name, 0) == generation:
+                    self.put(name, value)
+            return value
+
+    def invalidate(self, name: str):
+        with self._lock:
+            self._generations[name] = self._generations.get(name, 0) + 1
+            self._entries.pop(name, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._entries), "max_size": self.max_size, "hits": self.hits, "misses": self.misses}
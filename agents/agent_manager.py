@@ -1,84 +1,264 @@
+import asyncio
 import os
-from typing import List, Optional
+import time
+from functools import lru_cache
+from typing import TYPE_CHECKING, AsyncIterator, Callable, Dict, Iterator, List, Optional
 from database.db_manager import DBManager
-from langchain_community.chat_models import ChatOpenAI
-from langchain.chains import LLMChain
-from langchain.prompts import PromptTemplate
-from kb.knowledge_base import KnowledgeBase
+from agents.agent_cache import AgentCache
+from utils.helpers import count_tokens
+from utils.metrics import increment, metrics_enabled, observe, span
 from dotenv import load_dotenv
 
+# langchain, FAISS, numpy and the HTTP clients are imported where first used, so the UI can
+# come up (and list agents from SQLite) before any of them has loaded
+if TYPE_CHECKING:
+    from agents.ingest_queue import IngestQueue
+    from agents.response_cache import ResponseCache
+
 AGENT_DATA_DIR = "agents_data"
+AGENT_CACHE_SIZE = int(os.getenv("AGENT_CACHE_SIZE", "8"))
+AGENT_CACHE_TTL = float(os.getenv("AGENT_CACHE_TTL", "1800"))
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "0") == "1"
+SUMMARY_WORD_LIMIT = int(os.getenv("SUMMARY_WORD_LIMIT", "200"))
+SUMMARY_TEMPLATE = (
+    "Update the running summary of a tutoring conversation. Keep the topics covered, the definitions "
+    "and results established, and the student's open questions and learning gaps. Use at most "
+    "{word_limit} words.\n\nCurrent summary:\n{summary}\n\nNew conversation turns:\n{transcript}\n\n"
+    "Updated summary:"
+)
+
+
+@lru_cache(maxsize=1)
+def summary_prompt():
+    from langchain.prompts import PromptTemplate
+    return PromptTemplate.from_template(SUMMARY_TEMPLATE)
+
+
+# Additional llm_choice values, each mapped to a factory returning a chat model
+LLM_FACTORIES: Dict[str, Callable] = {}
 load_dotenv()
 
+
+def register_llm(llm_choice: str, factory: Callable):
+    LLM_FACTORIES[llm_choice] = factory
+
+
 class Agent:
-    def __init__(self, name: str, base_prompt: str, llm_choice: str):
+    def __init__(self, name: str, base_prompt: str, llm_choice: str,
+                 response_cache: Optional["ResponseCache"] = None, index_config: Optional[dict] = None):
+        from kb.knowledge_base import KnowledgeBase
         self.name = name
         self.base_prompt = base_prompt
         self.llm_choice = llm_choice
-        self.vector_store = KnowledgeBase(agent_name=name)
+        self.response_cache = response_cache
+        self.vector_store = KnowledgeBase(agent_name=name, index_config=index_config, read_only=True)
         self.chain = self._init_chain()
 
     def _init_chain(self):
-        prompt = PromptTemplate.from_template(self.base_prompt)
+        from langchain.chains import LLMChain
+        from langchain.prompts import PromptTemplate
+        self.prompt = PromptTemplate.from_template(self.base_prompt)
 
-        if self.llm_choice == "deepseek":
-            llm = ChatOpenAI(
-                openai_api_base= os.getenv("OPEN_API_BASE"),
-                openai_api_key=os.getenv("OPEN_API_KEY"),
-                model="deepseek-chat",
-            )
+        if self.llm_choice in LLM_FACTORIES:
+            self.llm = LLM_FACTORIES[self.llm_choice]()
 
         else:
-            raise ValueError(f"Unsupported LLM: {self.llm_choice}")
+            # Shared per provider (see agents.llm_registry); raises ValueError for unknown choices
+            from agents.llm_registry import get_chat_model
+            self.llm = get_chat_model(self.llm_choice)
+
+        return LLMChain(prompt=self.prompt, llm=self.llm)
+
+    def _cache_lookup(self, user_input, context):
+        if not self.response_cache:
+            return None
+        cached = self.response_cache.lookup(self.name, self.base_prompt, self.llm_choice, user_input, context)
+        increment("cache_events_total", cache="response", result="miss" if cached is None else "hit")
+        return cached
+
+    def _record_tokens(self, user_input, context, response):
+        # Estimated with count_tokens; skipped entirely unless metrics are enabled
+        if metrics_enabled():
+            prompt_text = self.prompt.format(input=user_input, context=context)
+            increment("llm_tokens_total", count_tokens(prompt_text), agent=self.name, kind="prompt")
+            increment("llm_tokens_total", count_tokens(response), agent=self.name, kind="completion")
 
-        return LLMChain(prompt=prompt, llm=llm)
+    def _cache_store(self, user_input, context, response, started):
+        if self.response_cache:
+            self.response_cache.store(self.name, self.base_prompt, self.llm_choice, user_input, context,
+                                      response, time.perf_counter() - started)
+
+    def _cached_run(self, user_input, context):
+        cached = self._cache_lookup(user_input, context)
+        if cached is not None:
+            return cached
+        started = time.perf_counter()
+        with span("llm.call", agent=self.name, llm=self.llm_choice):
+            response = self.chain.run({"input": user_input, "context": context})
+        self._record_tokens(user_input, context, response)
+        self._cache_store(user_input, context, response, started)
+        return response
 
     def respond(self, user_input, context=None):
-        return self.chain.run({"input": user_input, "context": context})
+        with span("agent.respond", agent=self.name):
+            return self._cached_run(user_input, context)
+
+    def stream(self, user_input, context=None) -> Iterator[str]:
+        cached = self._cache_lookup(user_input, context)
+        if cached is not None:
+            yield cached
+            return
+        started = time.perf_counter()
+        parts = []
+        prompt_value = self.prompt.invoke({"input": user_input, "context": context})
+        for chunk in self.llm.stream(prompt_value):
+            if chunk.content:
+                if not parts:
+                    observe("stage_seconds", time.perf_counter() - started, stage="llm.first_token", agent=self.name)
+                parts.append(chunk.content)
+                yield chunk.content
+        observe("stage_seconds", time.perf_counter() - started, stage="llm.stream", agent=self.name)
+        self._record_tokens(user_input, context, "".join(parts))
+        self._cache_store(user_input, context, "".join(parts), started)
+
+    async def astream(self, user_input, context=None, executor=None) -> AsyncIterator[str]:
+        # The response cache is SQLite (and an embedding call with similarity matching), so its
+        # lookup and store run in `executor`, keeping the event loop free for other streams
+        loop = asyncio.get_running_loop()
+        cached = await loop.run_in_executor(executor, self._cache_lookup, user_input, context)
+        if cached is not None:
+            yield cached
+            return
+        started = time.perf_counter()
+        parts = []
+        prompt_value = await self.prompt.ainvoke({"input": user_input, "context": context})
+        async for chunk in self.llm.astream(prompt_value):
+            if chunk.content:
+                if not parts:
+                    observe("stage_seconds", time.perf_counter() - started, stage="llm.first_token", agent=self.name)
+                parts.append(chunk.content)
+                yield chunk.content
+        observe("stage_seconds", time.perf_counter() - started, stage="llm.stream", agent=self.name)
+        self._record_tokens(user_input, context, "".join(parts))
+        await loop.run_in_executor(executor, self._cache_store, user_input, context, "".join(parts), started)
+
+    def summarize(self, summary: str, transcript: str) -> str:
+        prompt_value = summary_prompt().invoke({
+            "summary": summary or "(none)", "transcript": transcript, "word_limit": SUMMARY_WORD_LIMIT,
+        })
+        with span("agent.summarize", agent=self.name):
+            return self.llm.invoke(prompt_value).content.strip()
 
     def run(self, user_input: str) -> str:
         context = self.vector_store.query(user_input)
-        return self.chain.run({"input": user_input, "context": context})
+        return self._cached_run(user_input, context)
 
 
 class AgentManager:
-    def __init__(self, agent_storage: str = AGENT_DATA_DIR):
+    def __init__(self, agent_storage: str = AGENT_DATA_DIR, cache_size: int = AGENT_CACHE_SIZE,
+                 cache_ttl: Optional[float] = AGENT_CACHE_TTL, response_cache: Optional["ResponseCache"] = None):
         print("Ingesting from:", agent_storage)
         print("Files found:", os.listdir(agent_storage))
         self.db = DBManager()
+        self.agent_cache: AgentCache[Agent] = AgentCache(max_size=cache_size, idle_ttl=cache_ttl)
+        # Opt-in: pass a ResponseCache or set RESPONSE_CACHE_ENABLED=1
+        if response_cache is None and RESPONSE_CACHE_ENABLED:
+            from agents.response_cache import ResponseCache
+            response_cache = ResponseCache()
+        self.response_cache = response_cache
+        self._ingest_queue: Optional["IngestQueue"] = None
         self.agent_storage = agent_storage
         if not os.path.exists(agent_storage):
             os.makedirs(agent_storage)
 
-    def create_agent(self, name: str, base_prompt: str, llm_choice: str, ingest_path: str=None) -> None:
+    def create_agent(self, name: str, base_prompt: str, llm_choice: str, ingest_path: str=None,
+                     ingest_workers: Optional[int] = None, embed_batch_size: Optional[int] = None,
+                     index_config: Optional[dict] = None) -> None:
         self.db.save_agent(name, base_prompt, llm_choice)
+        if index_config is not None:
+            from kb.index_config import resolve_config
+            self.db.save_index_config(name, resolve_config(index_config))
+        self.agent_cache.invalidate(name)
+
+        if ingest_path:
+            self.ingest_folder(name, ingest_path, ingest_workers=ingest_workers, embed_batch_size=embed_batch_size)
+
+    @property
+    def ingest_queue(self) -> "IngestQueue":
+        # Background ingestion jobs; its worker threads start with the first submitted job
+        # (or an explicit start(), which also resumes jobs left over from a previous run)
+        if self._ingest_queue is None:
+            from agents.ingest_queue import IngestQueue
+            self._ingest_queue = IngestQueue(self)
+        return self._ingest_queue
 
-        if ingest_path and os.path.isdir(ingest_path):
-            valid_exts = ('.txt', '.pdf', '.md')
-            file_paths = [
-                os.path.join(ingest_path, f)
-                for f in os.listdir(ingest_path)
-                if f.lower().endswith(valid_exts)
-            ]
-
-            if file_paths:
-                kb = KnowledgeBase(agent_name=name)
-                print(f"Ingesting {len(file_paths)} documents...")
-                kb.ingest_docs(file_paths)
-            else:
-                print("No supported files to ingest.")
-        elif ingest_path:
+    def ingest_folder(self, name: str, ingest_path: str, ingest_workers: Optional[int] = None,
+                      embed_batch_size: Optional[int] = None, prune: bool = True,
+                      progress: Optional[Callable[[dict], None]] = None, cancel=None,
+                      duty_cycle: float = 1.0, nice: int = 0) -> Optional[dict]:
+        # Re-running this on the same folder only embeds new or changed files; with
+        # prune=True, files that disappeared from the folder are dropped from the index.
+        # Blocks until done; use ingest_queue.submit() to ingest in the background.
+        if not os.path.isdir(ingest_path):
             print(f"Unsupported ingest path: {ingest_path}")
+            return None
+
+        valid_exts = ('.txt', '.pdf', '.md')
+        file_paths = [
+            os.path.join(ingest_path, f)
+            for f in os.listdir(ingest_path)
+            if f.lower().endswith(valid_exts)
+        ]
+
+        if not file_paths:
+            # Pruning against an empty list would delete the whole index, so a wrong or
+            # emptied folder leaves the knowledge base as it is
+            print("No supported files to ingest.")
+            from kb.ingestion import IngestStats
+            return IngestStats(total_files=0).as_dict()
+        from kb.knowledge_base import KnowledgeBase
+        kb = KnowledgeBase(agent_name=name, index_config=self.db.load_index_config(name))
+        stats = kb.ingest_docs(file_paths, workers=ingest_workers, batch_size=embed_batch_size, prune=prune,
+                               progress=progress, cancel=cancel, duty_cycle=duty_cycle, nice=nice)
+        # Cached agents hold the index as it was loaded; rebuild them on next use
+        self.agent_cache.invalidate(name)
+        return stats
 
     def get_agent(self, name: str) -> Agent:
-        config = self.db.load_agent(name)
-        return Agent(name=config['name'], base_prompt=config['base_prompt'], llm_choice=config['llm_choice'])
+        with span("agent.get", agent=name):
+            return self.agent_cache.get_or_create(name, lambda: self._build_agent(name))
+
+    def peek_agent(self, name: str) -> Optional[Agent]:
+        # Cached agent, or None; never builds one
+        return self.agent_cache.get(name)
+
+    def _build_agent(self, name: str) -> Agent:
+        increment("cache_events_total", cache="agent", result="miss")
+        with span("agent.build", agent=name):
+            config = self.db.load_agent(name)
+            return Agent(name=config['name'], base_prompt=config['base_prompt'], llm_choice=config['llm_choice'],
+                         response_cache=self.response_cache, index_config=self.db.load_index_config(name))
 
     def list_agents(self) -> List[str]:
         return self.db.list_agents()
 
     def delete_agent(self, name: str) -> None:
+        for job in self.db.list_ingest_jobs(name, active_only=True):
+            self.ingest_queue.cancel(job["id"])
         self.db.delete_agent(name)
+        self.agent_cache.invalidate(name)
+        if self.response_cache:
+            self.response_cache.invalidate(name)
+
+    def update_index_config(self, name: str, index_config: dict):
+        # Search-time settings (nprobe, ef_search) apply on the next get_agent; a different
+        # index_type takes effect when the agent's folder is next ingested.
+        from kb.index_config import resolve_config
+        self.db.save_index_config(name, resolve_config({**self.db.load_index_config(name), **index_config}))
+        self.agent_cache.invalidate(name)
 
     def update_agent_prompt(self, name: str, new_prompt: str):
-        self.db.update_agent_prompt(name, new_prompt)
\ No newline at end of file
+        self.db.update_agent_prompt(name, new_prompt)
+        self.agent_cache.invalidate(name)
+        if self.response_cache:
+            self.response_cache.invalidate(name)
\ No newline at end of file
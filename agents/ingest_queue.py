@@ -0,0 +1,148 @@
+import os
+import threading
+from typing import TYPE_CHECKING, Dict, List, Optional
+from utils.metrics import increment
+
+if TYPE_CHECKING:
+    from agents.agent_manager import AgentManager
+
+# Jobs processed at once; jobs for the same agent always run one after another
+INGEST_JOB_WORKERS = int(os.getenv("INGEST_JOB_WORKERS", "1"))
+# Per-job limits so background ingestion leaves CPU for live chat
+INGEST_JOB_LOAD_WORKERS = int(os.getenv("INGEST_JOB_LOAD_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+INGEST_JOB_BATCH_SIZE = int(os.getenv("INGEST_JOB_BATCH_SIZE", "64"))
+INGEST_JOB_DUTY_CYCLE = float(os.getenv("INGEST_JOB_DUTY_CYCLE", "0.5"))
+INGEST_JOB_NICE = int(os.getenv("INGEST_JOB_NICE", "10"))
+INGEST_JOB_POLL_SECONDS = float(os.getenv("INGEST_JOB_POLL_SECONDS", "2"))
+
+
+def process_token(pid: Optional[int] = None) -> Optional[str]:
+    # Identifies a process by pid and start time, so a restarted process that got the same pid
+    # (PID 1 in a container) or an unrelated process reusing it is not mistaken for the owner
+    import psutil
+    try:
+        process = psutil.Process(pid)
+        return f"{process.pid}:{process.create_time():.3f}"
+    except psutil.Error:
+        return None
+
+
+def _owner_alive(owner: Optional[str]) -> bool:
+    if not owner:
+        return False
+    try:
+        pid = int(owner.split(":", 1)[0])
+    except ValueError:
+        return False
+    return process_token(pid) == owner
+
+
+# Persistent ingestion queue: jobs live in SQLite (DBManager.ingest_jobs), so they survive
+# restarts, and background threads run them through AgentManager.ingest_folder with progress
+# reporting, cancellation and throttling. Interrupted jobs resume from the last checkpoint.
+class IngestQueue:
+    def __init__(self, manager: "AgentManager", workers: int = INGEST_JOB_WORKERS,
+                 poll_interval: float = INGEST_JOB_POLL_SECONDS):
+        self.manager = manager
+        self.db = manager.db
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.cancel_events: Dict[int, threading.Event] = {}
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self.owner = process_token()
+
+    def start(self):
+        if self._threads:
+            return
+        self._stop.clear()
+        # Jobs left "running" by a process that is gone go back to the queue, as do this
+        # process's own jobs that no worker is running any more
+        for job in self.db.list_ingest_jobs(active_only=True):
+            if job["status"] != "running" or job["id"] in self.cancel_events:
+                continue
+            if job["owner"] == self.owner or not _owner_alive(job["owner"]):
+                self.db.requeue_ingest_job(job["id"])
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run_worker, name=f"ingest-job-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: Optional[float] = None):
+        # Running jobs are cancelled (their progress so far is saved) and requeued on next start
+        self._stop.set()
+        self._wake.set()
+        for event in list(self.cancel_events.values()):
+            event.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def submit(self, agent_name: str, path: str, prune: bool = True, workers: int = INGEST_JOB_LOAD_WORKERS,
+               batch_size: int = INGEST_JOB_BATCH_SIZE, duty_cycle: float = INGEST_JOB_DUTY_CYCLE,
+               nice: int = INGEST_JOB_NICE) -> int:
+        job_id = self.db.enqueue_ingest_job(agent_name, path, {
+            "prune": prune, "workers": workers, "batch_size": batch_size, "duty_cycle": duty_cycle, "nice": nice,
+        })
+        self.start()
+        self._wake.set()
+        return job_id
+
+    def cancel(self, job_id: int) -> bool:
+        cancelled = self.db.cancel_ingest_job(job_id)
+        event = self.cancel_events.get(job_id)
+        if event is not None:
+            event.set()
+        return cancelled
+
+    def job(self, job_id: int) -> Optional[dict]:
+        return self.db.load_ingest_job(job_id)
+
+    def active_jobs(self, agent_name: Optional[str] = None) -> List[dict]:
+        return self.db.list_ingest_jobs(agent_name, active_only=True)
+
+    def _run_worker(self):
+        while not self._stop.is_set():
+            job = self.db.claim_ingest_job(self.owner, os.getpid())
+            if job is None:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+                continue
+            self._run_job(job)
+
+    def _run_job(self, job: dict):
+        job_id = job["id"]
+        cancel = self.cancel_events[job_id] = threading.Event()
+
+        def progress(update: dict):
+            self.db.update_ingest_progress(job_id, update)
+            # Also picks up cancellations requested from another process
+            if self.db.load_ingest_job(job_id)["cancel_requested"]:
+                cancel.set()
+
+        options = job["options"]
+        try:
+            self.db.load_agent(job["agent_name"])
+            stats = self.manager.ingest_folder(
+                job["agent_name"], job["path"], ingest_workers=options.get("workers"),
+                embed_batch_size=options.get("batch_size"), prune=options.get("prune", True),
+                progress=progress, cancel=cancel, duty_cycle=options.get("duty_cycle", 1.0),
+                nice=options.get("nice", 0),
+            )
+            error = None
+            if stats is None:
+                status, error = "failed", f"Unsupported ingest path: {job['path']}"
+            else:
+                status = "cancelled" if stats.get("cancelled") else "done"
+            if status == "cancelled" and self._stop.is_set():
+                self.db.requeue_ingest_job(job_id)  # shutting down, not a user cancellation
+            else:
+                self.db.finish_ingest_job(job_id, status, error)
+            increment("ingest_jobs_total", status=status)
+        except Exception as e:
+            print(f"[ERROR] Ingestion job {job_id} for '{job['agent_name']}' failed: {e}")
+            self.db.finish_ingest_job(job_id, "failed", str(e))
+            increment("ingest_jobs_total", status="failed")
+        finally:
+            self.cancel_events.pop(job_id, None)
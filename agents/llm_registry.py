@@ -0,0 +1,417 @@
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+import weakref
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+import httpx
+import openai
+from langchain_community.chat_models import ChatOpenAI
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+from utils.metrics import increment
+
+# Keep-alive connections per (base URL, key) pool
+LLM_POOL_CONNECTIONS = int(os.getenv("LLM_POOL_CONNECTIONS", "32"))
+DEFAULT_PROVIDER_CONFIG = {
+    "base_url": None,
+    "api_key": None,
+    # Read the key from this environment variable instead of storing it in the config
+    "api_key_env": None,
+    "model": None,
+    "temperature": 0.7,
+    # In-flight requests allowed per provider, across threads and event loops
+    "max_concurrency": 8,
+    "timeout": 60.0,
+    "connect_timeout": 5.0,
+    # Retries of transient failures (429, 408, 5xx, timeouts, connection errors)
+    "max_retries": 3,
+    "backoff_base": 0.5,
+    "backoff_max": 20.0,
+    # Provider name (or list of names) tried once this provider's retries are exhausted
+    "fallback": None,
+}
+RETRYABLE_STATUS = (408, 409, 429)
+
+
+def builtin_providers() -> Dict[str, dict]:
+    return {
+        "deepseek": {"base_url": os.getenv("OPEN_API_BASE"), "api_key_env": "OPEN_API_KEY", "model": "deepseek-chat"},
+    }
+
+
+def load_provider_configs() -> Dict[str, dict]:
+    # LLM_PROVIDERS is a JSON object of provider name -> settings (see DEFAULT_PROVIDER_CONFIG),
+    # merged over the built-in providers; LLM_PROVIDERS_FILE may hold the same JSON. Both are
+    # read on first use rather than at import, so values from .env apply.
+    configs = builtin_providers()
+    overrides = {}
+    if os.getenv("LLM_PROVIDERS_FILE"):
+        with open(os.getenv("LLM_PROVIDERS_FILE"), encoding="utf-8") as f:
+            overrides.update(json.load(f))
+    if os.getenv("LLM_PROVIDERS"):
+        overrides.update(json.loads(os.getenv("LLM_PROVIDERS")))
+    for name, config in overrides.items():
+        configs[name] = {**configs.get(name, {}), **config}
+    return configs
+
+
+def resolve_provider(config: dict) -> dict:
+    resolved = dict(DEFAULT_PROVIDER_CONFIG)
+    resolved.update({key: value for key, value in config.items() if value is not None})
+    if resolved["api_key_env"] and not resolved["api_key"]:
+        resolved["api_key"] = os.getenv(resolved["api_key_env"])
+    if not resolved["model"]:
+        raise ValueError("LLM provider config needs a model")
+    return resolved
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in RETRYABLE_STATUS or error.status_code >= 500
+    return isinstance(error, (httpx.TimeoutException, httpx.TransportError))
+
+
+def retry_delay(error: Exception, attempt: int, config: dict) -> float:
+    # Honor Retry-After when the server sends one, otherwise exponential backoff with full jitter
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            return min(config["backoff_max"], float(retry_after))
+        except ValueError:
+            pass
+    return random.uniform(0, min(config["backoff_max"], config["backoff_base"] * 2 ** attempt))
+
+
+# Shares one pooled HTTP client per (base URL, key) between every agent that uses a provider,
+# and enforces the provider's concurrency cap, retries and fallbacks.
+# Caps in-flight calls to one provider across threads and event loops. Threads block on a
+# condition; coroutines await a future that release() resolves with the freed permit, so
+# waiting never polls or holds a thread.
+class ConcurrencyLimit:
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        self._cond = threading.Condition()
+        self._waiters = deque()  # (loop, future) of waiting coroutines, oldest first
+
+    def __enter__(self):
+        with self._cond:
+            while self.active >= self.limit:
+                self._cond.wait()
+            self.active += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    async def acquire_async(self):
+        loop = asyncio.get_running_loop()
+        with self._cond:
+            if self.active < self.limit:
+                self.active += 1
+                return
+            waiter = (loop, loop.create_future())
+            self._waiters.append(waiter)
+        try:
+            await waiter[1]
+        except asyncio.CancelledError:
+            with self._cond:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                    raise
+            # The permit was handed over already (or is on its way, see _grant); pass it on
+            if waiter[1].done() and not waiter[1].cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        with self._cond:
+            # The permit goes straight to the oldest waiting coroutine, else back to the pool
+            while self._waiters:
+                loop, future = self._waiters.popleft()
+                try:
+                    loop.call_soon_threadsafe(self._grant, future)
+                    return
+                except RuntimeError:
+                    continue  # its event loop has closed
+            self.active -= 1
+            self._cond.notify()
+
+    def _grant(self, future: asyncio.Future):
+        if future.cancelled():
+            self.release()
+        else:
+            future.set_result(None)
+
+
+class LLMRegistry:
+    def __init__(self):
+        self._configs: Optional[Dict[str, dict]] = None
+        self._lock = threading.RLock()
+        self._sync_clients: Dict[Tuple[str, str], openai.OpenAI] = {}
+        self._async_clients = weakref.WeakKeyDictionary()  # event loop -> {(base URL, key): AsyncOpenAI}
+        self._models: Dict[str, ChatOpenAI] = {}
+        self._async_models = weakref.WeakKeyDictionary()  # event loop -> {provider: ChatOpenAI}
+        self._concurrency: Dict[str, ConcurrencyLimit] = {}
+        self._chat_models: Dict[str, "PooledChatModel"] = {}
+
+    def configs(self) -> Dict[str, dict]:
+        # Loaded on first use, after load_dotenv() has run
+        with self._lock:
+            if self._configs is None:
+                self._configs = {name: resolve_provider(config) for name, config in load_provider_configs().items()}
+            return self._configs
+
+    def config(self, name: str) -> dict:
+        config = self.configs().get(name)
+        if config is None:
+            raise ValueError(f"Unsupported LLM: {name}")
+        return config
+
+    def register_provider(self, name: str, config: dict):
+        with self._lock:
+            self.configs()[name] = resolve_provider(config)
+            self._models.pop(name, None)
+            self._concurrency.pop(name, None)
+            for models in self._async_models.values():
+                models.pop(name, None)
+
+    def chat_model(self, name: str) -> "PooledChatModel":
+        self.config(name)
+        with self._lock:
+            model = self._chat_models.get(name)
+            if model is None:
+                model = self._chat_models[name] = PooledChatModel(provider=name)
+            return model
+
+    def fallback_chain(self, name: str) -> List[str]:
+        chain, pending = [], [name]
+        while pending:
+            current = pending.pop(0)
+            if current in chain:
+                continue
+            chain.append(current)
+            fallback = self.config(current)["fallback"]
+            pending.extend([fallback] if isinstance(fallback, str) else fallback or [])
+        return chain
+
+    def concurrency(self, name: str) -> ConcurrencyLimit:
+        with self._lock:
+            limit = self._concurrency.get(name)
+            if limit is None:
+                limit = self._concurrency[name] = ConcurrencyLimit(self.config(name)["max_concurrency"])
+            return limit
+
+    @staticmethod
+    def _client_key(config: dict) -> Tuple[str, str]:
+        return config["base_url"] or "", config["api_key"] or ""
+
+    @staticmethod
+    def _timeout(config: dict) -> httpx.Timeout:
+        return httpx.Timeout(config["timeout"], connect=config["connect_timeout"])
+
+    def _limits(self) -> httpx.Limits:
+        return httpx.Limits(max_connections=LLM_POOL_CONNECTIONS, max_keepalive_connections=LLM_POOL_CONNECTIONS)
+
+    def _build_model(self, name: str, client: openai.OpenAI,
+                     async_client: Optional[openai.AsyncOpenAI] = None) -> ChatOpenAI:
+        config = self.config(name)
+        # Per-provider timeout on top of the shared pool; retries are ours, not the SDK's
+        client = client.with_options(timeout=self._timeout(config), max_retries=0)
+        kwargs = {}
+        if async_client is not None:
+            async_client = async_client.with_options(timeout=self._timeout(config), max_retries=0)
+            kwargs["async_client"] = async_client.chat.completions
+        return ChatOpenAI(
+            model=config["model"],
+            openai_api_base=config["base_url"],
+            openai_api_key=config["api_key"] or "unused",
+            temperature=config["temperature"],
+            max_retries=0,
+            client=client.chat.completions,
+            **kwargs,
+        )
+
+    def _sync_client(self, config: dict) -> openai.OpenAI:
+        key = self._client_key(config)
+        client = self._sync_clients.get(key)
+        if client is None:
+            client = self._sync_clients[key] = openai.OpenAI(
+                base_url=config["base_url"], api_key=config["api_key"] or "unused", max_retries=0,
+                http_client=openai.DefaultHttpxClient(limits=self._limits(), timeout=self._timeout(config)),
+            )
+        return client
+
+    def model(self, name: str) -> ChatOpenAI:
+        with self._lock:
+            model = self._models.get(name)
+            if model is None:
+                model = self._models[name] = self._build_model(name, self._sync_client(self.config(name)))
+            return model
+
+    def async_model(self, name: str) -> ChatOpenAI:
+        # httpx async pools belong to the event loop that opened them
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            models = self._async_models.setdefault(loop, {})
+            model = models.get(name)
+            if model is None:
+                config = self.config(name)
+                clients = self._async_clients.setdefault(loop, {})
+                key = self._client_key(config)
+                if key not in clients:
+                    clients[key] = openai.AsyncOpenAI(
+                        base_url=config["base_url"], api_key=config["api_key"] or "unused", max_retries=0,
+                        http_client=openai.DefaultAsyncHttpxClient(limits=self._limits(), timeout=self._timeout(config)),
+                    )
+                model = models[name] = self._build_model(name, self._sync_client(config), clients[key])
+            return model
+
+    def _give_up(self, name: str, attempt: int, error: Exception) -> bool:
+        if not is_retryable(error) or attempt >= self.config(name)["max_retries"]:
+            return True
+        increment("llm_retries_total", provider=name, error=type(error).__name__)
+        return False
+
+    def _next_provider(self, name: str, chain: List[str], error: Exception):
+        if name != chain[-1]:
+            print(f"[WARN] LLM provider {name} failed ({type(error).__name__}: {error}); falling back")
+            increment("llm_fallbacks_total", provider=name)
+
+    def call(self, name: str, fn: Callable[[ChatOpenAI], Any]) -> Any:
+        chain = self.fallback_chain(name)
+        for provider in chain:
+            attempt = 0
+            while True:
+                try:
+                    with self.concurrency(provider):
+                        return fn(self.model(provider))
+                except Exception as e:
+                    if self._give_up(provider, attempt, e):
+                        if provider == chain[-1]:
+                            raise
+                        self._next_provider(provider, chain, e)
+                        break
+                    time.sleep(retry_delay(e, attempt, self.config(provider)))
+                    attempt += 1
+
+    async def acall(self, name: str, fn: Callable[[ChatOpenAI], Any]) -> Any:
+        chain = self.fallback_chain(name)
+        for provider in chain:
+            attempt = 0
+            while True:
+                limit = self.concurrency(provider)
+                await limit.acquire_async()
+                try:
+                    return await fn(self.async_model(provider))
+                except Exception as e:
+                    if self._give_up(provider, attempt, e):
+                        if provider == chain[-1]:
+                            raise
+                        self._next_provider(provider, chain, e)
+                        break
+                    delay = retry_delay(e, attempt, self.config(provider))
+                finally:
+                    limit.release()
+                await asyncio.sleep(delay)
+                attempt += 1
+
+    def stream(self, name: str, fn: Callable[[ChatOpenAI], Iterator]) -> Iterator:
+        # A stream is only retried or handed to a fallback before its first chunk
+        chain = self.fallback_chain(name)
+        for provider in chain:
+            attempt = 0
+            while True:
+                started = False
+                try:
+                    with self.concurrency(provider):
+                        for chunk in fn(self.model(provider)):
+                            started = True
+                            yield chunk
+                    return
+                except Exception as e:
+                    if started:
+                        raise
+                    if self._give_up(provider, attempt, e):
+                        if provider == chain[-1]:
+                            raise
+                        self._next_provider(provider, chain, e)
+                        break
+                    time.sleep(retry_delay(e, attempt, self.config(provider)))
+                    attempt += 1
+
+    async def astream(self, name: str, fn: Callable[[ChatOpenAI], AsyncIterator]) -> AsyncIterator:
+        chain = self.fallback_chain(name)
+        for provider in chain:
+            attempt = 0
+            while True:
+                started = False
+                limit = self.concurrency(provider)
+                await limit.acquire_async()
+                try:
+                    async for chunk in fn(self.async_model(provider)):
+                        started = True
+                        yield chunk
+                    return
+                except Exception as e:
+                    if started:
+                        raise
+                    if self._give_up(provider, attempt, e):
+                        if provider == chain[-1]:
+                            raise
+                        self._next_provider(provider, chain, e)
+                        break
+                    delay = retry_delay(e, attempt, self.config(provider))
+                finally:
+                    limit.release()
+                await asyncio.sleep(delay)
+                attempt += 1
+
+
+# Chat model handed to agents; every call is routed through the registry
+class PooledChatModel(BaseChatModel):
+    provider: str
+
+    @property
+    def _llm_type(self) -> str:
+        return "pooled-openai"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"provider": self.provider, "model": _registry.config(self.provider)["model"]}
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        return _registry.call(self.provider, lambda model: model._generate(messages, stop=stop, **kwargs))
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        return await _registry.acall(self.provider, lambda model: model._agenerate(messages, stop=stop, **kwargs))
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        for chunk in _registry.stream(self.provider, lambda model: model._stream(messages, stop=stop, **kwargs)):
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        async for chunk in _registry.astream(self.provider, lambda model: model._astream(messages, stop=stop, **kwargs)):
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+
+_registry = LLMRegistry()
+
+
+def get_llm_registry() -> LLMRegistry:
+    return _registry
+
+
+def get_chat_model(name: str) -> PooledChatModel:
+    return _registry.chat_model(name)
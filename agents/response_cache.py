@@ -0,0 +1,159 @@
+import hashlib
+import os
+import threading
+import time
+from typing import Optional
+import numpy as np
+from utils.helpers import sqlite_connect
+
+RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH", "response_cache.db")
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", str(7 * 24 * 3600)))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "20000"))
+# Cosine similarity needed to reuse the answer to a differently worded question; unset disables it
+RESPONSE_CACHE_SIMILARITY = os.getenv("RESPONSE_CACHE_SIMILARITY")
+
+
+def normalize_input(text: str) -> str:
+    return " ".join(text.lower().split()).strip(" ?!.")
+
+
+def _sha256(*parts: str) -> str:
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, db_path: str = RESPONSE_CACHE_PATH, ttl: Optional[float] = RESPONSE_CACHE_TTL,
+                 max_entries: int = RESPONSE_CACHE_MAX_ENTRIES, similarity_threshold: Optional[float] = None,
+                 embedder=None):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        if similarity_threshold is None and RESPONSE_CACHE_SIMILARITY:
+            similarity_threshold = float(RESPONSE_CACHE_SIMILARITY)
+        self.similarity_threshold = similarity_threshold
+        self._embedder = embedder
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self._lock = threading.Lock()
+        self.conn = sqlite_connect(db_path, shared=True)
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                agent_name TEXT,
+                scope TEXT,
+                input_norm TEXT,
+                response TEXT,
+                embedding BLOB,
+                latency REAL,
+                created REAL,
+                last_access REAL
+            )
+        ''')
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_scope ON responses(scope)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_agent ON responses(agent_name)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access)")
+        self.conn.commit()
+
+    @property
+    def embedder(self):
+        if self._embedder is None:
+            from kb.embeddings import get_embedder
+            self._embedder = get_embedder()
+        return self._embedder
+
+    @staticmethod
+    def scope_key(agent_name: str, base_prompt: str, llm_choice: str, context: Optional[str]) -> str:
+        # Everything except the question itself: a prompt edit or different context is a new scope
+        return _sha256(agent_name, base_prompt, llm_choice, context or "")
+
+    def _cutoff(self, now: float) -> float:
+        return now - self.ttl if self.ttl is not None else float("-inf")
+
+    def _embed(self, input_norm: str) -> np.ndarray:
+        vector = np.asarray(self.embedder.embed_query(input_norm), dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def lookup(self, agent_name: str, base_prompt: str, llm_choice: str, user_input: str,
+               context: Optional[str] = None) -> Optional[str]:
+        scope = self.scope_key(agent_name, base_prompt, llm_choice, context)
+        input_norm = normalize_input(user_input)
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT key, response, latency FROM responses WHERE key = ? AND created >= ?",
+                (_sha256(scope, input_norm), self._cutoff(now))
+            ).fetchone()
+        if row is None and self.similarity_threshold is not None:
+            row = self._lookup_similar(scope, input_norm, now)
+            if row is not None:
+                with self._lock:
+                    self.near_hits += 1
+        if row is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        key, response, latency = row
+        with self._lock:
+            self.conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self.conn.commit()
+            self.hits += 1
+            self.saved_seconds += latency or 0.0
+        return response
+
+    def _lookup_similar(self, scope: str, input_norm: str, now: float):
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT key, response, latency, embedding FROM responses "
+                "WHERE scope = ? AND created >= ? AND embedding IS NOT NULL",
+                (scope, self._cutoff(now))
+            ).fetchall()
+        if not rows:
+            return None
+        matrix = np.frombuffer(b"".join(row[3] for row in rows), dtype=np.float32).reshape(len(rows), -1)
+        scores = matrix @ self._embed(input_norm)
+        best = int(np.argmax(scores))
+        if scores[best] < self.similarity_threshold:
+            return None
+        return rows[best][:3]
+
+    def store(self, agent_name: str, base_prompt: str, llm_choice: str, user_input: str,
+              context: Optional[str], response: str, latency: float):
+        scope = self.scope_key(agent_name, base_prompt, llm_choice, context)
+        input_norm = normalize_input(user_input)
+        embedding = self._embed(input_norm).tobytes() if self.similarity_threshold is not None else None
+        now = time.time()
+        with self._lock:
+            self.conn.execute(
+                "REPLACE INTO responses (key, agent_name, scope, input_norm, response, embedding, latency, created, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (_sha256(scope, input_norm), agent_name, scope, input_norm, response, embedding, latency, now, now)
+            )
+            self._evict(now)
+            self.conn.commit()
+
+    def _evict(self, now: float):
+        self.conn.execute("DELETE FROM responses WHERE created < ?", (self._cutoff(now),))
+        count = self.conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        if count > self.max_entries:
+            self.conn.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY last_access ASC LIMIT ?)",
+                (count - self.max_entries,)
+            )
+
+    def invalidate(self, agent_name: str):
+        with self._lock:
+            self.conn.execute("DELETE FROM responses WHERE agent_name = ?", (agent_name,))
+            self.conn.commit()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "saved_seconds": round(self.saved_seconds, 3),
+        }
@@ -0,0 +1,80 @@
+import os
+import random
+from typing import List
+
+# Files per corpus size; each file is roughly FILE_WORDS words
+CORPUS_SIZES = {"small": 20, "medium": 100, "large": 400}
+FILE_WORDS = 800
+PDF_LINES_PER_PAGE = 50
+PDF_LINE_WORDS = 12
+_SYLLABLES = ["ka", "lo", "mi", "ne", "ru", "sa", "ti", "vo", "zen", "dra", "pho", "lux", "tor", "qui", "ber"]
+
+
+def _vocabulary(rng: random.Random, size: int = 2000) -> List[str]:
+    return ["".join(rng.choice(_SYLLABLES) for _ in range(rng.randint(1, 4))) for _ in range(size)]
+
+
+def _sentences(rng: random.Random, vocabulary: List[str], n_words: int) -> List[str]:
+    words = []
+    while len(words) < n_words:
+        sentence = rng.choices(vocabulary, k=rng.randint(6, 18))
+        words.extend(sentence[:-1] + [sentence[-1] + "."])
+    return words[:n_words]
+
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path: str, pages: List[List[str]]):
+    # Minimal single-font PDF, one text stream per page, readable by PyPDFLoader
+    objects = {1: b"<< /Type /Catalog /Pages 2 0 R >>",
+               3: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"}
+    page_ids = []
+    for lines in pages:
+        content_id, page_id = len(objects) + 2, len(objects) + 3
+        text = "".join(f"({_pdf_escape(line)}) '\n" for line in lines)
+        stream = f"BT /F1 10 Tf 12 TL 50 780 Td\n{text}ET".encode("latin-1")
+        objects[content_id] = b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream)
+        objects[page_id] = (b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id)
+        page_ids.append(page_id)
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+    objects[2] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode()
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = {}
+    for obj_id in sorted(objects):
+        offsets[obj_id] = len(out)
+        out += b"%d 0 obj\n%s\nendobj\n" % (obj_id, objects[obj_id])
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offsets[obj_id] for obj_id in sorted(objects))
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def build_corpus(directory: str, n_files: int, fmt: str = "txt", seed: int = 0) -> List[str]:
+    # Deterministic for a given seed, so runs are comparable across commits
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(seed)
+    vocabulary = _vocabulary(rng)
+    paths = []
+    for i in range(n_files):
+        words = _sentences(rng, vocabulary, FILE_WORDS)
+        path = os.path.join(directory, f"doc_{i:04d}.{fmt}")
+        if fmt == "pdf":
+            lines = [" ".join(words[j:j + PDF_LINE_WORDS]) for j in range(0, len(words), PDF_LINE_WORDS)]
+            write_pdf(path, [lines[j:j + PDF_LINES_PER_PAGE] for j in range(0, len(lines), PDF_LINES_PER_PAGE)])
+        else:
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("\n\n".join(" ".join(words[j:j + 60]) for j in range(0, len(words), 60)))
+        paths.append(path)
+    return paths
+
+
+def sample_queries(n: int, seed: int = 1) -> List[str]:
+    rng = random.Random(seed)
+    vocabulary = _vocabulary(random.Random(0))
+    return [" ".join(rng.choices(vocabulary, k=rng.randint(3, 8))) for _ in range(n)]
@@ -0,0 +1,20 @@
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+FAKE_LLM = "fake"
+FAKE_EMBEDDING_MODEL = "fake-embedding"
+FAKE_EMBEDDING_DIM = 384  # same as all-MiniLM-L6-v2, so index sizes are representative
+FAKE_REPLY = ("The answer follows from the definitions in the course notes: apply the rule to each term, "
+              "then simplify. {\"question\": \"What is the rule?\", \"answer\": \"It applies termwise.\", "
+              "\"score\": 0.8, \"feedback\": \"Mostly correct.\"}")
+BENCH_PROMPT = "Context:\n{context}\n\nQuestion: {input}\nAnswer:"
+
+
+def install_fakes():
+    # Deterministic stand-ins for ChatOpenAI and the sentence-transformer, so runs are
+    # offline and measure only this app's own overhead. The app modules are imported here so
+    # that callers can set EMBEDDING_MODEL first.
+    from agents.agent_manager import register_llm
+    from kb.embeddings import register_embeddings
+    register_llm(FAKE_LLM, lambda: FakeListChatModel(responses=[FAKE_REPLY]))
+    register_embeddings(FAKE_EMBEDDING_MODEL, DeterministicFakeEmbedding(size=FAKE_EMBEDDING_DIM))
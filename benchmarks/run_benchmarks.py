@@ -0,0 +1,305 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Callable, Dict, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+# A metric is flagged when it is this much worse than the baseline. Back-to-back runs on one
+# machine drift by up to ~20% on throughput, so anything tighter mostly reports noise.
+REGRESSION_THRESHOLD = 0.3
+# Tail percentiles and timings this small vary by 50% or more between identical runs; they
+# are printed but never flagged
+NOISY_SUFFIXES = (".p99_ms",)
+NOISE_FLOOR = {"ms": 1.0, "us": 1000.0, "s": 0.05}
+QUERY_SAMPLES = 200
+CHAT_SAMPLES = 100
+HISTORY_MILESTONES = [1000, 10000, 50000]
+QUICK_HISTORY_MILESTONES = [1000, 5000]
+# LLM client layer, against the local stub server
+LLM_CONCURRENCY = 8
+LLM_BURST = 100
+
+VERBOSE = False
+
+
+def quiet(fn: Callable, *args, **kwargs):
+    if VERBOSE:
+        return fn(*args, **kwargs)
+    with contextlib.redirect_stdout(io.StringIO()):
+        return fn(*args, **kwargs)
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+def timed(fn: Callable, *args, **kwargs) -> float:
+    started = time.perf_counter()
+    quiet(fn, *args, **kwargs)
+    return time.perf_counter() - started
+
+
+class Results:
+    def __init__(self):
+        self.metrics: Dict[str, dict] = {}
+        # Context for reading the metrics (corpus and index sizes); not compared
+        self.info: Dict[str, object] = {}
+
+    def record(self, name: str, value: float, unit: str, higher_is_better: bool):
+        self.metrics[name] = {"value": round(value, 4), "unit": unit, "higher_is_better": higher_is_better}
+        print(f"  {name:<48} {value:>12.3f} {unit}")
+
+    def latencies(self, name: str, seconds: List[float]):
+        self.record(f"{name}.p50_ms", 1000 * percentile(seconds, 50), "ms", False)
+        self.record(f"{name}.p99_ms", 1000 * percentile(seconds, 99), "ms", False)
+
+
+def bench_ingestion(results: Results, sizes: List[str], formats: List[str], workers: int):
+    from benchmarks.corpus import CORPUS_SIZES, build_corpus
+    from kb.knowledge_base import KnowledgeBase
+
+    print("Ingestion")
+    for fmt in formats:
+        for size in sizes:
+            paths = build_corpus(os.path.join("corpora", f"{fmt}_{size}"), CORPUS_SIZES[size], fmt)
+            megabytes = sum(os.path.getsize(path) for path in paths) / 1e6
+            kb = KnowledgeBase(agent_name=f"bench_{fmt}_{size}")
+            stats = quiet(kb.ingest_docs, paths, workers=workers)
+            prefix = f"ingest.{fmt}.{size}"
+            results.record(f"{prefix}.files_per_sec", stats["files_per_sec"], "files/s", True)
+            results.record(f"{prefix}.chunks_per_sec", stats["chunks_per_sec"], "chunks/s", True)
+            results.record(f"{prefix}.mb_per_sec", megabytes / stats["seconds"], "MB/s", True)
+            # Re-ingesting an unchanged corpus should only cost the manifest check
+            results.record(f"{prefix}.noop_seconds", timed(kb.ingest_docs, paths, workers=workers), "s", False)
+
+
+def bench_query(results: Results, sizes: List[str]):
+    from benchmarks.corpus import sample_queries
+    from kb.knowledge_base import KnowledgeBase
+
+    print("Retrieval")
+    queries = sample_queries(QUERY_SAMPLES)
+    for size in sizes:
+        kb = KnowledgeBase(agent_name=f"bench_txt_{size}", read_only=True)
+        n_vectors = kb.vectorstore.index.ntotal if kb.vectorstore else 0
+        kb.query("warm up")
+        prefix = f"query.{size}"
+        results.info[f"{prefix}.vectors"] = n_vectors
+        results.latencies(prefix, [timed(kb.query, query, 3) for query in queries])
+        # Same queries again: embeddings now come from the cache
+        results.latencies(f"{prefix}.cached", [timed(kb.query, query, 3) for query in queries])
+        batch_seconds = timed(kb.query_batch, sample_queries(QUERY_SAMPLES, seed=2), 3)
+        results.record(f"{prefix}.batch_queries_per_sec", QUERY_SAMPLES / batch_seconds, "queries/s", True)
+
+
+def bench_agents_and_chat(results: Results, size: str):
+    from agents.agent_manager import AgentManager
+    from benchmarks.fakes import BENCH_PROMPT, FAKE_LLM
+    from benchmarks.corpus import sample_queries
+    from chat.chat_handler import ChatHandler
+
+    print("Agents and chat")
+    os.makedirs("agents_data", exist_ok=True)
+    manager = quiet(AgentManager, agent_storage="agents_data")
+    # Reuses the index ingested for the retrieval benchmark
+    name = f"bench_txt_{size}"
+    manager.create_agent(name, BENCH_PROMPT, FAKE_LLM)
+
+    cold = []
+    for _ in range(5):
+        manager.agent_cache.invalidate(name)
+        cold.append(timed(manager.get_agent, name))
+    results.record("get_agent.cold_ms", 1000 * percentile(cold, 50), "ms", False)
+    warm = [timed(manager.get_agent, name) for _ in range(1000)]
+    results.record("get_agent.warm_us", 1e6 * percentile(warm, 50), "us", False)
+
+    handler = quiet(ChatHandler, manager.get_agent(name), db_path="bench_chat.db")
+    messages = sample_queries(CHAT_SAMPLES, seed=3)
+    results.latencies("chat.send_message", [timed(handler.send_message, message) for message in messages])
+    handler.store.close()
+
+
+def bench_persistence(results: Results, milestones: List[int]):
+    from chat.history_store import HistoryStore
+    from database.db_manager import DBManager
+
+    print("Persistence")
+    store = HistoryStore("bench_history.db")
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    count = 0
+    for milestone in milestones:
+        exchanges = (milestone - count) // 2
+        started = time.perf_counter()
+        for i in range(exchanges):
+            store.add_messages("bench", [("user", f"question {count + 2 * i}", timestamp),
+                                         ("agent", f"answer {count + 2 * i} " * 20, timestamp)])
+        results.record(f"history.{milestone}.write_msgs_per_sec",
+                       2 * exchanges / (time.perf_counter() - started), "msgs/s", True)
+        count = milestone
+        results.latencies(f"history.{milestone}.load_page", [timed(store.load_page, "bench") for _ in range(50)])
+        middle, _ = store.load_page("bench", limit=milestone // 2)
+        results.latencies(f"history.{milestone}.load_older_page",
+                          [timed(store.load_page, "bench", middle[0]) for _ in range(50)])
+    store.close()
+
+    db = DBManager("bench_app.db")
+    rows = [("bench", f"question {i}", f"answer {i}") for i in range(2000)]
+    started = time.perf_counter()
+    for row in rows[:200]:
+        db.save_chat(*row)
+    results.record("db.save_chat_per_sec", 200 / (time.perf_counter() - started), "rows/s", True)
+    results.record("db.save_chats_many_per_sec", len(rows) / timed(db.save_chats_many, rows), "rows/s", True)
+    db.close()
+
+
+def bench_llm_layer(results: Results):
+    from langchain_core.messages import HumanMessage
+    from agents.llm_registry import get_chat_model, get_llm_registry
+    from benchmarks.stub_openai_server import StubOpenAIServer
+
+    print("LLM client layer (stub server)")
+    # The primary fails 20% of requests, so retries and the fallback provider both get exercised
+    primary = StubOpenAIServer(latency=0.05, fail_rate=0.2)
+    backup = StubOpenAIServer(latency=0.05)
+    registry = get_llm_registry()
+    registry.register_provider("stub_backup", {"base_url": backup.start(), "api_key": "stub", "model": "stub-backup",
+                                               "max_concurrency": LLM_CONCURRENCY})
+    registry.register_provider("stub", {"base_url": primary.start(), "api_key": "stub", "model": "stub",
+                                        "max_concurrency": LLM_CONCURRENCY, "max_retries": 2, "backoff_base": 0.05,
+                                        "fallback": "stub_backup"})
+    model = get_chat_model("stub")
+    messages = [HumanMessage(content="ping")]
+    results.latencies("llm.invoke", [timed(model.invoke, messages) for _ in range(20)])
+
+    async def burst():
+        return await asyncio.gather(*(model.ainvoke(messages) for _ in range(LLM_BURST)), return_exceptions=True)
+
+    started = time.perf_counter()
+    replies = asyncio.run(burst())
+    elapsed = time.perf_counter() - started
+    results.record("llm.burst.requests_per_sec", LLM_BURST / elapsed, "req/s", True)
+    results.record("llm.burst.success_rate", sum(not isinstance(r, Exception) for r in replies) / LLM_BURST,
+                   "ratio", True)
+    results.info["llm.stub.primary"] = primary.stats()
+    results.info["llm.stub.backup"] = backup.stats()
+    primary.stop()
+    backup.stop()
+
+
+def is_noisy(name: str, metric: dict) -> bool:
+    floor = NOISE_FLOOR.get(metric["unit"])
+    return name.endswith(NOISY_SUFFIXES) or (floor is not None and metric["value"] < floor)
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> List[str]:
+    regressions = []
+    for key in ("cpu_count", "embedder"):
+        ours, theirs = results.get("meta", {}).get(key), baseline.get("meta", {}).get(key)
+        if ours != theirs:
+            print(f"[WARN] baseline {key} is {theirs}, this run's is {ours}; the numbers are not comparable")
+    print(f"\n{'metric':<48} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, metric in sorted(results["metrics"].items()):
+        base = baseline["metrics"].get(name)
+        if not base or not base["value"]:
+            continue
+        change = (metric["value"] - base["value"]) / abs(base["value"])
+        worse = -change if metric["higher_is_better"] else change
+        flag = ""
+        if is_noisy(name, base):
+            flag = "(noisy, not compared)"
+        elif worse > threshold:
+            flag = "REGRESSION"
+            regressions.append(name)
+        elif worse < -threshold:
+            flag = "improved"
+        print(f"{name:<48} {base['value']:>12.3f} {metric['value']:>12.3f} {change:>+8.1%} {flag}")
+    return regressions
+
+
+def run(args) -> dict:
+    if not args.real_embedder:
+        from benchmarks.fakes import FAKE_EMBEDDING_MODEL
+        os.environ["EMBEDDING_MODEL"] = FAKE_EMBEDDING_MODEL
+    # Imported after EMBEDDING_MODEL is set, since kb.embeddings reads it at import time
+    from benchmarks.fakes import install_fakes
+    install_fakes()
+
+    sizes = args.sizes.split(",")
+    results = Results()
+    bench_ingestion(results, sizes, args.formats.split(","), args.workers)
+    bench_query(results, sizes)
+    bench_agents_and_chat(results, sizes[0])
+    bench_persistence(results, QUICK_HISTORY_MILESTONES if args.quick else HISTORY_MILESTONES)
+    if args.llm_stub:
+        bench_llm_layer(results)
+    return {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "embedder": "real" if args.real_embedder else "fake",
+            "sizes": sizes,
+            **results.info,
+        },
+        "metrics": results.metrics,
+    }
+
+
+def main():
+    global VERBOSE
+    parser = argparse.ArgumentParser(description="Offline performance benchmarks")
+    parser.add_argument("--sizes", default="small,medium", help="comma-separated corpus sizes (small, medium, large)")
+    parser.add_argument("--formats", default="txt,pdf", help="comma-separated corpus formats (txt, pdf)")
+    parser.add_argument("--workers", type=int, default=None, help="ingestion worker processes")
+    parser.add_argument("--quick", action="store_true", help="smaller history sizes")
+    parser.add_argument("--llm-stub", action="store_true", help="also benchmark the LLM client layer")
+    parser.add_argument("--real-embedder", action="store_true", help="use EMBEDDING_MODEL instead of the fake")
+    parser.add_argument("--output", default="bench_results.json", help="where to write the results JSON")
+    parser.add_argument("--baseline", help="results JSON to compare against")
+    parser.add_argument("--results", help="compare this results JSON instead of running the benchmarks")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    parser.add_argument("--verbose", action="store_true", help="show the app's own log output")
+    args = parser.parse_args()
+    VERBOSE = args.verbose
+
+    if args.results:
+        with open(args.results) as f:
+            results = json.load(f)
+    else:
+        output = os.path.abspath(args.output)
+        cwd = os.getcwd()
+        # Indexes, caches and databases use relative paths, so everything lands in the temp dir
+        with tempfile.TemporaryDirectory(prefix="bench_", ignore_cleanup_errors=True) as workdir:
+            os.chdir(workdir)
+            try:
+                results = run(args)
+            finally:
+                os.chdir(cwd)
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+import argparse
+import asyncio
+import json
+import random
+import threading
+import time
+from typing import Optional
+from aiohttp import web
+
+STUB_REPLY = "This is a canned reply from the local OpenAI-compatible stub server."
+
+
+# Minimal OpenAI-compatible /v1/chat/completions endpoint with configurable latency and
+# failure injection, for exercising the LLM client layer (pooling, limits, retries, fallback)
+class StubOpenAIServer:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.05, fail_rate: float = 0.0,
+                 fail_status: int = 429, token_delay: float = 0.0, reply: str = STUB_REPLY, seed: Optional[int] = 0):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.fail_status = fail_status
+        self.token_delay = token_delay
+        self.reply = reply
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.failures = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.loop = None
+        self.runner = None
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self.handle_chat)
+        app.router.add_post("/chat/completions", self.handle_chat)
+        return app
+
+    def stats(self) -> dict:
+        return {"requests": self.requests, "failures": self.failures, "max_in_flight": self.max_in_flight}
+
+    async def handle_chat(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        self.requests += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+            if self.random.random() < self.fail_rate:
+                self.failures += 1
+                return web.json_response(
+                    {"error": {"message": "injected failure", "type": "stub_error", "code": self.fail_status}},
+                    status=self.fail_status,
+                )
+            completion_id = f"chatcmpl-stub-{self.requests}"
+            model = body.get("model", "stub")
+            if body.get("stream"):
+                return await self._stream(request, completion_id, model)
+            prompt_tokens = sum(len(str(m.get("content", "")).split()) for m in body.get("messages", []))
+            completion_tokens = len(self.reply.split())
+            return web.json_response({
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": self.reply},
+                             "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                          "total_tokens": prompt_tokens + completion_tokens},
+            })
+        finally:
+            self.in_flight -= 1
+
+    async def _stream(self, request: web.Request, completion_id: str, model: str) -> web.StreamResponse:
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+
+        async def send(delta: dict, finish_reason: Optional[str] = None):
+            chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                     "model": model, "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+
+        await send({"role": "assistant", "content": ""})
+        for i, word in enumerate(self.reply.split(" ")):
+            await send({"content": word if i == 0 else " " + word})
+            if self.token_delay:
+                await asyncio.sleep(self.token_delay)
+        await send({}, finish_reason="stop")
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    def start(self) -> str:
+        # Serves from a daemon thread with its own event loop; returns the base URL
+        ready = threading.Event()
+
+        def serve():
+            self.loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self.loop)
+            self.runner = web.AppRunner(self.app())
+            self.loop.run_until_complete(self.runner.setup())
+            self.loop.run_until_complete(web.TCPSite(self.runner, self.host, self.port).start())
+            self.port = self.runner.addresses[0][1]
+            ready.set()
+            self.loop.run_forever()
+            self.loop.run_until_complete(self.runner.cleanup())
+            self.loop.close()
+
+        threading.Thread(target=serve, name="stub-openai-server", daemon=True).start()
+        ready.wait()
+        return f"http://{self.host}:{self.port}/v1"
+
+    def stop(self):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible stub server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds before each response")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="fraction of requests that fail")
+    parser.add_argument("--fail-status", type=int, default=429)
+    parser.add_argument("--token-delay", type=float, default=0.0, help="seconds between streamed tokens")
+    args = parser.parse_args()
+    server = StubOpenAIServer(args.host, args.port, args.latency, args.fail_rate, args.fail_status, args.token_delay)
+    print(f"Stub OpenAI server on http://{args.host}:{args.port}/v1")
+    web.run_app(server.app(), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
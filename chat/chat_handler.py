@@ -1,80 +1,107 @@
 # chat/chat_handler.py
 
+import asyncio
 from datetime import datetime
-import sqlite3
-import uuid
-import os
+from functools import partial
+from typing import AsyncIterator, Iterator, List
+from chat.history_store import HistoryStore, HISTORY_PAGE_SIZE
+from chat.context_builder import ContextBuilder, CONTEXT_TOKEN_BUDGET
+from utils.helpers import count_tokens
+from utils.metrics import span
 
 class ChatHandler:
-    def __init__(self, agent, db_path="chat_history.db"):
+    def __init__(self, agent, db_path="chat_history.db", page_size=HISTORY_PAGE_SIZE,
+                 context_token_budget=CONTEXT_TOKEN_BUDGET, session_id=None, store=None):
         self.agent = agent
-        self.history = []  # In-memory cache
+        self.history = []  # Most recent page(s) of the conversation, oldest first
+        self.has_more_history = False
         self.db_path = db_path
-        self.agent_id = agent.name  # Assumes each agent has a unique name
-        self._init_db()
+        self.page_size = page_size
+        self.session_id = session_id
+        # Assumes each agent has a unique name; server sessions get their own history and summary
+        self.agent_id = agent.name if session_id is None else f"{agent.name}#{session_id}"
+        self.store = store or HistoryStore(db_path)
+        self.context_builder = ContextBuilder(self.store, self.agent_id, token_budget=context_token_budget)
+        self.last_prompt_tokens = 0
         self._load_history_from_db()
 
-    def _init_db(self):
-        os.makedirs(os.path.dirname(self.db_path), exist_ok=True) if os.path.dirname(self.db_path) else None
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS messages (
-                    id TEXT PRIMARY KEY,
-                    agent_id TEXT,
-                    role TEXT,
-                    content TEXT,
-                    timestamp TEXT
-                )
-            ''')
-            conn.commit()
-
     def _load_history_from_db(self):
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT id, role, content, timestamp FROM messages WHERE agent_id = ? ORDER BY timestamp ASC", (self.agent_id,))
-            rows = cursor.fetchall()
-            for msg_id, role, content, timestamp in rows:
-                self.history.append({
-                    "id": msg_id,
-                    "role": role,
-                    "content": content,
-                    "timestamp": timestamp
-                })
+        self.history, self.has_more_history = self.store.load_page(self.agent_id, limit=self.page_size)
+
+    def load_older_history(self, limit=None) -> List[dict]:
+        if not self.has_more_history:
+            return []
+        oldest = next((msg for msg in self.history if msg.get("seq") is not None), None)
+        older, self.has_more_history = self.store.load_page(self.agent_id, before=oldest, limit=limit or self.page_size)
+        # In place, so a streaming worker appending to the same list is unaffected
+        self.history[:0] = older
+        return older
 
-    def _save_message_to_db(self, role, content, timestamp):
-        msg_id = str(uuid.uuid4())
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO messages (id, agent_id, role, content, timestamp)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (msg_id, self.agent_id, role, content, timestamp))
-            conn.commit()
-        return msg_id
+    def _save_exchange(self, user_input, response, timestamp) -> List[dict]:
+        with span("chat.save", agent=self.agent_id):
+            return self.store.add_messages(self.agent_id, [
+                ("user", user_input, timestamp),
+                ("agent", response, timestamp),
+            ])
 
     def send_message(self, user_input):
+        with span("chat.send_message", agent=self.agent_id):
+            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            context = self._build_context(user_input)
+            response = self.agent.respond(user_input, context=context)
+            self.history.extend(self._save_exchange(user_input, response, timestamp))
+
+        return response
+
+    def _save_message(self, role, content, timestamp) -> dict:
+        with span("chat.save", agent=self.agent_id):
+            return self.store.add_messages(self.agent_id, [(role, content, timestamp)])[0]
+
+    def stream_message(self, user_input) -> Iterator[str]:
+        # The user message is saved before the LLM is called, so it is kept even if the stream
+        # fails or is abandoned; the returned generator (typically consumed on a worker thread)
+        # streams the reply and saves it once complete.
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        user_id = self._save_message_to_db("user", user_input, timestamp)
-        context = self._build_context()
-        response = self.agent.respond(user_input, context=context)
-        agent_id = self._save_message_to_db("agent", response, timestamp)
+        user_msg = self._save_message("user", user_input, timestamp)
+        self.history.append(user_msg)
+        return self._stream_response(user_msg)
 
-        self.history.append({"id": user_id, "role": "user", "content": user_input, "timestamp": timestamp})
-        self.history.append({"id": agent_id, "role": "agent", "content": response, "timestamp": timestamp})
+    def _stream_response(self, user_msg) -> Iterator[str]:
+        parts = []
+        # Built here rather than in stream_message: folding old turns may call the LLM
+        context = self._build_context(user_msg["content"], exclude=user_msg)
+        for token in self.agent.stream(user_msg["content"], context=context):
+            parts.append(token)
+            yield token
+        self.history.append(self._save_message("agent", "".join(parts), user_msg["timestamp"]))
 
-        return response
+    async def astream_message(self, user_input, executor=None) -> AsyncIterator[str]:
+        # Async counterpart of stream_message for the API server: SQLite and context work run in
+        # `executor`, the LLM stream on the event loop, so no thread is held while tokens arrive.
+        loop = asyncio.get_running_loop()
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        user_msg = await loop.run_in_executor(executor, self._save_message, "user", user_input, timestamp)
+        self.history.append(user_msg)
+        parts = []
+        context = await loop.run_in_executor(executor, partial(self._build_context, user_input, exclude=user_msg))
+        async for token in self.agent.astream(user_input, context=context, executor=executor):
+            parts.append(token)
+            yield token
+        saved = await loop.run_in_executor(executor, self._save_message, "agent", "".join(parts), timestamp)
+        self.history.append(saved)
 
-    def _build_context(self, window=3):
-        context_window = self.history[-2*window:] if window else self.history
-        return "\n".join([f"{msg['role'].capitalize()}: {msg['content']}" for msg in context_window])
+    def _build_context(self, user_input, exclude=None):
+        history = [msg for msg in self.history if msg is not exclude]
+        with span("chat.build_context", agent=self.agent_id):
+            context, context_tokens = self.context_builder.build(history, self.has_more_history, self.agent.summarize)
+        self.last_prompt_tokens = count_tokens(self.agent.base_prompt) + context_tokens + count_tokens(user_input)
+        return context
 
     def get_history(self):
         return self.history
 
     def clear_history(self):
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("DELETE FROM messages WHERE agent_id = ?", (self.agent_id,))
-            conn.commit()
-        self.history = []
\ No newline at end of file
+        self.store.clear(self.agent_id)
+        self.history = []
+        self.has_more_history = False
+        self.context_builder.reset()
\ No newline at end of file
@@ -0,0 +1,112 @@
+import os
+from typing import Callable, List, Optional, Tuple
+from chat.history_store import HistoryStore
+from utils.helpers import count_tokens
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+# When recent turns overflow the budget, they are folded down to this fraction of it, so the
+# next several turns fit again without another (blocking) summarization call
+CONTEXT_FOLD_TARGET = float(os.getenv("CONTEXT_FOLD_TARGET", "0.5"))
+# Upper bound on the transcript handed to a single summarization call
+FOLD_TOKEN_LIMIT = 4000
+FOLD_MESSAGE_LIMIT = 200
+
+
+def format_message(msg: dict) -> str:
+    return f"{msg['role'].capitalize()}: {msg['content']}"
+
+
+def _cursor_key(msg: dict) -> Tuple[str, int]:
+    return msg["timestamp"], msg["seq"]
+
+
+def _is_after(msg: dict, cursor: Optional[dict]) -> bool:
+    return cursor is None or _cursor_key(msg) > _cursor_key(cursor)
+
+
+# Fits recent turns into a token budget and folds turns that fall out of it into a
+# rolling per-agent summary. The summary is persisted, so it is only recomputed when
+# new turns leave the window, and then the window shrinks to fold_target of the budget.
+class ContextBuilder:
+    def __init__(self, store: HistoryStore, agent_id: str, token_budget: int = CONTEXT_TOKEN_BUDGET,
+                 fold_target: float = CONTEXT_FOLD_TARGET):
+        self.store = store
+        self.agent_id = agent_id
+        self.token_budget = token_budget
+        self.fold_target = fold_target
+        self._summary: Optional[Tuple[str, Optional[dict]]] = None
+
+    def _load_summary(self) -> Tuple[str, Optional[dict]]:
+        if self._summary is None:
+            self._summary = self.store.load_summary(self.agent_id)
+        return self._summary
+
+    def reset(self):
+        self._summary = ("", None)
+
+    def build(self, history: List[dict], has_more: bool,
+              summarize: Callable[[str, str], str]) -> Tuple[str, int]:
+        summary, until = self._load_summary()
+        summary_tokens = count_tokens(summary)
+        kept = self._recent(history, until, self.token_budget - summary_tokens)
+        if self._fallen_messages(history, has_more, until, kept):
+            window = self._recent(history, until, int(self.token_budget * self.fold_target) - summary_tokens)
+            folded = self._fold(summary, self._fallen_messages(history, has_more, until, window), summarize)
+            if folded[1] is not until:
+                (summary, until), kept = folded, window
+
+        lines = [f"Summary of earlier conversation: {summary}"] if summary else []
+        lines.extend(format_message(msg) for msg in kept)
+        context = "\n".join(lines)
+        return context, count_tokens(context)
+
+    @staticmethod
+    def _recent(history: List[dict], until: Optional[dict], budget: int) -> List[dict]:
+        # The newest unsummarized messages that fit in budget tokens (always at least one)
+        kept = []
+        for msg in reversed(history):
+            if msg.get("seq") is not None and not _is_after(msg, until):
+                break  # already folded into the summary
+            tokens = count_tokens(format_message(msg))
+            if kept and tokens > budget:
+                break
+            kept.append(msg)
+            budget -= tokens
+        kept.reverse()
+        return kept
+
+    def _fallen_messages(self, history: List[dict], has_more: bool, until: Optional[dict],
+                         kept: List[dict]) -> List[dict]:
+        saved = [msg for msg in history if msg.get("seq") is not None]
+        if not saved or (kept and kept[0].get("seq") is None):
+            return []
+        first_kept = kept[0] if kept else None
+        fallen = [
+            msg for msg in saved
+            if _is_after(msg, until) and (first_kept is None or _cursor_key(msg) < _cursor_key(first_kept))
+        ]
+        if has_more and _is_after(saved[0], until):
+            # Part of the unsummarized history was never paged into memory
+            fallen = self.store.load_range(self.agent_id, until, saved[0], FOLD_MESSAGE_LIMIT) + fallen
+        return fallen
+
+    def _fold(self, summary: str, fallen: List[dict],
+              summarize: Callable[[str, str], str]) -> Tuple[str, Optional[dict]]:
+        # Older turns beyond the fold limit are considered covered without being read
+        lines, tokens = [], 0
+        for msg in reversed(fallen):
+            line = format_message(msg)
+            tokens += count_tokens(line)
+            if lines and tokens > FOLD_TOKEN_LIMIT:
+                break
+            lines.append(line)
+        transcript = "\n".join(reversed(lines))
+        until = {"timestamp": fallen[-1]["timestamp"], "seq": fallen[-1]["seq"]}
+        try:
+            summary = summarize(summary, transcript)
+        except Exception as e:
+            print(f"[WARN] Failed to update conversation summary for {self.agent_id}: {e}")
+            return self._load_summary()
+        self.store.save_summary(self.agent_id, summary, until)
+        self._summary = (summary, until)
+        return self._summary
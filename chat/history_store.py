@@ -0,0 +1,108 @@
+import threading
+import uuid
+from typing import List, Optional, Tuple
+from utils.helpers import sqlite_connect
+from utils.metrics import span
+
+HISTORY_PAGE_SIZE = 50
+
+
+class HistoryStore:
+    def __init__(self, db_path="chat_history.db"):
+        self.db_path = db_path
+        # One long-lived connection, shared by the UI thread and streaming workers
+        self.conn = sqlite_connect(self.db_path, shared=True)
+        self._lock = threading.Lock()
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS messages (
+                id TEXT PRIMARY KEY,
+                agent_id TEXT,
+                role TEXT,
+                content TEXT,
+                timestamp TEXT
+            )
+        ''')
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_agent_ts ON messages(agent_id, timestamp)")
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS summaries (
+                agent_id TEXT PRIMARY KEY,
+                summary TEXT,
+                until_timestamp TEXT,
+                until_seq INTEGER
+            )
+        ''')
+        self.conn.commit()
+
+    def add_messages(self, agent_id: str, messages: List[Tuple[str, str, str]]) -> List[dict]:
+        # All (role, content, timestamp) rows are written in a single transaction
+        rows = [(str(uuid.uuid4()), agent_id, role, content, timestamp) for role, content, timestamp in messages]
+        saved = []
+        with span("db.write", op="add_messages"), self._lock, self.conn:
+            for row in rows:
+                cursor = self.conn.execute(
+                    "INSERT INTO messages (id, agent_id, role, content, timestamp) VALUES (?, ?, ?, ?, ?)", row
+                )
+                saved.append({"id": row[0], "role": row[2], "content": row[3], "timestamp": row[4],
+                              "seq": cursor.lastrowid})
+        return saved
+
+    def load_page(self, agent_id: str, before: Optional[dict] = None,
+                  limit: int = HISTORY_PAGE_SIZE) -> Tuple[List[dict], bool]:
+        # Newest `limit` messages older than `before`, returned oldest first. Messages of one
+        # exchange share a timestamp, so rowid breaks ties and doubles as the page cursor.
+        query = "SELECT id, role, content, timestamp, rowid FROM messages WHERE agent_id = ?"
+        params: list = [agent_id]
+        if before is not None:
+            query += " AND (timestamp < ? OR (timestamp = ? AND rowid < ?))"
+            params += [before["timestamp"], before["timestamp"], before["seq"]]
+        query += " ORDER BY timestamp DESC, rowid DESC LIMIT ?"
+        params.append(limit + 1)
+        with self._lock:
+            rows = self.conn.execute(query, params).fetchall()
+        has_more = len(rows) > limit
+        page = [
+            {"id": msg_id, "role": role, "content": content, "timestamp": timestamp, "seq": seq}
+            for msg_id, role, content, timestamp, seq in reversed(rows[:limit])
+        ]
+        return page, has_more
+
+    def load_range(self, agent_id: str, after: Optional[dict], before: dict, limit: int) -> List[dict]:
+        # Newest `limit` messages strictly between two cursors, oldest first
+        query = "SELECT id, role, content, timestamp, rowid FROM messages WHERE agent_id = ?"
+        params: list = [agent_id]
+        if after is not None:
+            query += " AND (timestamp > ? OR (timestamp = ? AND rowid > ?))"
+            params += [after["timestamp"], after["timestamp"], after["seq"]]
+        query += " AND (timestamp < ? OR (timestamp = ? AND rowid < ?)) ORDER BY timestamp DESC, rowid DESC LIMIT ?"
+        params += [before["timestamp"], before["timestamp"], before["seq"], limit]
+        with self._lock:
+            rows = self.conn.execute(query, params).fetchall()
+        return [
+            {"id": msg_id, "role": role, "content": content, "timestamp": timestamp, "seq": seq}
+            for msg_id, role, content, timestamp, seq in reversed(rows)
+        ]
+
+    def load_summary(self, agent_id: str) -> Tuple[str, Optional[dict]]:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT summary, until_timestamp, until_seq FROM summaries WHERE agent_id = ?", (agent_id,)
+            ).fetchone()
+        if row is None:
+            return "", None
+        return row[0], {"timestamp": row[1], "seq": row[2]}
+
+    def save_summary(self, agent_id: str, summary: str, until: dict):
+        with self._lock, self.conn:
+            self.conn.execute(
+                "REPLACE INTO summaries (agent_id, summary, until_timestamp, until_seq) VALUES (?, ?, ?, ?)",
+                (agent_id, summary, until["timestamp"], until["seq"])
+            )
+
+    def clear(self, agent_id: str):
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM messages WHERE agent_id = ?", (agent_id,))
+            self.conn.execute("DELETE FROM summaries WHERE agent_id = ?", (agent_id,))
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
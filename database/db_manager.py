@@ -1,13 +1,36 @@
+import json
 import sqlite3
-from typing import List, Dict, Tuple
+import threading
+from typing import Iterable, List, Dict, Optional, Tuple
 import os
+from utils.helpers import sqlite_connect
+from utils.metrics import span
 
 DB_PATH = "modular_chat_app.db"
 
 class DBManager:
-    def __init__(self):
-        self.conn = sqlite3.connect(DB_PATH)
+    def __init__(self, db_path: str = DB_PATH):
+        self.db_path = db_path
+        # sqlite3 connections cannot be shared across threads, so each thread gets its own
+        self._local = threading.local()
         self._create_tables()
+        self._migrate()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite_connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA temp_store=MEMORY")
+            conn.execute("PRAGMA cache_size=-16000")
+            self._local.conn = conn
+        return conn
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
 
     def _create_tables(self):
         cursor = self.conn.cursor()
@@ -40,14 +63,64 @@ class DBManager:
         ''')
         self.conn.commit()
 
+    # Schema migrations, applied in order and tracked with PRAGMA user_version
+    def _migrate(self):
+        migrations = [
+            self._migration_1_indexes,
+            self._migration_2_index_config,
+            self._migration_3_ingest_jobs,
+            self._migration_4_ingest_job_owner,
+        ]
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        for target, migration in enumerate(migrations[version:], start=version + 1):
+            with self.conn:
+                migration(self.conn)
+                self.conn.execute(f"PRAGMA user_version = {target}")
+
+    def _migration_1_indexes(self, conn: sqlite3.Connection):
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_chats_agent_ts ON chats(agent_name, timestamp)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_tests_agent_ts ON tests(agent_name, timestamp)")
+
+    def _migration_2_index_config(self, conn: sqlite3.Connection):
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS agent_index_config (
+                agent_name TEXT PRIMARY KEY,
+                config TEXT
+            )
+        ''')
+
+    def _migration_3_ingest_jobs(self, conn: sqlite3.Connection):
+        # status: queued -> running -> done | failed | cancelled; options and progress are JSON
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS ingest_jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                agent_name TEXT,
+                path TEXT,
+                options TEXT,
+                status TEXT,
+                cancel_requested INTEGER DEFAULT 0,
+                progress TEXT,
+                error TEXT,
+                owner_pid INTEGER,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_ingest_jobs_status ON ingest_jobs(status, id)")
+
+    def _migration_4_ingest_job_owner(self, conn: sqlite3.Connection):
+        # "<pid>:<process start time>" of the claiming process; unlike the pid alone it is never reused
+        conn.execute("ALTER TABLE ingest_jobs ADD COLUMN owner TEXT")
+
     # Agent methods
     def save_agent(self, name: str, base_prompt: str, llm_choice: str):
-        cursor = self.conn.cursor()
-        cursor.execute(
-            'REPLACE INTO agents (name, base_prompt, llm_choice) VALUES (?, ?, ?)',
-            (name, base_prompt, llm_choice)
-        )
-        self.conn.commit()
+        with span("db.write", op="save_agent"):
+            cursor = self.conn.cursor()
+            cursor.execute(
+                'REPLACE INTO agents (name, base_prompt, llm_choice) VALUES (?, ?, ?)',
+                (name, base_prompt, llm_choice)
+            )
+            self.conn.commit()
 
     def load_agent(self, name: str) -> Dict:
         cursor = self.conn.cursor()
@@ -64,18 +137,45 @@ class DBManager:
         return [row[0] for row in cursor.fetchall()]
 
     def delete_agent(self, name: str):
+        with span("db.write", op="delete_agent"):
+            cursor = self.conn.cursor()
+            cursor.execute('DELETE FROM agents WHERE name = ?', (name,))
+            cursor.execute('DELETE FROM agent_index_config WHERE agent_name = ?', (name,))
+            self.conn.commit()
+
+    # Index configuration (see kb.index_config for the keys)
+    def save_index_config(self, name: str, config: Dict):
+        with span("db.write", op="save_index_config"):
+            cursor = self.conn.cursor()
+            cursor.execute(
+                'REPLACE INTO agent_index_config (agent_name, config) VALUES (?, ?)',
+                (name, json.dumps(config))
+            )
+            self.conn.commit()
+
+    def load_index_config(self, name: str) -> Dict:
         cursor = self.conn.cursor()
-        cursor.execute('DELETE FROM agents WHERE name = ?', (name,))
-        self.conn.commit()
+        cursor.execute('SELECT config FROM agent_index_config WHERE agent_name = ?', (name,))
+        row = cursor.fetchone()
+        return json.loads(row[0]) if row else {}
 
     # Chat methods
     def save_chat(self, agent_name: str, user_msg: str, agent_response: str):
-        cursor = self.conn.cursor()
-        cursor.execute(
-            'INSERT INTO chats (agent_name, user_msg, agent_response) VALUES (?, ?, ?)',
-            (agent_name, user_msg, agent_response)
-        )
-        self.conn.commit()
+        with span("db.write", op="save_chat"):
+            cursor = self.conn.cursor()
+            cursor.execute(
+                'INSERT INTO chats (agent_name, user_msg, agent_response) VALUES (?, ?, ?)',
+                (agent_name, user_msg, agent_response)
+            )
+            self.conn.commit()
+
+    def save_chats_many(self, chats: Iterable[Tuple[str, str, str]]):
+        # (agent_name, user_msg, agent_response) rows, written in one transaction
+        with span("db.write", op="save_chats_many"), self.conn:
+            self.conn.executemany(
+                'INSERT INTO chats (agent_name, user_msg, agent_response) VALUES (?, ?, ?)',
+                chats
+            )
 
     def load_chat_history(self, agent_name: str) -> List[Tuple[str, str]]:
         cursor = self.conn.cursor()
@@ -86,18 +186,144 @@ class DBManager:
         return cursor.fetchall()
 
     # Test methods
-    def save_test_result(self, agent_name: str, subject: str, questions: str, answers: str, score: float):
+    def save_test_result(self, agent_name: str, subject: str, questions: str, answers: str,
+                         score: Optional[float]) -> int:
+        # One row per test: questions and answers are JSON lists (see test_engine), score the overall result
+        with span("db.write", op="save_test_result"):
+            cursor = self.conn.cursor()
+            cursor.execute(
+                'INSERT INTO tests (agent_name, subject, questions, answers, score) VALUES (?, ?, ?, ?, ?)',
+                (agent_name, subject, questions, answers, score)
+            )
+            self.conn.commit()
+            return cursor.lastrowid
+
+    def save_test_results_many(self, results: Iterable[Tuple[str, str, str, str, float]]):
+        # (agent_name, subject, questions, answers, score) rows, written in one transaction
+        with span("db.write", op="save_test_results_many"), self.conn:
+            self.conn.executemany(
+                'INSERT INTO tests (agent_name, subject, questions, answers, score) VALUES (?, ?, ?, ?, ?)',
+                results
+            )
+
+    def load_test_results(self, agent_name: str) -> List[Dict]:
         cursor = self.conn.cursor()
         cursor.execute(
-            'INSERT INTO tests (agent_name, subject, questions, answers, score) VALUES (?, ?, ?, ?, ?)',
-            (agent_name, subject, questions, answers, score)
+            'SELECT id, subject, questions, answers, score, timestamp FROM tests '
+            'WHERE agent_name = ? ORDER BY timestamp ASC, id ASC',
+            (agent_name,)
         )
-        self.conn.commit()
+        return [
+            {"id": row[0], "subject": row[1], "questions": json.loads(row[2] or "[]"),
+             "answers": json.loads(row[3] or "[]"), "score": row[4], "timestamp": row[5]}
+            for row in cursor.fetchall()
+        ]
 
     def update_agent_prompt(self, name: str, new_prompt: str):
-        cursor = self.conn.cursor()
-        cursor.execute(
-            'UPDATE agents SET base_prompt = ? WHERE name = ?',
-            (new_prompt, name)
-        )
-        self.conn.commit()
+        with span("db.write", op="update_agent_prompt"):
+            cursor = self.conn.cursor()
+            cursor.execute(
+                'UPDATE agents SET base_prompt = ? WHERE name = ?',
+                (new_prompt, name)
+            )
+            self.conn.commit()
+
+    # Ingestion job methods (see agents.ingest_queue)
+    def _job_row(self, row) -> Dict:
+        return {
+            "id": row[0], "agent_name": row[1], "path": row[2], "options": json.loads(row[3] or "{}"),
+            "status": row[4], "cancel_requested": bool(row[5]), "progress": json.loads(row[6] or "{}"),
+            "error": row[7], "owner_pid": row[8], "created_at": row[9], "updated_at": row[10], "owner": row[11],
+        }
+
+    def enqueue_ingest_job(self, agent_name: str, path: str, options: Dict) -> int:
+        with span("db.write", op="enqueue_ingest_job"):
+            cursor = self.conn.cursor()
+            cursor.execute(
+                "INSERT INTO ingest_jobs (agent_name, path, options, status) VALUES (?, ?, ?, 'queued')",
+                (agent_name, path, json.dumps(options))
+            )
+            self.conn.commit()
+            return cursor.lastrowid
+
+    def claim_ingest_job(self, owner: str, owner_pid: int) -> Optional[Dict]:
+        # Oldest queued job whose agent has no job running; jobs for one agent never overlap
+        with span("db.write", op="claim_ingest_job"):
+            while True:
+                row = self.conn.execute('''
+                    SELECT id FROM ingest_jobs
+                    WHERE status = 'queued' AND agent_name NOT IN (
+                        SELECT agent_name FROM ingest_jobs WHERE status = 'running'
+                    )
+                    ORDER BY id LIMIT 1
+                ''').fetchone()
+                if row is None:
+                    return None
+                cursor = self.conn.cursor()
+                cursor.execute(
+                    "UPDATE ingest_jobs SET status = 'running', owner = ?, owner_pid = ?, "
+                    "updated_at = CURRENT_TIMESTAMP WHERE id = ? AND status = 'queued'",
+                    (owner, owner_pid, row[0])
+                )
+                self.conn.commit()
+                # Another worker may have claimed it between the SELECT and the UPDATE
+                if cursor.rowcount:
+                    return self.load_ingest_job(row[0])
+
+    def update_ingest_progress(self, job_id: int, progress: Dict):
+        with span("db.write", op="update_ingest_progress"):
+            self.conn.execute(
+                "UPDATE ingest_jobs SET progress = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                (json.dumps(progress), job_id)
+            )
+            self.conn.commit()
+
+    def finish_ingest_job(self, job_id: int, status: str, error: Optional[str] = None):
+        with span("db.write", op="finish_ingest_job"):
+            self.conn.execute(
+                "UPDATE ingest_jobs SET status = ?, error = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                (status, error, job_id)
+            )
+            self.conn.commit()
+
+    def requeue_ingest_job(self, job_id: int):
+        # A cancel requested before the job stopped is honoured here rather than carried over,
+        # so a requeued job never starts out flagged
+        with span("db.write", op="requeue_ingest_job"):
+            self.conn.execute(
+                "UPDATE ingest_jobs SET status = CASE WHEN cancel_requested THEN 'cancelled' ELSE 'queued' END, "
+                "cancel_requested = 0, owner = NULL, owner_pid = NULL, updated_at = CURRENT_TIMESTAMP "
+                "WHERE id = ? AND status = 'running'",
+                (job_id,)
+            )
+            self.conn.commit()
+
+    def cancel_ingest_job(self, job_id: int) -> bool:
+        # Queued jobs are cancelled outright; running ones are flagged and stop at their next progress report
+        with span("db.write", op="cancel_ingest_job"):
+            cursor = self.conn.cursor()
+            cursor.execute(
+                "UPDATE ingest_jobs SET status = 'cancelled', updated_at = CURRENT_TIMESTAMP "
+                "WHERE id = ? AND status = 'queued'",
+                (job_id,)
+            )
+            if not cursor.rowcount:
+                cursor.execute(
+                    "UPDATE ingest_jobs SET cancel_requested = 1 WHERE id = ? AND status = 'running'", (job_id,)
+                )
+            self.conn.commit()
+            return cursor.rowcount > 0
+
+    def load_ingest_job(self, job_id: int) -> Optional[Dict]:
+        row = self.conn.execute("SELECT * FROM ingest_jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._job_row(row) if row else None
+
+    def list_ingest_jobs(self, agent_name: Optional[str] = None, active_only: bool = False) -> List[Dict]:
+        query = "SELECT * FROM ingest_jobs WHERE 1 = 1"
+        params = []
+        if agent_name is not None:
+            query += " AND agent_name = ?"
+            params.append(agent_name)
+        if active_only:
+            query += " AND status IN ('queued', 'running')"
+        return [self._job_row(row) for row in self.conn.execute(query + " ORDER BY id", params)]
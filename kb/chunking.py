@@ -0,0 +1,111 @@
+import hashlib
+import re
+from typing import Dict, List, Optional, Set, Tuple
+import numpy as np
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
+from kb.index_config import DEDUP_MODES
+from utils.helpers import count_tokens
+
+SIMHASH_BITS = 64
+# Words per shingle hashed into a SimHash fingerprint
+SHINGLE_SIZE = 3
+_WORD_PATTERN = re.compile(r"\w+")
+
+# [exact hash, SimHash] per chunk, as stored in the ingest manifest
+Fingerprint = List
+
+
+def chunking_settings(config: dict) -> dict:
+    # The index config keys that change what a chunk is; the index is rebuilt when they change
+    return {"chunk_tokens": config["chunk_tokens"], "chunk_overlap_tokens": config["chunk_overlap_tokens"]}
+
+
+def make_splitter(config: dict) -> RecursiveCharacterTextSplitter:
+    # Sized in tokens rather than characters, so chunks fit the embedding model's input window
+    return RecursiveCharacterTextSplitter(
+        chunk_size=config["chunk_tokens"], chunk_overlap=config["chunk_overlap_tokens"], length_function=count_tokens,
+    )
+
+
+def _words(text: str) -> List[str]:
+    return _WORD_PATTERN.findall(text.lower())
+
+
+def exact_hash(text: str) -> str:
+    # Case, punctuation and whitespace differences do not count
+    return hashlib.blake2b(" ".join(_words(text)).encode("utf-8"), digest_size=16).hexdigest()
+
+
+def simhash(text: str) -> int:
+    words = _words(text)
+    if not words:
+        return 0
+    shingles = [" ".join(words[i:i + SHINGLE_SIZE]) for i in range(max(1, len(words) - SHINGLE_SIZE + 1))]
+    hashes = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "little") for s in shingles),
+        dtype=np.uint64, count=len(shingles),
+    )
+    # Each output bit is the majority vote of that bit across all shingle hashes
+    bits = np.unpackbits(hashes.view(np.uint8).reshape(-1, 8), axis=1, bitorder="little")
+    majority = bits.sum(axis=0, dtype=np.int64) * 2 > len(shingles)
+    return int.from_bytes(np.packbits(majority, bitorder="little").tobytes(), "little")
+
+
+def fingerprint_chunks(chunks: List[Document]) -> List[Fingerprint]:
+    return [[exact_hash(chunk.page_content), simhash(chunk.page_content)] for chunk in chunks]
+
+
+# Drops chunks whose normalized text was already kept ("exact"), or whose SimHash is within
+# max_distance bits of a kept chunk ("near"). Near lookups are banded: two fingerprints that
+# differ in at most d bits agree exactly on at least one of d + 1 disjoint bit ranges.
+class ChunkDeduper:
+    def __init__(self, mode: str = "near", max_distance: int = 3):
+        if mode not in DEDUP_MODES:
+            raise ValueError(f"Unsupported dedup mode: {mode}")
+        self.mode = mode
+        self.max_distance = max_distance
+        self.exact: Dict[str, str] = {}  # exact hash -> file that owns the kept chunk
+        n_bands = max_distance + 1
+        self.bands = [(i * SIMHASH_BITS // n_bands, (i + 1) * SIMHASH_BITS // n_bands) for i in range(n_bands)]
+        self.buckets: Dict[Tuple[int, int], List[Tuple[int, str]]] = {}
+
+    def _band_keys(self, fingerprint: int):
+        for i, (start, end) in enumerate(self.bands):
+            yield i, (fingerprint >> start) & ((1 << (end - start)) - 1)
+
+    def add(self, fingerprint: Fingerprint, owner: str):
+        exact, near = fingerprint
+        self.exact.setdefault(exact, owner)
+        if self.mode == "near":
+            for key in self._band_keys(near):
+                self.buckets.setdefault(key, []).append((near, owner))
+
+    def find(self, fingerprint: Fingerprint) -> Optional[str]:
+        # The file holding an equivalent chunk, if any
+        exact, near = fingerprint
+        owner = self.exact.get(exact)
+        if owner is not None or self.mode != "near":
+            return owner
+        for key in self._band_keys(near):
+            for other, other_owner in self.buckets.get(key, ()):
+                if bin(other ^ near).count("1") <= self.max_distance:
+                    return other_owner
+        return None
+
+    def filter(self, owner: str, chunks: List[Document], fingerprints: List[Fingerprint]
+               ) -> Tuple[List[Document], List[Fingerprint], Set[str], int]:
+        # Returns the kept chunks and their fingerprints, the other files whose chunks the
+        # dropped ones duplicated, and the text bytes dropped
+        kept, kept_fingerprints, sources, dropped_bytes = [], [], set(), 0
+        for chunk, fingerprint in zip(chunks, fingerprints):
+            duplicate_of = self.find(fingerprint)
+            if duplicate_of is not None:
+                dropped_bytes += len(chunk.page_content.encode("utf-8"))
+                if duplicate_of != owner:
+                    sources.add(duplicate_of)
+                continue
+            self.add(fingerprint, owner)
+            kept.append(chunk)
+            kept_fingerprints.append(fingerprint)
+        return kept, kept_fingerprints, sources, dropped_bytes
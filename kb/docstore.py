@@ -0,0 +1,123 @@
+import json
+import threading
+from typing import Dict, Iterator, List, Mapping, Optional, Union
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_core.documents import Document
+from utils.helpers import sql_batches, sqlite_connect
+
+DOCSTORE_FILE = "docstore.sqlite"
+
+
+# Chunk text and metadata live in SQLite and are only read for the hits a query returns,
+# instead of unpickling the whole corpus when an index is opened.
+class SQLiteDocstore(Docstore, AddableMixin):
+    def __init__(self, path: str):
+        self.path = path
+        self.conn = sqlite_connect(path, shared=True)
+        self._lock = threading.RLock()
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS chunks (
+                doc_id TEXT PRIMARY KEY,
+                content TEXT,
+                metadata TEXT
+            )
+        ''')
+        # FAISS vector position -> chunk ID, rewritten whenever the index is saved
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS positions (
+                position INTEGER PRIMARY KEY,
+                doc_id TEXT
+            )
+        ''')
+        self.conn.commit()
+
+    def add(self, texts: Dict[str, Document]) -> None:
+        rows = [(doc_id, doc.page_content, json.dumps(doc.metadata)) for doc_id, doc in texts.items()]
+        with self._lock:
+            self.conn.executemany("INSERT INTO chunks (doc_id, content, metadata) VALUES (?, ?, ?)", rows)
+
+    def delete(self, ids: List) -> None:
+        with self._lock:
+            self.conn.executemany("DELETE FROM chunks WHERE doc_id = ?", [(doc_id,) for doc_id in ids])
+
+    def search(self, search: str) -> Union[str, Document]:
+        with self._lock:
+            row = self.conn.execute("SELECT content, metadata FROM chunks WHERE doc_id = ?", (search,)).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return Document(id=search, page_content=row[0], metadata=json.loads(row[1]))
+
+    def mget(self, ids: List[str]) -> List[Optional[Document]]:
+        found = {}
+        with self._lock:
+            for batch in sql_batches(ids):
+                placeholders = ",".join("?" * len(batch))
+                for doc_id, content, metadata in self.conn.execute(
+                    f"SELECT doc_id, content, metadata FROM chunks WHERE doc_id IN ({placeholders})", batch
+                ):
+                    found[doc_id] = Document(id=doc_id, page_content=content, metadata=json.loads(metadata))
+        return [found.get(doc_id) for doc_id in ids]
+
+    def __contains__(self, doc_id: str) -> bool:
+        with self._lock:
+            return self.conn.execute("SELECT 1 FROM chunks WHERE doc_id = ?", (doc_id,)).fetchone() is not None
+
+    def clear(self):
+        with self._lock:
+            self.conn.execute("DELETE FROM chunks")
+            self.conn.execute("DELETE FROM positions")
+
+    def save_positions(self, index_to_docstore_id: Mapping[int, str], start: int = 0):
+        # Positions below `start` are unchanged since the last save; commits the pending chunk writes too
+        rows = [(position, doc_id) for position, doc_id in index_to_docstore_id.items() if position >= start]
+        with self._lock:
+            self.conn.execute("DELETE FROM positions WHERE position >= ?", (start,))
+            self.conn.executemany("INSERT INTO positions (position, doc_id) VALUES (?, ?)", rows)
+            self.conn.commit()
+
+    def load_positions(self) -> Dict[int, str]:
+        with self._lock:
+            return dict(self.conn.execute("SELECT position, doc_id FROM positions"))
+
+    def rollback(self):
+        with self._lock:
+            self.conn.rollback()
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+# Read-only view of the position table for query-only knowledge bases, so opening an
+# index does not materialize one Python string per vector.
+class LazyPositionMap(Mapping):
+    def __init__(self, docstore: SQLiteDocstore):
+        self.docstore = docstore
+
+    def __getitem__(self, position: int) -> str:
+        with self.docstore._lock:
+            row = self.docstore.conn.execute(
+                "SELECT doc_id FROM positions WHERE position = ?", (int(position),)
+            ).fetchone()
+        if row is None:
+            raise KeyError(position)
+        return row[0]
+
+    def __iter__(self) -> Iterator[int]:
+        with self.docstore._lock:
+            positions = [row[0] for row in self.docstore.conn.execute("SELECT position FROM positions")]
+        return iter(positions)
+
+    def __len__(self) -> int:
+        with self.docstore._lock:
+            return self.docstore.conn.execute("SELECT COUNT(*) FROM positions").fetchone()[0]
+
+    def many(self, positions: List[int]) -> List[Optional[str]]:
+        found = {}
+        with self.docstore._lock:
+            for batch in sql_batches([int(position) for position in positions]):
+                placeholders = ",".join("?" * len(batch))
+                found.update(self.docstore.conn.execute(
+                    f"SELECT position, doc_id FROM positions WHERE position IN ({placeholders})", batch
+                ))
+        return [found.get(int(position)) for position in positions]
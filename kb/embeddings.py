@@ -0,0 +1,139 @@
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+from langchain_core.embeddings import Embeddings
+from kb.embedding_cache import CachedEmbeddings, get_embedding_cache
+
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+# cuda / cpu / mps; picked automatically when unset
+EMBEDDING_DEVICE = os.getenv("EMBEDDING_DEVICE")
+# torch | onnx | onnx-int8 (the ONNX backends need `optimum[onnxruntime]`)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+EMBEDDING_QUERY_BACKEND = os.getenv("EMBEDDING_QUERY_BACKEND", EMBEDDING_BACKEND)
+ONNX_QUANTIZED_FILE = "onnx/model_qint8_avx512_vnni.onnx"
+
+
+def detect_device() -> str:
+    if EMBEDDING_DEVICE:
+        return EMBEDDING_DEVICE
+    try:
+        import torch
+    except ImportError:
+        return "cpu"
+    if torch.cuda.is_available():
+        return "cuda"
+    if getattr(torch.backends, "mps", None) and torch.backends.mps.is_available():
+        return "mps"
+    return "cpu"
+
+
+def _model_kwargs(backend: str) -> dict:
+    if backend == "onnx":
+        return {"device": "cpu", "backend": "onnx"}
+    if backend == "onnx-int8":
+        return {"device": "cpu", "backend": "onnx", "model_kwargs": {"file_name": ONNX_QUANTIZED_FILE}}
+    return {"device": detect_device()}
+
+
+class LazyEmbeddings(Embeddings):
+    # Defers loading the sentence-transformer weights until the first embed call
+    def __init__(self, model_name: str, backend: str = "torch"):
+        self.model_name = model_name
+        self.backend = backend
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    def _load(self) -> Embeddings:
+        if self._model is not None:
+            return self._model
+        with self._lock:
+            if self._model is None:
+                from langchain_huggingface import HuggingFaceEmbeddings
+                try:
+                    self._model = HuggingFaceEmbeddings(
+                        model_name=self.model_name, model_kwargs=_model_kwargs(self.backend)
+                    )
+                except Exception as e:
+                    if self.backend == "torch":
+                        raise
+                    print(f"[WARN] {self.backend} backend unavailable for {self.model_name} ({e}); using torch")
+                    self.backend = "torch"
+                    self._model = HuggingFaceEmbeddings(
+                        model_name=self.model_name, model_kwargs=_model_kwargs("torch")
+                    )
+                print(f"Loaded embedding model {self.model_name} ({self.backend}, {_model_kwargs(self.backend)['device']})")
+        return self._model
+
+    def warm_up(self):
+        self._load()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._load().embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._load().embed_query(text)
+
+
+class SharedEmbeddings(Embeddings):
+    # Documents and queries may run on different backends (e.g. a quantized ONNX
+    # model for latency-sensitive queries); each keeps its own cache namespace.
+    def __init__(self, model_name: str, document_embedder: CachedEmbeddings, query_embedder: CachedEmbeddings):
+        self.model_name = model_name
+        self.document_embedder = document_embedder
+        self.query_embedder = query_embedder
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.document_embedder.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.query_embedder.embed_query(text)
+
+    def warm_up(self):
+        # Loads the query model now instead of on the first query
+        self.query_embedder.warm_up()
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        # Many queries in one batched forward pass on the query backend
+        return self.query_embedder.embed_documents(texts)
+
+
+_models: Dict[Tuple[str, str], LazyEmbeddings] = {}
+# Implementations registered under a model name (e.g. offline fakes for benchmarks/)
+_registered: Dict[str, Embeddings] = {}
+_embedders: Dict[Tuple[str, str, str], SharedEmbeddings] = {}
+_registry_lock = threading.Lock()
+
+
+def register_embeddings(model_name: str, embeddings: Embeddings):
+    with _registry_lock:
+        _registered[model_name] = embeddings
+        for key in [key for key in _embedders if key[0] == model_name]:
+            del _embedders[key]
+
+
+def _cached_model(model_name: str, backend: str) -> CachedEmbeddings:
+    model = _registered.get(model_name) or _models.get((model_name, backend))
+    if model is None:
+        model = _models[(model_name, backend)] = LazyEmbeddings(model_name, backend)
+    # Full-precision backends produce interchangeable vectors and share cache entries
+    cache_name = model_name if backend in ("torch", "onnx") else f"{model_name}|{backend}"
+    return CachedEmbeddings(model, model_name=cache_name, cache=get_embedding_cache())
+
+
+def get_embedder(model_name: str = EMBEDDING_MODEL, backend: Optional[str] = None,
+                 query_backend: Optional[str] = None) -> SharedEmbeddings:
+    backend = backend or EMBEDDING_BACKEND
+    query_backend = query_backend or EMBEDDING_QUERY_BACKEND
+    key = (model_name, backend, query_backend)
+    with _registry_lock:
+        embedder = _embedders.get(key)
+        if embedder is None:
+            document_embedder = _cached_model(model_name, backend)
+            query_embedder = (document_embedder if query_backend == backend
+                              else _cached_model(model_name, query_backend))
+            embedder = _embedders[key] = SharedEmbeddings(model_name, document_embedder, query_embedder)
+        return embedder
@@ -0,0 +1,52 @@
+import os
+from typing import List, Optional, Sequence
+import numpy as np
+
+EXACT_VECTORS_FILE = "vectors.f32"
+
+
+# Full-precision copy of the vectors in a compact (float16/int8) index, row i matching index
+# position i, used to re-score the top candidates. Query-only instances memory-map the file so
+# only the rows actually re-scored are paged in; writers hold it in RAM while ingesting.
+class ExactVectors:
+    def __init__(self, path: str, dim: int, rows: Optional[np.ndarray] = None):
+        self.path = path
+        self.dim = dim
+        self.rows = rows if rows is not None else np.empty((0, dim), dtype=np.float32)
+        self._pending: List[np.ndarray] = []
+
+    @classmethod
+    def open(cls, path: str, dim: int, count: int, mmap: bool = False) -> Optional["ExactVectors"]:
+        # None when the file is missing or does not match the index
+        if not os.path.exists(path) or os.path.getsize(path) != count * dim * 4:
+            return None
+        if not count:
+            return cls(path, dim)
+        if mmap:
+            return cls(path, dim, np.memmap(path, dtype=np.float32, mode="r", shape=(count, dim)))
+        return cls(path, dim, np.fromfile(path, dtype=np.float32).reshape(count, dim))
+
+    def _matrix(self) -> np.ndarray:
+        if self._pending:
+            self.rows = np.concatenate([self.rows] + self._pending)
+            self._pending = []
+        return self.rows
+
+    def __len__(self) -> int:
+        return len(self.rows) + sum(len(part) for part in self._pending)
+
+    def append(self, vectors):
+        self._pending.append(np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim))
+
+    def take(self, positions: Sequence[int]) -> np.ndarray:
+        # Sorted positions keep memory-mapped reads sequential
+        return np.asarray(self._matrix()[np.asarray(positions, dtype=np.int64)])
+
+    def keep(self, positions: Sequence[int]):
+        # Mirrors an index compaction: only these rows survive, in this order
+        self.rows = self.take(positions)
+
+    def save(self):
+        tmp_path = self.path + ".tmp"
+        self._matrix().tofile(tmp_path)
+        os.replace(tmp_path, self.path)
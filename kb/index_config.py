@@ -0,0 +1,175 @@
+from typing import Optional, Sequence
+import faiss
+import numpy as np
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+DEDUP_MODES = ("off", "exact", "near")
+# Scalar-quantizer factory codes for the compact storage modes
+STORAGE_CODES = {"float32": None, "float16": "SQfp16", "int8": "SQ8"}
+DEFAULT_INDEX_CONFIG = {
+    "index_type": "flat",
+    # IVF: number of inverted lists, and how many of them each query visits
+    "nlist": 1024,
+    "nprobe": 16,
+    # IVF-PQ: sub-quantizers (must divide the embedding dimension) and bits per code
+    "pq_m": 48,
+    "pq_nbits": 8,
+    # HNSW: graph degree, build-time and query-time beam widths
+    "hnsw_m": 32,
+    "ef_construction": 200,
+    "ef_search": 64,
+    # Vector storage: "float32", or "float16"/"int8" scalar quantization (2x/4x smaller) with the
+    # top k * rescore_factor candidates re-scored against full-precision vectors kept on disk.
+    # Not applied to ivf_pq, which is already compressed.
+    "storage": "float32",
+    "rescore_factor": 4,
+    # Vectors collected before training an IVF or int8 index
+    "train_sample": 50000,
+    # Indexes at least this large are opened memory-mapped for querying
+    "mmap_min_bytes": 64 * 1024 * 1024,
+    # Chunk size and overlap in tokens (see kb.chunking); changing either rebuilds the index
+    "chunk_tokens": 128,
+    "chunk_overlap_tokens": 16,
+    # Duplicate chunks dropped before embedding: "exact" (normalized text), "near" (SimHash) or "off"
+    "dedup": "near",
+    "near_dup_bits": 3,
+}
+# faiss warns when clustering with fewer training points per centroid than this
+MIN_POINTS_PER_CENTROID = 39
+
+
+def resolve_config(config: Optional[dict] = None) -> dict:
+    resolved = dict(DEFAULT_INDEX_CONFIG)
+    resolved.update({key: value for key, value in (config or {}).items() if value is not None})
+    if resolved["index_type"] not in INDEX_TYPES:
+        raise ValueError(f"Unsupported index type: {resolved['index_type']}")
+    if resolved["storage"] not in STORAGE_CODES:
+        raise ValueError(f"Unsupported storage: {resolved['storage']}")
+    if resolved["dedup"] not in DEDUP_MODES:
+        raise ValueError(f"Unsupported dedup mode: {resolved['dedup']}")
+    if not 0 <= resolved["chunk_overlap_tokens"] < resolved["chunk_tokens"]:
+        raise ValueError("chunk_overlap_tokens must be smaller than chunk_tokens")
+    return resolved
+
+
+def needs_training(config: dict) -> bool:
+    # The int8 quantizer learns per-dimension ranges; float16 needs no training
+    return config["index_type"] in ("ivf_flat", "ivf_pq") or config["storage"] == "int8"
+
+
+def factory_string(config: dict, dim: int, n_train: int) -> str:
+    index_type = config["index_type"]
+    code = STORAGE_CODES[config["storage"]]
+    if index_type == "hnsw":
+        return f"HNSW{config['hnsw_m']},{code}" if code else f"HNSW{config['hnsw_m']}"
+    if index_type in ("ivf_flat", "ivf_pq"):
+        nlist = max(1, min(config["nlist"], n_train // MIN_POINTS_PER_CENTROID))
+        if index_type == "ivf_pq":
+            if dim % config["pq_m"] or n_train < (1 << config["pq_nbits"]):
+                print(f"[WARN] Cannot train PQ{config['pq_m']}x{config['pq_nbits']} on {n_train} vectors "
+                      f"of dim {dim}; using IVF-Flat")
+                return f"IVF{nlist},Flat"
+            return f"IVF{nlist},PQ{config['pq_m']}x{config['pq_nbits']}"
+        return f"IVF{nlist},{code or 'Flat'}"
+    return code or "Flat"
+
+
+def build_index(config: dict, training_vectors: np.ndarray) -> faiss.Index:
+    dim = training_vectors.shape[1]
+    sample = training_vectors[:config["train_sample"]]
+    description = factory_string(config, dim, len(sample))
+    index = faiss.index_factory(dim, description, faiss.METRIC_L2)
+    if config["index_type"] == "hnsw":
+        index.hnsw.efConstruction = config["ef_construction"]
+    if not index.is_trained:
+        print(f"Training {description} index on {len(sample)} vectors...")
+        index.train(np.ascontiguousarray(sample, dtype=np.float32))
+    apply_search_params(index, config)
+    return index
+
+
+def index_type_of(index: faiss.Index) -> str:
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if faiss.try_extract_index_ivf(index) is not None:
+        return "ivf_flat"
+    return "flat"
+
+
+def storage_of(index: faiss.Index) -> str:
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        inner = faiss.downcast_index(ivf)
+    elif isinstance(index, faiss.IndexHNSW):
+        inner = faiss.downcast_index(index.storage)
+    else:
+        inner = index
+    if isinstance(inner, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+        qtype = inner.sq.qtype
+        if qtype == faiss.ScalarQuantizer.QT_fp16:
+            return "float16"
+        if qtype == faiss.ScalarQuantizer.QT_8bit:
+            return "int8"
+    return "float32"
+
+
+def matches_config(index: faiss.Index, config: dict) -> bool:
+    actual = index_type_of(index)
+    if config["index_type"] != "ivf_pq" and storage_of(index) != config["storage"]:
+        return False
+    # An ivf_pq request falls back to IVF-Flat when there was too little data to train PQ
+    return actual == config["index_type"] or (actual == "ivf_flat" and config["index_type"] == "ivf_pq")
+
+
+def apply_search_params(index: faiss.Index, config: dict):
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = min(config["nprobe"], ivf.nlist)
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = config["ef_search"]
+
+
+def read_index(path: str, mmap: bool = False) -> faiss.Index:
+    if mmap:
+        flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY | getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+        try:
+            return faiss.read_index(path, flags)
+        except RuntimeError as e:
+            print(f"[WARN] Memory-mapped load of {path} failed ({e}); reading into RAM")
+    return faiss.read_index(path)
+
+
+def vector_bytes(index: faiss.Index) -> int:
+    # Stored bytes per vector (graph links and inverted-list ids not included)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        return ivf.code_size
+    if isinstance(index, faiss.IndexHNSW):
+        # The graph index has no code size of its own; its vectors live in the storage index
+        index = faiss.downcast_index(index.storage)
+    try:
+        return index.sa_code_size()
+    except RuntimeError:
+        return index.d * 4
+
+
+def reconstruct_vectors(index: faiss.Index, positions: Sequence[int]) -> np.ndarray:
+    if not len(positions):
+        return np.empty((0, index.d), dtype=np.float32)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None and ivf.direct_map.type == faiss.DirectMap.NoMap:
+        ivf.make_direct_map()
+    return index.reconstruct_batch(np.asarray(positions, dtype=np.int64))
+
+
+def rebuild_without(index: faiss.Index, positions_to_keep: Sequence[int], vectors: Optional[np.ndarray] = None):
+    # Trained or graph indexes cannot compact ids on removal the way IndexFlat does, so
+    # surviving vectors are re-added in order (training is kept across reset()). Pass the
+    # full-precision vectors when available so quantized codes are not re-quantized.
+    if vectors is None:
+        vectors = reconstruct_vectors(index, positions_to_keep)
+    index.reset()
+    if len(vectors):
+        index.add(vectors)
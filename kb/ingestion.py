@@ -0,0 +1,158 @@
+import os
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+from langchain_community.document_loaders import TextLoader, PyPDFLoader
+from langchain_core.documents import Document
+from kb.chunking import Fingerprint, fingerprint_chunks, make_splitter
+from kb.manifest import file_digest
+
+INGEST_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+EMBED_BATCH_SIZE = 256
+# Embedding batches queued ahead of the embedding thread; bounds memory along with the loader window
+INGEST_MAX_PENDING_BATCHES = int(os.getenv("INGEST_MAX_PENDING_BATCHES", "4"))
+# Seconds between saves of the index and manifest during a run (0 saves only at the end)
+INGEST_CHECKPOINT_SECONDS = float(os.getenv("INGEST_CHECKPOINT_SECONDS", "120"))
+# Minimum seconds between progress callbacks
+INGEST_PROGRESS_INTERVAL = float(os.getenv("INGEST_PROGRESS_INTERVAL", "0.5"))
+
+
+def load_single_file(file_path: str) -> List[Document]:
+    try:
+        ext = os.path.splitext(file_path)[1].lower()
+        if ext == ".pdf":
+            loader = PyPDFLoader(file_path)
+        elif ext == ".txt":
+            loader = TextLoader(file_path)
+        else:
+            raise ValueError(f"Unsupported file format: {file_path}")
+        return loader.load()
+    except Exception as e:
+        print(f"[ERROR] Failed to load {file_path}: {e}")
+        return []
+
+
+def lower_priority(niceness: int):
+    # Loader process initializer, so parsing yields the CPU to the interactive process
+    if niceness and hasattr(os, "nice"):
+        os.nice(niceness)
+
+
+def load_and_split(file_path: str, config: dict
+                   ) -> Tuple[str, Optional[dict], int, List[Document], Optional[List[Fingerprint]]]:
+    # Runs inside a worker process, so it must stay a picklable module-level function.
+    # Dedup fingerprints are computed here too, leaving only the lookups to the main process.
+    try:
+        stat = os.stat(file_path)
+        file_info = {"size": stat.st_size, "mtime": stat.st_mtime, "sha256": file_digest(file_path)}
+    except OSError as e:
+        print(f"[ERROR] Failed to read {file_path}: {e}")
+        return file_path, None, 0, [], None
+    docs = load_single_file(file_path)
+    if not docs:
+        return file_path, None, 0, [], None
+    chunks = make_splitter(config).split_documents(docs)
+    fingerprints = fingerprint_chunks(chunks) if config["dedup"] != "off" else None
+    return file_path, file_info, len(docs), chunks, fingerprints
+
+
+# Files whose chunks are not all in the index yet. A file is recorded in the manifest only
+# once complete, so a checkpoint never claims a file whose vectors were not saved.
+class PendingFiles:
+    def __init__(self):
+        self.entries: Dict[str, dict] = {}  # path -> IngestManifest.record keyword arguments
+        self.remaining: Dict[str, int] = {}
+
+    def add(self, path: str, entry: dict):
+        self.entries[path] = entry
+        self.remaining[path] = len(entry["chunk_ids"])
+
+    def chunks_added(self, owners: List[str]):
+        for owner in owners:
+            self.remaining[owner] -= 1
+
+    def pop_complete(self) -> List[Tuple[str, dict]]:
+        done = [path for path, count in self.remaining.items() if count == 0]
+        for path in done:
+            del self.remaining[path]
+        return [(path, self.entries.pop(path)) for path in done]
+
+    def in_progress(self) -> Dict[str, List[str]]:
+        return {path: entry["chunk_ids"] for path, entry in self.entries.items()}
+
+
+class IngestStats:
+    def __init__(self, total_files: int):
+        self.total_files = total_files
+        self.files_done = 0
+        self.files_skipped = 0
+        self.files_unchanged = 0
+        self.chunks_removed = 0
+        self.chunks_embedded = 0
+        self.chunks_deduplicated = 0
+        self.bytes_saved = 0  # dropped chunk text plus the vectors they would have added
+        self.checkpoints = 0
+        self.cancelled = False
+        self.started = time.perf_counter()
+
+    def elapsed(self) -> float:
+        return max(time.perf_counter() - self.started, 1e-9)
+
+    def files_per_sec(self) -> float:
+        return self.files_done / self.elapsed()
+
+    def chunks_per_sec(self) -> float:
+        return self.chunks_embedded / self.elapsed()
+
+    def as_dict(self) -> dict:
+        return {
+            "files": self.files_done,
+            "skipped": self.files_skipped,
+            "unchanged": self.files_unchanged,
+            "removed_chunks": self.chunks_removed,
+            "chunks": self.chunks_embedded,
+            "deduplicated_chunks": self.chunks_deduplicated,
+            "bytes_saved": self.bytes_saved,
+            "checkpoints": self.checkpoints,
+            "cancelled": self.cancelled,
+            "seconds": round(self.elapsed(), 3),
+            "files_per_sec": round(self.files_per_sec(), 2),
+            "chunks_per_sec": round(self.chunks_per_sec(), 2),
+        }
+
+    def summary(self) -> str:
+        return (f"{self.files_done} files, {self.chunks_embedded} chunks in {self.elapsed():.1f}s "
+                f"({self.files_per_sec():.2f} files/sec, {self.chunks_per_sec():.2f} chunks/sec)")
+
+
+# Throttled progress callback (files, chunks, ETA) for the UI and the ingestion job queue
+class ProgressReporter:
+    def __init__(self, callback: Optional[Callable[[dict], None]], stats: IngestStats, total: int,
+                 interval: float = INGEST_PROGRESS_INTERVAL):
+        self.callback = callback
+        self.stats = stats
+        self.total = total
+        self.interval = interval
+        self.last = 0.0
+
+    def report(self, files_done: int, stage: str = "ingesting", force: bool = False):
+        if self.callback is None:
+            return
+        now = time.monotonic()
+        if not force and now - self.last < self.interval:
+            return
+        self.last = now
+        elapsed = self.stats.elapsed()
+        eta = elapsed / files_done * (self.total - files_done) if files_done else None
+        try:
+            self.callback({
+                "stage": stage,
+                "files_done": files_done,
+                "files_total": self.total,
+                "unchanged": self.stats.files_unchanged,
+                "chunks": self.stats.chunks_embedded,
+                "deduplicated_chunks": self.stats.chunks_deduplicated,
+                "elapsed": round(elapsed, 1),
+                "eta_seconds": round(eta, 1) if eta is not None else None,
+            })
+        except Exception as e:
+            print(f"[WARN] Ingestion progress callback failed: {e}")
@@ -1,80 +1,496 @@
+import multiprocessing
 import os
-from typing import List
+import pickle
+import time
+import uuid
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from itertools import islice
+from typing import Callable, List, Optional, Tuple
+import faiss
+import numpy as np
 from langchain_community.vectorstores import FAISS
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.document_loaders import TextLoader, PyPDFLoader
 from langchain_core.documents import Document
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+from kb.ingestion import (
+    INGEST_WORKERS, EMBED_BATCH_SIZE, INGEST_CHECKPOINT_SECONDS, INGEST_MAX_PENDING_BATCHES,
+    IngestStats, PendingFiles, ProgressReporter, load_single_file, load_and_split, lower_priority,
+)
+from kb.chunking import ChunkDeduper, chunking_settings
+from kb.manifest import IngestManifest
+from kb.embedding_cache import get_embedding_cache
+from kb.embeddings import EMBEDDING_MODEL, get_embedder
+from kb.docstore import DOCSTORE_FILE, LazyPositionMap, SQLiteDocstore
+from kb.exact_vectors import EXACT_VECTORS_FILE, ExactVectors
+from utils.metrics import span
+from kb.index_config import (
+    apply_search_params, build_index, index_type_of, matches_config, needs_training, read_index, rebuild_without,
+    reconstruct_vectors, resolve_config, storage_of, vector_bytes,
+)
+
+INDEX_FILE = "index.faiss"
+# Pickled (docstore, index_to_docstore_id) written by FAISS.save_local before the SQLite docstore
+LEGACY_DOCSTORE_FILE = "index.pkl"
 
 class KnowledgeBase:
-    def __init__(self, agent_name: str):
+    # read_only=True is for query-only instances such as the one held by an Agent: large
+    # indexes are memory-mapped and vector positions are resolved lazily from SQLite.
+    def __init__(self, agent_name: str, index_config: Optional[dict] = None, read_only: bool = False):
         self.agent_name = agent_name
         self.index_dir = os.path.join("faiss_index", agent_name)
-        self.embedder = HuggingFaceEmbeddings(
-            model_name="all-MiniLM-L6-v2",
-            model_kwargs={"device": "cuda"}  # Enable GPU
-        )
+        self.index_config = resolve_config(index_config)
+        self.read_only = read_only
+        # Shared per process; the model weights load lazily on first embed
+        self.embedder = get_embedder(EMBEDDING_MODEL)
+        self._training_buffer = []
+        self._saved_positions = 0
+        self._positions_rewrite = False
+        self._loaded_mtime = None
+        # Full-precision vectors for re-scoring when the index stores float16/int8 codes
+        self.exact_vectors: Optional[ExactVectors] = None
         self.vectorstore = self._load_or_create_index()
 
+    def _index_path(self) -> str:
+        return os.path.join(self.index_dir, INDEX_FILE)
+
+    def _exact_path(self) -> str:
+        return os.path.join(self.index_dir, EXACT_VECTORS_FILE)
+
+    def _open_docstore(self) -> SQLiteDocstore:
+        os.makedirs(self.index_dir, exist_ok=True)
+        return SQLiteDocstore(os.path.join(self.index_dir, DOCSTORE_FILE))
+
     def _load_or_create_index(self):
-        if os.path.exists(self.index_dir):
-            return FAISS.load_local(
-                self.index_dir,
-                self.embedder,
-                allow_dangerous_deserialization=True
-            )
-        else:
+        index_path = self._index_path()
+        if not os.path.exists(index_path):
             return None
+        if not os.path.exists(os.path.join(self.index_dir, DOCSTORE_FILE)):
+            self._migrate_pickled_docstore()
+        self._loaded_mtime = os.stat(index_path).st_mtime_ns
+        use_mmap = self.read_only and os.path.getsize(index_path) >= self.index_config["mmap_min_bytes"]
+        index = read_index(index_path, mmap=use_mmap)
+        apply_search_params(index, self.index_config)
+        docstore = self._open_docstore()
+        positions = LazyPositionMap(docstore) if self.read_only else docstore.load_positions()
+        self._saved_positions = len(positions)
+        self.exact_vectors = self._open_exact_vectors(index)
+        return FAISS(self.embedder, index, docstore, positions)
 
-    def _load_single_file(self, file_path: str) -> List[Document]:
-        try:
-            ext = os.path.splitext(file_path)[1].lower()
-            if ext == ".pdf":
-                loader = PyPDFLoader(file_path)
-            elif ext == ".txt":
-                loader = TextLoader(file_path)
-            else:
-                raise ValueError(f"Unsupported file format: {file_path}")
-            return loader.load()
-        except Exception as e:
-            print(f"[ERROR] Failed to load {file_path}: {e}")
-            return []
-
-    def ingest_docs(self, doc_paths: List[str]):
-        print(f"Ingesting {len(doc_paths)} documents...")
-        all_docs = []
-
-        for i, path in enumerate(doc_paths, 1):
-            norm_path = os.path.normpath(path)
-            print(f"[{i}/{len(doc_paths)}] Processing {os.path.basename(norm_path)}...")
-            docs = self._load_single_file(norm_path)
-            if docs:
-                print(f"  ✔ Loaded {len(docs)} chunks")
-            else:
-                print(f"  ✘ Skipped (no loadable content)")
-            all_docs.extend(docs)
-
-        if not all_docs:
-            print("No documents loaded; skipping FAISS index creation.")
+    def _open_exact_vectors(self, index: faiss.Index) -> Optional[ExactVectors]:
+        if storage_of(index) == "float32":
+            return None
+        exact = ExactVectors.open(self._exact_path(), index.d, index.ntotal, mmap=self.read_only)
+        if exact is None:
+            print(f"[WARN] Full-precision vectors for '{self.agent_name}' are missing; results will not be re-scored")
+        return exact
+
+    def _migrate_pickled_docstore(self):
+        legacy_path = os.path.join(self.index_dir, LEGACY_DOCSTORE_FILE)
+        if not os.path.exists(legacy_path):
             return
+        print(f"Migrating {legacy_path} to a SQLite docstore...")
+        # One-time read of a pickle this app wrote itself with FAISS.save_local
+        with open(legacy_path, "rb") as f:
+            legacy_docstore, index_to_docstore_id = pickle.load(f)
+        docstore = self._open_docstore()
+        docstore.add(dict(legacy_docstore._dict))
+        docstore.save_positions(index_to_docstore_id)
+        docstore.close()
+        os.remove(legacy_path)
+
+    def warm_up(self):
+        # The index is opened in __init__; this also loads the query embedding model
+        self.embedder.warm_up()
 
-        # Split long docs into chunks
-        splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-        split_docs = splitter.split_documents(all_docs)
-        print(f"Split into {len(split_docs)} chunks. Creating FAISS index...")
+    def set_search_params(self, nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+        self.index_config = resolve_config({**self.index_config, "nprobe": nprobe, "ef_search": ef_search})
+        if self.vectorstore is not None:
+            apply_search_params(self.vectorstore.index, self.index_config)
 
-        # Create or extend FAISS index
-        if self.vectorstore:
-            self.vectorstore.add_documents(split_docs)
+    def _load_single_file(self, file_path: str) -> List[Document]:
+        return load_single_file(file_path)
+
+    def _embed_and_add(self, chunks: List[Document], ids: List[str], duty_cycle: float = 1.0) -> int:
+        started = time.perf_counter()
+        texts = [doc.page_content for doc in chunks]
+        with span("kb.embed_batch", agent=self.agent_name):
+            vectors = self.embedder.embed_documents(texts)
+        metadatas = [doc.metadata for doc in chunks]
+        with span("kb.add_vectors", agent=self.agent_name):
+            self._add_embeddings(texts, vectors, metadatas, ids)
+        if duty_cycle < 1:
+            # Idle in proportion to the batch's work so live queries get the CPU in between
+            time.sleep((time.perf_counter() - started) * (1 - duty_cycle) / duty_cycle)
+        return len(chunks)
+
+    def _add_embeddings(self, texts, vectors, metadatas, ids, final: bool = False):
+        if self.vectorstore is not None:
+            if not texts:
+                return  # the final flush only matters while training batches are held back
+            self.vectorstore.add_embeddings(list(zip(texts, vectors)), metadatas=metadatas, ids=ids)
+            if self.exact_vectors is not None:
+                self.exact_vectors.append(vectors)
+            return
+        # IVF indexes are trained on a sample, so hold batches back until enough have arrived
+        if texts:
+            self._training_buffer.append((texts, vectors, metadatas, ids))
+        buffered = sum(len(batch[0]) for batch in self._training_buffer)
+        if not buffered:
+            return
+        if needs_training(self.index_config) and buffered < self.index_config["train_sample"] and not final:
+            return
+        batches, self._training_buffer = self._training_buffer, []
+        matrix = np.asarray([vector for batch in batches for vector in batch[1]], dtype=np.float32)
+        index = build_index(self.index_config, matrix)
+        compact = storage_of(index) != "float32"
+        self.exact_vectors = ExactVectors(self._exact_path(), index.d, matrix) if compact else None
+        # A fresh index replaces whatever the docstore held; cleared rows commit on save
+        docstore = self._open_docstore()
+        docstore.clear()
+        self._positions_rewrite = True
+        self.vectorstore = FAISS(self.embedder, index, docstore, {})
+        for batch_texts, batch_vectors, batch_metadatas, batch_ids in batches:
+            self.vectorstore.add_embeddings(
+                list(zip(batch_texts, batch_vectors)), metadatas=batch_metadatas, ids=batch_ids
+            )
+
+    def _remove_chunks(self, chunk_ids: List[str]) -> int:
+        if self.vectorstore is None or not chunk_ids:
+            return 0
+        known = set(chunk_id for chunk_id in chunk_ids if chunk_id in self.vectorstore.docstore)
+        if not known:
+            return 0
+        self._positions_rewrite = True
+        ordered = sorted(self.vectorstore.index_to_docstore_id.items())
+        keep = [(position, doc_id) for position, doc_id in ordered if doc_id not in known]
+        if self.exact_vectors is not None:
+            self.exact_vectors.keep([position for position, _ in keep])
+        if index_type_of(self.vectorstore.index) == "flat":
+            self.vectorstore.delete(list(known))
         else:
-            self.vectorstore = FAISS.from_documents(split_docs, self.embedder)
+            exact = self.exact_vectors.rows if self.exact_vectors is not None else None
+            rebuild_without(self.vectorstore.index, [position for position, _ in keep], exact)
+            self.vectorstore.index_to_docstore_id = {i: doc_id for i, (_, doc_id) in enumerate(keep)}
+            self.vectorstore.docstore.delete(list(known))
+        return len(known)
+
+    def _save_index(self):
+        if self.read_only:
+            raise RuntimeError(f"Knowledge base for '{self.agent_name}' was opened read-only")
+        os.makedirs(self.index_dir, exist_ok=True)
+        index_path = self._index_path()
+        with span("kb.save_index", agent=self.agent_name):
+            faiss.write_index(self.vectorstore.index, index_path + ".tmp")
+            # Written before the index is swapped in, so readers never see a newer index without it
+            if self.exact_vectors is not None:
+                self.exact_vectors.save()
+            elif os.path.exists(self._exact_path()):
+                os.remove(self._exact_path())
+            start = 0 if self._positions_rewrite else self._saved_positions
+            self.vectorstore.docstore.save_positions(self.vectorstore.index_to_docstore_id, start=start)
+            os.replace(index_path + ".tmp", index_path)
+        self._saved_positions = len(self.vectorstore.index_to_docstore_id)
+        self._positions_rewrite = False
+
+    def ingest_docs(self, doc_paths: List[str], workers: Optional[int] = None,
+                    batch_size: Optional[int] = None, prune: bool = False,
+                    progress: Optional[Callable[[dict], None]] = None, cancel=None,
+                    duty_cycle: float = 1.0, nice: int = 0) -> dict:
+        # progress receives throttled dicts (files, chunks, ETA); setting the cancel Event stops
+        # after the current batches and saves what is complete. duty_cycle < 1 idles the embedding
+        # thread between batches and nice lowers the loader processes' priority.
+        with span("kb.ingest", agent=self.agent_name):
+            return self._ingest_docs(doc_paths, workers, batch_size, prune, progress, cancel,
+                                     min(1.0, max(0.05, duty_cycle)), nice)
+
+    def _ingest_docs(self, doc_paths: List[str], workers: Optional[int], batch_size: Optional[int],
+                     prune: bool, progress: Optional[Callable[[dict], None]], cancel, duty_cycle: float,
+                     nice: int) -> dict:
+        workers = workers or INGEST_WORKERS
+        batch_size = batch_size or EMBED_BATCH_SIZE
+        stats = IngestStats(total_files=len(doc_paths))
 
-        # Save index
-        self.vectorstore.save_local(self.index_dir)
+        manifest = IngestManifest(self.index_dir)
+        chunking = chunking_settings(self.index_config)
+        if self.vectorstore is not None and not os.path.exists(manifest.path):
+            # Index predates the manifest, so its vectors cannot be attributed to files
+            print("No ingest manifest found for existing index; rebuilding from scratch.")
+            self.vectorstore = None
+        elif self.vectorstore is not None and not matches_config(self.vectorstore.index, self.index_config):
+            print(f"Index type changed to {self.index_config['index_type']}; rebuilding from scratch.")
+            self.vectorstore = None
+        elif (self.vectorstore is not None and storage_of(self.vectorstore.index) != "float32"
+              and self.exact_vectors is None):
+            print("Full-precision vectors for re-scoring are missing; rebuilding from scratch.")
+            self.vectorstore = None
+        elif self.vectorstore is not None and manifest.chunking != chunking:
+            print(f"Chunking changed to {chunking}; rebuilding from scratch.")
+            self.vectorstore = None
+        if self.vectorstore is None:
+            manifest.reset(chunking)
+
+        to_ingest, stale_ids, stats.files_unchanged = manifest.plan(doc_paths, prune=prune)
+        stats.chunks_removed = self._remove_chunks(stale_ids)
+        # Seeded with the chunks already indexed, so duplicates of earlier files are dropped too
+        deduper = None
+        if self.index_config["dedup"] != "off":
+            deduper = ChunkDeduper(self.index_config["dedup"], self.index_config["near_dup_bits"])
+            for key, fingerprint in manifest.fingerprints():
+                deduper.add(fingerprint, key)
+        dropped_text_bytes = 0
+        reporter = ProgressReporter(progress, stats, len(to_ingest))
+        reporter.report(0, force=True)
+        print(f"Ingesting {len(to_ingest)} new or changed documents with {workers} workers "
+              f"({stats.files_unchanged} unchanged, {stats.chunks_removed} stale chunks removed)...")
+
+        # Loading and splitting fan out over processes while a single embedding thread consumes
+        # fixed-size batches. Files stream through a bounded window of loader futures and queued
+        # batches, so memory stays flat however large the corpus; the index and manifest are
+        # checkpointed every INGEST_CHECKPOINT_SECONDS so an interrupted run resumes from there.
+        pool_cls = ProcessPoolExecutor if workers > 1 else ThreadPoolExecutor
+        files = PendingFiles()
+        completed: List[str] = []  # files recorded since the last checkpoint
+        pending: List[Document] = []
+        pending_ids: List[str] = []
+        pending_owners: List[str] = []
+        embed_futures = deque()
+        last_checkpoint = time.monotonic()
+
+        def finish_batch():
+            future, owners = embed_futures.popleft()
+            if stats.cancelled and future.cancel():
+                return  # never started; its files stay partial
+            stats.chunks_embedded += future.result()
+            files.chunks_added(owners)
+
+        def record_complete():
+            for path, entry in files.pop_complete():
+                manifest.record(path, **entry)
+                completed.append(path)
+
+        pool_args = {}
+        if workers > 1:
+            # Spawned, not forked: ingestion may run on a background thread of a process that
+            # already has Qt, SQLite connections and the embedding thread, and forking a
+            # multi-threaded process can deadlock the children
+            pool_args["mp_context"] = multiprocessing.get_context("spawn")
+            if nice:
+                pool_args.update(initializer=lower_priority, initargs=(nice,))
+        with pool_cls(max_workers=workers, **pool_args) as load_pool, ThreadPoolExecutor(max_workers=1) as embed_pool:
+            paths = iter(to_ingest)
+            loading = {load_pool.submit(load_and_split, path, self.index_config) for path in islice(paths, workers * 2)}
+            i = 0
+            while loading:
+                if cancel is not None and cancel.is_set():
+                    # Files not finished stay partial in the manifest and are redone by the next run
+                    for future in loading:
+                        future.cancel()
+                    stats.cancelled = True
+                    break
+                finished, loading = wait(loading, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    next_path = next(paths, None)
+                    if next_path is not None:
+                        loading.add(load_pool.submit(load_and_split, next_path, self.index_config))
+                    i += 1
+                    path, file_info, page_count, chunks, fingerprints = future.result()
+                    if file_info is None:
+                        print(f"[{i}/{len(to_ingest)}] {os.path.basename(path)}: skipped (no loadable content)")
+                        stats.files_skipped += 1
+                        continue
+                    sources = set()
+                    duplicates = ""
+                    if deduper is not None:
+                        total = len(chunks)
+                        chunks, fingerprints, sources, dropped_bytes = deduper.filter(path, chunks, fingerprints)
+                        stats.chunks_deduplicated += total - len(chunks)
+                        dropped_text_bytes += dropped_bytes
+                        duplicates = f" ({total - len(chunks)} duplicates dropped)" if total > len(chunks) else ""
+                    print(f"[{i}/{len(to_ingest)}] {os.path.basename(path)}: {page_count} pages, "
+                          f"{len(chunks)} chunks{duplicates}")
+                    stats.files_done += 1
+                    chunk_ids = [str(uuid.uuid4()) for _ in chunks]
+                    files.add(path, dict(chunk_ids=chunk_ids, fingerprints=fingerprints,
+                                         dedup_sources=sorted(sources), **file_info))
+                    pending.extend(chunks)
+                    pending_ids.extend(chunk_ids)
+                    pending_owners.extend([path] * len(chunks))
+                    while len(pending) >= batch_size:
+                        embed_futures.append((embed_pool.submit(
+                            self._embed_and_add, pending[:batch_size], pending_ids[:batch_size], duty_cycle
+                        ), pending_owners[:batch_size]))
+                        pending, pending_ids = pending[batch_size:], pending_ids[batch_size:]
+                        pending_owners = pending_owners[batch_size:]
+                        while len(embed_futures) > INGEST_MAX_PENDING_BATCHES:
+                            finish_batch()
+                record_complete()
+                reporter.report(i)
+                if INGEST_CHECKPOINT_SECONDS and time.monotonic() - last_checkpoint >= INGEST_CHECKPOINT_SECONDS:
+                    while embed_futures:
+                        finish_batch()
+                    record_complete()
+                    if self._checkpoint(manifest, files, completed):
+                        stats.checkpoints += 1
+                    last_checkpoint = time.monotonic()
+            if cancel is not None and cancel.is_set():
+                stats.cancelled = True
+            if pending and not stats.cancelled:
+                embed_futures.append((embed_pool.submit(self._embed_and_add, pending, pending_ids, duty_cycle),
+                                      pending_owners))
+            while embed_futures:
+                # Queued batches are dropped too once cancelled, so a cancel takes effect promptly
+                if cancel is not None and cancel.is_set():
+                    stats.cancelled = True
+                finish_batch()
+        record_complete()
+        self._add_embeddings([], [], [], [], final=True)
+        if stats.cancelled:
+            print(f"Ingestion cancelled after {stats.files_done} of {len(to_ingest)} documents.")
+
+        if self.vectorstore is None:
+            print("No documents loaded; skipping FAISS index creation.")
+            reporter.report(i, stage="done", force=True)
+            return stats.as_dict()
+        stats.bytes_saved = dropped_text_bytes + stats.chunks_deduplicated * vector_bytes(self.vectorstore.index)
+        if not stats.chunks_embedded and not stats.chunks_removed and os.path.exists(manifest.path):
+            print("Knowledge base is up to date.")
+            manifest.save()
+            reporter.report(i, stage="done", force=True)
+            return stats.as_dict()
+
+        reporter.report(i, stage="saving", force=True)
+        self._checkpoint(manifest, files, completed)
         print(f"FAISS index saved to {self.index_dir}")
+        print(f"Ingestion throughput: {stats.summary()}")
+        if stats.chunks_deduplicated:
+            print(f"Deduplication: {stats.chunks_deduplicated} duplicate chunks dropped, "
+                  f"{stats.bytes_saved / 1024:.1f} KiB of index and docstore saved")
+        print(f"Embedding cache: {get_embedding_cache().stats()}")
+        reporter.report(i, stage="done", force=True)
+        return stats.as_dict()
+
+    def _checkpoint(self, manifest: IngestManifest, files: PendingFiles, completed: List[str]) -> bool:
+        # Files completed since the last checkpoint stay marked partial until the index is on
+        # disk, so a crash between the two writes never leaves vectors the manifest cannot attribute
+        if self.vectorstore is None:
+            return False  # still collecting training vectors; nothing is indexed yet
+        in_progress = files.in_progress()
+        manifest.partial = {**in_progress, **{key: manifest.files[key]["chunk_ids"] for key in completed}}
+        manifest.save()
+        self._save_index()
+        manifest.partial = in_progress
+        manifest.save()
+        completed.clear()
+        return True
+
+    def refresh_if_stale(self):
+        # Read-only instances resolve positions from SQLite, which an ingestion run may have
+        # rewritten; reopen whenever the index file on disk has been replaced.
+        try:
+            mtime = os.stat(self._index_path()).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime != self._loaded_mtime:
+            self.vectorstore = self._load_or_create_index()
 
     def query(self, query: str, k: int = 3) -> str:
-        if not self.vectorstore:
-            return ""
-        results = self.vectorstore.similarity_search(query, k=k)
-        return "\n".join([doc.page_content for doc in results])
+        results = self.query_batch([query], k=k)[0]
+        return "\n".join([doc.page_content for doc, _ in results])
+
+    def query_batch(self, queries: List[str], k: int = 3, score_threshold: Optional[float] = None,
+                    mmr: bool = False, fetch_k: int = 20,
+                    lambda_mult: float = 0.5) -> List[List[Tuple[Document, float]]]:
+        # Scores are FAISS L2 distances (lower is closer); score_threshold is a maximum distance.
+        with span("kb.query", agent=self.agent_name):
+            return self._query_batch(queries, k, score_threshold, mmr, fetch_k, lambda_mult)
+
+    def _query_batch(self, queries: List[str], k: int, score_threshold: Optional[float], mmr: bool,
+                     fetch_k: int, lambda_mult: float) -> List[List[Tuple[Document, float]]]:
+        if self.read_only:
+            self.refresh_if_stale()
+        if self.vectorstore is None or not queries:
+            return [[] for _ in queries]
+        with span("kb.embed_query", agent=self.agent_name):
+            query_matrix = np.asarray(self.embedder.embed_queries(queries), dtype=np.float32)
+        distances, positions = self.search_vectors(query_matrix, max(fetch_k, k) if mmr else k)
+        valid = positions >= 0
+        if score_threshold is not None:
+            valid &= distances <= score_threshold
+
+        unique_positions = np.unique(positions[valid])
+        with span("kb.fetch_chunks", agent=self.agent_name):
+            docs_by_position = dict(zip(unique_positions.tolist(), self._documents_at(unique_positions.tolist())))
+        if mmr:
+            candidate_vectors = self._candidate_vectors(unique_positions, docs_by_position)
+            row_of = {position: row for row, position in enumerate(unique_positions.tolist())}
+
+        results = []
+        for qi in range(len(queries)):
+            hits = positions[qi][valid[qi]]
+            scores = distances[qi][valid[qi]]
+            if mmr and len(hits) > k:
+                rows = np.fromiter((row_of[position] for position in hits.tolist()), dtype=np.int64, count=len(hits))
+                order = _mmr_select(query_matrix[qi], candidate_vectors[rows], k, lambda_mult)
+                hits, scores = hits[order], scores[order]
+            results.append([
+                (docs_by_position[position], float(score))
+                for position, score in zip(hits[:k].tolist(), scores[:k].tolist())
+                if docs_by_position.get(position) is not None
+            ])
+        return results
+
+    def search_vectors(self, query_matrix: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        # Compact indexes over-fetch, then re-rank the candidates by exact L2 distance
+        exact = self.exact_vectors
+        fetch = k * self.index_config["rescore_factor"] if exact is not None else k
+        with span("kb.search", agent=self.agent_name):
+            distances, positions = self.vectorstore.index.search(query_matrix, fetch)
+        found = positions >= 0
+        if exact is None or not found.any():
+            return distances, positions
+        with span("kb.rescore", agent=self.agent_name):
+            rows = np.unique(positions[found])
+            candidates = exact.take(rows)[np.searchsorted(rows, np.where(found, positions, rows[0]))]
+            exact_distances = ((candidates - query_matrix[:, None, :]) ** 2).sum(axis=2)
+            exact_distances[~found] = np.inf
+            order = np.argsort(exact_distances, axis=1, kind="stable")[:, :k]
+            return np.take_along_axis(exact_distances, order, 1), np.take_along_axis(positions, order, 1)
+
+    def _documents_at(self, positions: List[int]) -> List[Optional[Document]]:
+        mapping = self.vectorstore.index_to_docstore_id
+        doc_ids = mapping.many(positions) if isinstance(mapping, LazyPositionMap) else [mapping.get(p) for p in positions]
+        docstore = self.vectorstore.docstore
+        if isinstance(docstore, SQLiteDocstore):
+            docs = docstore.mget([doc_id for doc_id in doc_ids if doc_id is not None])
+            by_id = {doc.id: doc for doc in docs if doc is not None}
+            return [by_id.get(doc_id) for doc_id in doc_ids]
+        return [docstore.search(doc_id) if doc_id is not None else None for doc_id in doc_ids]
+
+    def _candidate_vectors(self, positions: np.ndarray, docs_by_position: dict) -> np.ndarray:
+        if self.exact_vectors is not None:
+            return self.exact_vectors.take(positions)
+        try:
+            return reconstruct_vectors(self.vectorstore.index, positions.tolist())
+        except RuntimeError:
+            # Some index types cannot reconstruct; re-embedding is cheap thanks to the cache
+            texts = [docs_by_position[p].page_content if docs_by_position.get(p) else "" for p in positions.tolist()]
+            return np.asarray(self.embedder.embed_documents(texts), dtype=np.float32)
+
+
+def _mmr_select(query_vector: np.ndarray, candidates: np.ndarray, k: int, lambda_mult: float) -> np.ndarray:
+    # Maximal marginal relevance over cosine similarities; each step is vectorized over candidates
+    def normalize(matrix):
+        norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+        return matrix / np.where(norms == 0, 1, norms)
+
+    candidates = normalize(candidates)
+    relevance = candidates @ normalize(query_vector)
+    redundancy = candidates @ candidates.T
+    selected = [int(np.argmax(relevance))]
+    max_redundancy = redundancy[selected[0]].copy()
+    for _ in range(min(k, len(candidates)) - 1):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * max_redundancy
+        scores[selected] = -np.inf
+        chosen = int(np.argmax(scores))
+        selected.append(chosen)
+        max_redundancy = np.maximum(max_redundancy, redundancy[chosen])
+    return np.asarray(selected, dtype=np.int64)
@@ -0,0 +1,127 @@
+import hashlib
+import json
+import os
+from typing import Dict, Iterator, List, Optional, Tuple
+
+MANIFEST_FILE = "manifest.json"
+HASH_BLOCK_SIZE = 1 << 20
+
+
+def file_digest(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def manifest_key(file_path: str) -> str:
+    return os.path.abspath(os.path.normpath(file_path))
+
+
+# Per-index record of ingested files and the FAISS chunk IDs each one produced
+class IngestManifest:
+    def __init__(self, index_dir: str):
+        self.path = os.path.join(index_dir, MANIFEST_FILE)
+        self.files: Dict[str, dict] = {}
+        # Chunking settings the recorded chunks were split with (None for older manifests)
+        self.chunking: Optional[dict] = None
+        # Files an interrupted run had started, with the chunk IDs it may have added for them
+        self.partial: Dict[str, List[str]] = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.files = data.get("files", {})
+            self.chunking = data.get("chunking")
+            self.partial = data.get("partial", {})
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "chunking": self.chunking, "files": self.files, "partial": self.partial}, f)
+        os.replace(tmp_path, self.path)
+
+    def reset(self, chunking: Optional[dict] = None):
+        self.files = {}
+        self.chunking = chunking
+        self.partial = {}
+
+    def chunk_ids(self) -> List[str]:
+        return [chunk_id for entry in self.files.values() for chunk_id in entry["chunk_ids"]]
+
+    def _is_unchanged(self, key: str, entry: Optional[dict]) -> bool:
+        if entry is None:
+            return False
+        stat = os.stat(key)
+        if stat.st_size == entry["size"] and stat.st_mtime == entry["mtime"]:
+            return True
+        # Touched but identical content: refresh the stat fields and keep the vectors
+        if stat.st_size == entry["size"] and file_digest(key) == entry["sha256"]:
+            entry["mtime"] = stat.st_mtime
+            return True
+        return False
+
+    def plan(self, doc_paths: List[str], prune: bool = False) -> Tuple[List[str], List[str], int]:
+        # Entries whose file no longer exists are always dropped; with prune=True so is
+        # every entry not listed in doc_paths.
+        to_ingest, stale_ids, unchanged = [], [], 0
+        requested, released = set(), set()
+        # Whatever an interrupted run added for unfinished files is removed; they start over below
+        for key, chunk_ids in self.partial.items():
+            stale_ids.extend(chunk_ids)
+            self.files.pop(key, None)
+            released.add(key)
+        self.partial = {}
+        for path in doc_paths:
+            key = manifest_key(path)
+            if key in requested or not os.path.exists(key):
+                continue
+            requested.add(key)
+            entry = self.files.get(key)
+            if self._is_unchanged(key, entry):
+                unchanged += 1
+                continue
+            if entry is not None:
+                stale_ids.extend(entry["chunk_ids"])
+                del self.files[key]
+                released.add(key)
+            to_ingest.append(key)
+
+        for key in list(self.files):
+            if (prune and key not in requested) or not os.path.exists(key):
+                stale_ids.extend(self.files.pop(key)["chunk_ids"])
+                released.add(key)
+
+        # A file whose chunks were dropped as duplicates of a released file's chunks would
+        # lose that content, so it is re-ingested as well (and may release further files)
+        while released:
+            dependents = [key for key, entry in self.files.items()
+                          if released.intersection(entry.get("dedup_sources", ()))]
+            for key in dependents:
+                stale_ids.extend(self.files.pop(key)["chunk_ids"])
+                to_ingest.append(key)
+                if key in requested:
+                    unchanged -= 1
+            released = set(dependents)
+        return to_ingest, stale_ids, unchanged
+
+    def fingerprints(self) -> Iterator[Tuple[str, list]]:
+        for key, entry in self.files.items():
+            for fingerprint in entry.get("fingerprints", ()):
+                yield key, fingerprint
+
+    def record(self, file_path: str, size: int, mtime: float, sha256: str, chunk_ids: List[str],
+               fingerprints: Optional[list] = None, dedup_sources: Optional[List[str]] = None):
+        entry = {
+            "size": size,
+            "mtime": mtime,
+            "sha256": sha256,
+            "chunk_ids": chunk_ids,
+        }
+        # Dedup fingerprints of the kept chunks, and the files holding the chunks that were dropped
+        if fingerprints:
+            entry["fingerprints"] = fingerprints
+        if dedup_sources:
+            entry["dedup_sources"] = dedup_sources
+        self.files[manifest_key(file_path)] = entry
@@ -0,0 +1,95 @@
+import argparse
+import time
+from typing import List, Optional
+import numpy as np
+from kb.index_config import index_type_of, reconstruct_vectors, storage_of, vector_bytes
+from kb.knowledge_base import KnowledgeBase
+
+REPORT_QUERIES = 200
+# Query vectors are sampled stored vectors plus noise of this fraction of their norm
+QUERY_NOISE = 0.1
+EXACT_BLOCK_ROWS = 65536
+
+
+def _exact_neighbours(base, queries: np.ndarray, k: int) -> np.ndarray:
+    # Brute-force ground truth, scanned in blocks so memory-mapped vectors are never fully loaded
+    best_d = np.full((len(queries), k), np.inf, dtype=np.float32)
+    best_i = np.full((len(queries), k), -1, dtype=np.int64)
+    for start in range(0, len(base), EXACT_BLOCK_ROWS):
+        block = np.asarray(base[start:start + EXACT_BLOCK_ROWS], dtype=np.float32)
+        d = (queries ** 2).sum(axis=1)[:, None] - 2 * queries @ block.T + (block ** 2).sum(axis=1)[None, :]
+        all_d = np.concatenate([best_d, d], axis=1)
+        all_i = np.concatenate([best_i, np.arange(start, start + len(block))[None, :].repeat(len(queries), 0)], axis=1)
+        order = np.argsort(all_d, axis=1, kind="stable")[:, :k]
+        best_d, best_i = np.take_along_axis(all_d, order, 1), np.take_along_axis(all_i, order, 1)
+    return best_i
+
+
+def _recall(found: np.ndarray, truth: np.ndarray) -> float:
+    hits = sum(len(set(row[row >= 0].tolist()) & set(expected.tolist())) for row, expected in zip(found, truth))
+    return hits / truth.size
+
+
+def storage_report(kb: KnowledgeBase, n_queries: int = REPORT_QUERIES, k: int = 3, seed: int = 0) -> dict:
+    # Memory of the index as stored versus float32, and recall@k / per-query latency of the
+    # compact index with and without full-precision re-scoring
+    report = {"agent": kb.agent_name, "vectors": 0}
+    if kb.vectorstore is None or not kb.vectorstore.index.ntotal:
+        return report
+    index = kb.vectorstore.index
+    count, dim = index.ntotal, index.d
+    report.update({
+        "index_type": index_type_of(index),
+        "storage": storage_of(index),
+        "vectors": count,
+        "vector_mb": round(count * vector_bytes(index) / 2 ** 20, 2),
+        "float32_mb": round(count * dim * 4 / 2 ** 20, 2),
+        "exact_file_mb": round(len(kb.exact_vectors) * dim * 4 / 2 ** 20, 2) if kb.exact_vectors is not None else 0.0,
+    })
+
+    rng = np.random.default_rng(seed)
+    rows = np.sort(rng.choice(count, size=min(n_queries, count), replace=False))
+    if kb.exact_vectors is not None:
+        base = kb.exact_vectors.rows
+    elif report["storage"] == "float32" and report["index_type"] != "ivf_pq":
+        base = reconstruct_vectors(index, list(range(count)))
+    else:
+        return report  # no full-precision vectors to measure recall against
+    sample = np.asarray(base[rows], dtype=np.float32)
+    norms = np.linalg.norm(sample, axis=1, keepdims=True)
+    queries = (sample + rng.standard_normal(sample.shape) * norms * QUERY_NOISE / np.sqrt(dim)).astype(np.float32)
+    truth = _exact_neighbours(base, queries, k)
+
+    started = time.perf_counter()
+    _, compact_positions = index.search(queries, k)
+    compact_ms = (time.perf_counter() - started) * 1000 / len(queries)
+    report.update({"recall": round(_recall(compact_positions, truth), 4), "query_ms": round(compact_ms, 4)})
+    if kb.exact_vectors is not None:
+        started = time.perf_counter()
+        _, rescored_positions = kb.search_vectors(queries, k)
+        rescored_ms = (time.perf_counter() - started) * 1000 / len(queries)
+        report.update({"rescored_recall": round(_recall(rescored_positions, truth), 4),
+                       "rescored_query_ms": round(rescored_ms, 4)})
+    return report
+
+
+def main(argv: Optional[List[str]] = None):
+    from database.db_manager import DBManager
+    parser = argparse.ArgumentParser(description="Vector storage memory, recall and latency per agent")
+    parser.add_argument("agents", nargs="*", help="agent names (default: all)")
+    parser.add_argument("--queries", type=int, default=REPORT_QUERIES)
+    parser.add_argument("-k", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    db = DBManager()
+    columns = ["agent", "index_type", "storage", "vectors", "vector_mb", "float32_mb", "exact_file_mb",
+               "recall", "query_ms", "rescored_recall", "rescored_query_ms"]
+    print("\t".join(columns))
+    for name in args.agents or db.list_agents():
+        kb = KnowledgeBase(name, index_config=db.load_index_config(name), read_only=True)
+        report = storage_report(kb, n_queries=args.queries, k=args.k)
+        print("\t".join(str(report.get(column, "-")) for column in columns))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,30 @@
-from agents.agent_manager import AgentManager
-from ui.app_ui import launch_interface
+from utils.startup import get_startup_timer, startup_phase
+import argparse
 
 def main():
-    manager = AgentManager()
-    launch_interface(manager)
+    parser = argparse.ArgumentParser(description="LangChain Modular AI Chat App")
+    parser.add_argument("--server", action="store_true", help="run the headless HTTP/WebSocket API instead of the UI")
+    parser.add_argument("--host", default=None)
+    parser.add_argument("--port", type=int, default=None)
+    parser.add_argument("--startup-report", action="store_true", help="print launch phase timings once an agent is ready")
+    args = parser.parse_args()
+    if args.startup_report:
+        get_startup_timer().enabled = True
+
+    # Heavy modules (langchain, FAISS, the embedding model) load lazily, mostly on the warm-up thread
+    with startup_phase("import agent manager"):
+        from agents.agent_manager import AgentManager
+    with startup_phase("AgentManager()"):
+        manager = AgentManager()
+    # Resumes ingestion jobs left queued or interrupted by a previous run
+    manager.ingest_queue.start()
+    if args.server:
+        from server.api_server import SERVER_HOST, SERVER_PORT, run_server
+        run_server(manager, host=args.host or SERVER_HOST, port=args.port or SERVER_PORT)
+    else:
+        with startup_phase("import UI"):
+            from ui.app_ui import launch_interface
+        launch_interface(manager)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,220 @@
+import asyncio
+import json
+import os
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import AsyncIterator, Optional
+from aiohttp import WSMsgType, web
+from agents.agent_cache import AgentCache
+from agents.agent_manager import AgentManager
+from chat.chat_handler import ChatHandler
+from chat.history_store import HISTORY_PAGE_SIZE, HistoryStore
+from utils.metrics import get_metrics, observe
+
+SERVER_HOST = os.getenv("SERVER_HOST", "127.0.0.1")
+SERVER_PORT = int(os.getenv("SERVER_PORT", "8080"))
+# Threads for blocking SQLite, FAISS and context-building work
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", "16"))
+# Chat turns in flight at once; further turns wait for a slot
+SERVER_MAX_CHATS = int(os.getenv("SERVER_MAX_CHATS", "512"))
+# Live chat sessions kept in memory (history page, summary state)
+SERVER_SESSION_CACHE = int(os.getenv("SERVER_SESSION_CACHE", "4096"))
+SERVER_SESSION_TTL = float(os.getenv("SERVER_SESSION_TTL", "3600"))
+
+
+# Headless HTTP/WebSocket front end over the same AgentManager, ChatHandler and KnowledgeBase
+# the desktop UI uses. LLM tokens stream on the event loop; everything that blocks runs in a
+# bounded thread pool, and ingestion runs as background jobs (agents.ingest_queue).
+class ApiServer:
+    def __init__(self, manager: AgentManager, history_db: str = "chat_history.db", workers: int = SERVER_WORKERS,
+                 max_chats: int = SERVER_MAX_CHATS, session_cache: int = SERVER_SESSION_CACHE,
+                 session_ttl: float = SERVER_SESSION_TTL):
+        self.manager = manager
+        # One connection shared by every session instead of one per ChatHandler
+        self.store = HistoryStore(history_db)
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="api")
+        self.sessions: AgentCache[ChatHandler] = AgentCache(max_size=session_cache, idle_ttl=session_ttl)
+        self.max_chats = max_chats
+        self.chat_slots: Optional[asyncio.Semaphore] = None
+        # Serializes turns within one session; entries vanish once no turn holds them
+        self.session_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+        self.websockets = weakref.WeakSet()
+
+    def app(self) -> web.Application:
+        app = web.Application(middlewares=[self.error_middleware])
+        app.add_routes([
+            web.get("/health", self.health),
+            web.get("/metrics", self.metrics),
+            web.get("/agents", self.list_agents),
+            web.post("/agents/{name}/chat", self.chat),
+            web.get("/agents/{name}/chat/ws", self.chat_ws),
+            web.get("/agents/{name}/history", self.history),
+            web.delete("/agents/{name}/history", self.clear_history),
+            web.post("/agents/{name}/query", self.query),
+            web.post("/agents/{name}/ingest", self.ingest),
+            web.get("/jobs/{id}", self.job),
+            web.delete("/jobs/{id}", self.cancel_job),
+        ])
+        app.on_startup.append(self.on_startup)
+        app.on_shutdown.append(self.on_shutdown)
+        return app
+
+    async def on_startup(self, app: web.Application):
+        self.chat_slots = asyncio.Semaphore(self.max_chats)
+
+    async def on_shutdown(self, app: web.Application):
+        for ws in list(self.websockets):
+            await ws.close(code=1001, message=b"Server shutdown")
+        self.pool.shutdown(wait=False)
+        await asyncio.get_running_loop().run_in_executor(None, self.manager.ingest_queue.stop, 60)
+        self.store.close()
+
+    @web.middleware
+    async def error_middleware(self, request: web.Request, handler):
+        try:
+            return await handler(request)
+        except web.HTTPException:
+            raise
+        except (ValueError, KeyError, json.JSONDecodeError) as e:
+            return web.json_response({"error": str(e)}, status=400)
+        except Exception as e:
+            print(f"[ERROR] {request.method} {request.path}: {e}")
+            return web.json_response({"error": "internal error"}, status=500)
+
+    async def run_blocking(self, fn, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(self.pool, partial(fn, *args, **kwargs))
+
+    async def _agent(self, name: str):
+        try:
+            return await self.run_blocking(self.manager.get_agent, name)
+        except ValueError:
+            raise web.HTTPNotFound(text=json.dumps({"error": f"Agent '{name}' not found"}),
+                                   content_type="application/json")
+
+    async def session(self, name: str, session_id: Optional[str]) -> ChatHandler:
+        agent = await self._agent(name)
+        key = f"{name}#{session_id}" if session_id else name
+        handler = await self.run_blocking(
+            self.sessions.get_or_create, key,
+            lambda: ChatHandler(agent, session_id=session_id, store=self.store),
+        )
+        # Picks up agents rebuilt after ingestion or a prompt edit
+        handler.agent = agent
+        return handler
+
+    def _session_lock(self, handler: ChatHandler) -> asyncio.Lock:
+        lock = self.session_locks.get(handler.agent_id)
+        if lock is None:
+            lock = self.session_locks[handler.agent_id] = asyncio.Lock()
+        return lock
+
+    async def chat_turn(self, handler: ChatHandler, message: str) -> AsyncIterator[str]:
+        async with self.chat_slots, self._session_lock(handler):
+            started = time.perf_counter()
+            async for token in handler.astream_message(message, executor=self.pool):
+                yield token
+            observe("stage_seconds", time.perf_counter() - started, stage="api.chat_turn", agent=handler.agent.name)
+
+    @staticmethod
+    async def _send(ws: web.WebSocketResponse, payload: dict):
+        # A client that went away mid-reply must not abort the turn, which is still saved
+        if ws.closed:
+            return
+        try:
+            await ws.send_json(payload)
+        except ConnectionResetError:
+            pass
+
+    async def health(self, request: web.Request) -> web.Response:
+        return web.json_response({"status": "ok", "sessions": self.sessions.stats()})
+
+    async def metrics(self, request: web.Request) -> web.Response:
+        return web.Response(text=get_metrics().prometheus_text(), content_type="text/plain")
+
+    async def list_agents(self, request: web.Request) -> web.Response:
+        return web.json_response({"agents": await self.run_blocking(self.manager.list_agents)})
+
+    async def chat(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        handler = await self.session(request.match_info["name"], body.get("session_id"))
+        parts = [token async for token in self.chat_turn(handler, body["message"])]
+        return web.json_response({"response": "".join(parts), "prompt_tokens": handler.last_prompt_tokens})
+
+    async def chat_ws(self, request: web.Request) -> web.WebSocketResponse:
+        # Each incoming message ({"message": ...} or plain text) is answered with "token"
+        # events followed by "done" (or "error")
+        handler = await self.session(request.match_info["name"], request.query.get("session_id"))
+        ws = web.WebSocketResponse(heartbeat=30)
+        await ws.prepare(request)
+        self.websockets.add(ws)
+        async for msg in ws:
+            if msg.type != WSMsgType.TEXT:
+                continue
+            try:
+                message = json.loads(msg.data)["message"] if msg.data.lstrip().startswith("{") else msg.data
+                handler.agent = await self._agent(request.match_info["name"])
+                parts = []
+                async for token in self.chat_turn(handler, message):
+                    parts.append(token)
+                    await self._send(ws, {"type": "token", "text": token})
+                await self._send(ws, {"type": "done", "response": "".join(parts)})
+            except Exception as e:
+                print(f"[ERROR] WebSocket chat with {handler.agent_id} failed: {e}")
+                await self._send(ws, {"type": "error", "error": str(e)})
+        return ws
+
+    async def history(self, request: web.Request) -> web.Response:
+        name = request.match_info["name"]
+        session_id = request.query.get("session_id")
+        agent_id = f"{name}#{session_id}" if session_id else name
+        before = None
+        if "before_timestamp" in request.query:
+            before = {"timestamp": request.query["before_timestamp"], "seq": int(request.query["before_seq"])}
+        limit = min(int(request.query.get("limit", HISTORY_PAGE_SIZE)), 500)
+        page, has_more = await self.run_blocking(self.store.load_page, agent_id, before=before, limit=limit)
+        return web.json_response({"messages": page, "has_more": has_more})
+
+    async def clear_history(self, request: web.Request) -> web.Response:
+        handler = await self.session(request.match_info["name"], request.query.get("session_id"))
+        async with self._session_lock(handler):
+            await self.run_blocking(handler.clear_history)
+        return web.json_response({"cleared": handler.agent_id})
+
+    async def query(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        agent = await self._agent(request.match_info["name"])
+        queries = body.get("queries") or [body["query"]]
+        results = await self.run_blocking(agent.vector_store.query_batch, queries, k=int(body.get("k", 3)))
+        return web.json_response({"results": [
+            [{"content": doc.page_content, "metadata": doc.metadata, "distance": score} for doc, score in hits]
+            for hits in results
+        ]})
+
+    async def ingest(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        name = request.match_info["name"]
+        await self._agent(name)
+        if not os.path.isdir(body["path"]):
+            raise ValueError(f"Unsupported ingest path: {body['path']}")
+        job_id = await self.run_blocking(self.manager.ingest_queue.submit, name, body["path"],
+                                         prune=body.get("prune", True))
+        return web.json_response({"job_id": job_id}, status=202)
+
+    async def job(self, request: web.Request) -> web.Response:
+        job = await self.run_blocking(self.manager.ingest_queue.job, int(request.match_info["id"]))
+        if job is None:
+            raise web.HTTPNotFound(text=json.dumps({"error": "Job not found"}), content_type="application/json")
+        return web.json_response(job)
+
+    async def cancel_job(self, request: web.Request) -> web.Response:
+        job_id = int(request.match_info["id"])
+        cancelled = await self.run_blocking(self.manager.ingest_queue.cancel, job_id)
+        return web.json_response({"job_id": job_id, "cancel_requested": cancelled})
+
+
+def run_server(manager: AgentManager, host: str = SERVER_HOST, port: int = SERVER_PORT):
+    server = ApiServer(manager)
+    print(f"API server listening on http://{host}:{port}")
+    web.run_app(server.app(), host=host, port=port, print=None)
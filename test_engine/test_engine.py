@@ -0,0 +1,170 @@
+import asyncio
+import json
+import os
+import re
+import time
+from functools import partial
+from typing import List, Optional
+from langchain.prompts import PromptTemplate
+from database.db_manager import DBManager
+
+TEST_CONCURRENCY = int(os.getenv("TEST_CONCURRENCY", "8"))
+# LLM calls per second across one generate/grade run; 0 disables the limiter
+TEST_RATE_LIMIT = float(os.getenv("TEST_RATE_LIMIT", "4"))
+TEST_CONTEXT_K = 3
+QUESTION_PROMPT = PromptTemplate.from_template(
+    "You are writing question {number} of {total} for a test on \"{subject}\". Base the question only on "
+    "the material below, and make it answerable in a few sentences.\n\nMaterial:\n{context}\n\n"
+    "Reply with JSON only, in the form {{\"question\": \"...\", \"answer\": \"...\"}} where answer is a "
+    "model answer."
+)
+GRADE_PROMPT = PromptTemplate.from_template(
+    "Grade a student's answer on a test about \"{subject}\".\n\nQuestion: {question}\n"
+    "Model answer: {reference}\nReference material:\n{context}\n\nStudent answer: {answer}\n\n"
+    "Reply with JSON only, in the form {{\"score\": <number from 0 to 1>, \"feedback\": \"...\"}}."
+)
+_JSON_OBJECT = re.compile(r"\{.*\}", re.DOTALL)
+
+
+def parse_json_reply(text: Optional[str]) -> Optional[dict]:
+    # Models often wrap the JSON in prose or code fences
+    if not text:
+        return None
+    match = _JSON_OBJECT.search(text)
+    if not match:
+        return None
+    try:
+        return json.loads(match.group(0))
+    except json.JSONDecodeError:
+        return None
+
+
+# Token bucket: `rate` calls per second on average, with bursts of up to `burst` calls
+class RateLimiter:
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        self.rate = rate
+        self.capacity = burst or max(1, int(rate))
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+# Generates and grades tests from an agent's knowledge base. Context for every question is
+# retrieved in one batched query, the LLM calls run concurrently (bounded by a semaphore
+# and a rate limiter), and each graded test is saved as one row with its overall score.
+class TestEngine:
+    def __init__(self, agent, db: Optional[DBManager] = None, concurrency: int = TEST_CONCURRENCY,
+                 rate_limit: float = TEST_RATE_LIMIT):
+        self.agent = agent
+        self.db = db or DBManager()
+        self.concurrency = concurrency
+        self.rate_limit = rate_limit
+
+    async def _invoke_all(self, prompts: List) -> List[Optional[str]]:
+        # Created per run: asyncio primitives are bound to the loop they are first used on
+        semaphore = asyncio.Semaphore(self.concurrency)
+        limiter = RateLimiter(self.rate_limit)
+
+        async def invoke(prompt):
+            async with semaphore:
+                await limiter.acquire()
+                try:
+                    return (await self.agent.llm.ainvoke(prompt)).content
+                except Exception as e:
+                    print(f"[WARN] Test engine LLM call failed for {self.agent.name}: {e}")
+                    return None
+
+        return await asyncio.gather(*(invoke(prompt) for prompt in prompts))
+
+    async def agenerate_test(self, subject: str, n_questions: int) -> List[dict]:
+        started = time.perf_counter()
+        # One retrieval for the whole test; MMR spreads the questions over distinct chunks.
+        # Retrieval is synchronous, so it runs in the default executor off the event loop.
+        hits = (await asyncio.get_running_loop().run_in_executor(None, partial(
+            self.agent.vector_store.query_batch, [subject], k=n_questions, mmr=True, fetch_k=max(20, 4 * n_questions)
+        )))[0]
+        chunks = [doc.page_content for doc, _ in hits] or [""]
+        contexts = [chunks[i % len(chunks)] for i in range(n_questions)]
+        prompts = [
+            QUESTION_PROMPT.format(number=i + 1, total=n_questions, subject=subject, context=context)
+            for i, context in enumerate(contexts)
+        ]
+        replies = await self._invoke_all(prompts)
+
+        questions = []
+        for reply, context in zip(replies, contexts):
+            parsed = parse_json_reply(reply)
+            if not parsed or not parsed.get("question"):
+                continue
+            questions.append({
+                "question": str(parsed["question"]).strip(),
+                "reference": str(parsed.get("answer", "")).strip(),
+                "context": context,
+            })
+        print(f"Generated {len(questions)}/{n_questions} questions on '{subject}' "
+              f"in {time.perf_counter() - started:.1f}s")
+        return questions
+
+    async def agrade_test(self, subject: str, questions: List[dict], answers: List[str],
+                          save: bool = True) -> dict:
+        started = time.perf_counter()
+        # Questions generated by this engine carry their source chunk; others are looked up in one batch
+        missing = [i for i, q in enumerate(questions) if not q.get("context")]
+        retrieved = await asyncio.get_running_loop().run_in_executor(None, partial(
+            self.agent.vector_store.query_batch, [questions[i]["question"] for i in missing], k=TEST_CONTEXT_K
+        ))
+        contexts = [q.get("context", "") for q in questions]
+        for i, hits in zip(missing, retrieved):
+            contexts[i] = "\n".join(doc.page_content for doc, _ in hits)
+
+        prompts = [
+            GRADE_PROMPT.format(subject=subject, question=q["question"], reference=q.get("reference") or "(none)",
+                                context=context, answer=answer or "(no answer)")
+            for q, answer, context in zip(questions, answers, contexts)
+        ]
+        replies = await self._invoke_all(prompts)
+
+        results = []
+        for q, answer, reply in zip(questions, answers, replies):
+            parsed = parse_json_reply(reply) or {}
+            try:
+                score = min(1.0, max(0.0, float(parsed.get("score"))))
+            except (TypeError, ValueError):
+                score = None
+            results.append({"question": q["question"], "reference": q.get("reference", ""), "answer": answer,
+                            "score": score, "feedback": parsed.get("feedback", "")})
+
+        # Answers that got no usable grade are kept but left out of the overall score
+        graded = [r["score"] for r in results if r["score"] is not None]
+        total = 100 * sum(graded) / len(graded) if graded else None
+        test_id = None
+        if save:
+            test_id = self.db.save_test_result(
+                self.agent.name, subject,
+                json.dumps([{k: r[k] for k in ("question", "reference", "score", "feedback")} for r in results]),
+                json.dumps([r["answer"] for r in results]),
+                total,
+            )
+        score_text = f"{total:.1f}" if total is not None else "n/a"
+        print(f"Graded {len(graded)}/{len(results)} answers on '{subject}' "
+              f"in {time.perf_counter() - started:.1f}s (score {score_text})")
+        return {"id": test_id, "subject": subject, "score": total, "results": results}
+
+    def generate_test(self, subject: str, n_questions: int = 10) -> List[dict]:
+        return asyncio.run(self.agenerate_test(subject, n_questions))
+
+    def grade_test(self, subject: str, questions: List[dict], answers: List[str], save: bool = True) -> dict:
+        return asyncio.run(self.agrade_test(subject, questions, answers, save=save))
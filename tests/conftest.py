@@ -0,0 +1,22 @@
+import os
+
+# The fake embedder must be selected before kb.embeddings is imported
+os.environ.setdefault("EMBEDDING_MODEL", "fake-embedding")
+
+import pytest
+from benchmarks.fakes import install_fakes
+
+install_fakes()
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    # Indexes, manifests and databases use paths relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def corpus(workdir):
+    from benchmarks.corpus import build_corpus
+    return build_corpus("docs", 4)
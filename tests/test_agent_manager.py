@@ -0,0 +1,47 @@
+import os
+from agents.agent_manager import AgentManager
+from benchmarks.fakes import BENCH_PROMPT, FAKE_LLM
+from kb.knowledge_base import KnowledgeBase
+
+
+def test_empty_folder_keeps_index(corpus):
+    os.makedirs("agents_data")
+    manager = AgentManager()
+    manager.create_agent("agent", BENCH_PROMPT, FAKE_LLM)
+    stats = manager.ingest_folder("agent", "docs")
+    assert stats["chunks"] > 0
+
+    os.makedirs("empty")
+    assert manager.ingest_folder("agent", "empty")["files"] == 0
+    assert KnowledgeBase("agent", read_only=True).vectorstore.index.ntotal == stats["chunks"]
+    manager.db.close()
+
+
+def test_astream_keeps_cache_work_off_the_event_loop(workdir):
+    import asyncio
+    import threading
+    from agents.response_cache import ResponseCache
+
+    threads = []
+
+    class RecordingCache(ResponseCache):
+        def lookup(self, *args, **kwargs):
+            threads.append(threading.get_ident())
+            return super().lookup(*args, **kwargs)
+
+        def store(self, *args, **kwargs):
+            threads.append(threading.get_ident())
+            return super().store(*args, **kwargs)
+
+    os.makedirs("agents_data")
+    manager = AgentManager(response_cache=RecordingCache(db_path="cache.db"))
+    manager.create_agent("agent", BENCH_PROMPT, FAKE_LLM)
+    agent = manager.get_agent("agent")
+
+    async def collect():
+        return "".join([token async for token in agent.astream("What is a limit?", context="")])
+
+    first, second = asyncio.run(collect()), asyncio.run(collect())
+    assert first and second == first
+    assert len(threads) == 3 and threading.get_ident() not in threads
+    manager.db.close()
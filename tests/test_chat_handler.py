@@ -0,0 +1,63 @@
+import pytest
+from chat.chat_handler import ChatHandler
+
+
+class StubAgent:
+    name = "agent"
+    base_prompt = "{context}\n{input}"
+
+    def __init__(self, tokens, error=None):
+        self.tokens = tokens
+        self.error = error
+        self.summaries = 0
+
+    def stream(self, user_input, context=None):
+        yield from self.tokens
+        if self.error:
+            raise self.error
+
+    def respond(self, user_input, context=None):
+        return "".join(self.tokens)
+
+    def summarize(self, summary, transcript):
+        self.summaries += 1
+        return "Earlier turns covered limits."
+
+
+def saved_roles(handler):
+    messages, _ = handler.store.load_page(handler.agent_id)
+    return [(msg["role"], msg["content"]) for msg in messages]
+
+
+def test_stream_saves_both_turns(workdir):
+    handler = ChatHandler(StubAgent(["Hel", "lo"]))
+    assert "".join(handler.stream_message("hi")) == "Hello"
+    assert saved_roles(handler) == [("user", "hi"), ("agent", "Hello")]
+
+
+def test_user_turn_kept_when_stream_fails(workdir):
+    handler = ChatHandler(StubAgent(["partial"], error=RuntimeError("provider down")))
+    with pytest.raises(RuntimeError):
+        list(handler.stream_message("hi"))
+    assert saved_roles(handler) == [("user", "hi")]
+
+
+def test_user_turn_kept_when_stream_abandoned(workdir):
+    handler = ChatHandler(StubAgent(["a", "b", "c"]))
+    stream = handler.stream_message("hi")
+    next(stream)
+    stream.close()
+    assert saved_roles(handler) == [("user", "hi")]
+    assert ChatHandler(StubAgent([])).history[-1]["content"] == "hi"
+
+
+def test_folding_leaves_room_for_later_turns(workdir):
+    agent = StubAgent(["word " * 40])
+    handler = ChatHandler(agent, context_token_budget=400)
+    for i in range(40):
+        handler.send_message(f"question {i} " + "word " * 20)
+    # Each exchange is ~65 tokens: the window overflows every ~6 turns, not on every turn
+    assert 0 < agent.summaries <= 40 // 3
+    context, tokens = handler.context_builder.build(handler.history, handler.has_more_history, agent.summarize)
+    assert context.startswith("Summary of earlier conversation: Earlier turns covered limits.")
+    assert tokens <= 400
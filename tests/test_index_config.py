@@ -0,0 +1,24 @@
+import numpy as np
+import pytest
+from kb.index_config import build_index, resolve_config, vector_bytes
+
+DIM = 64
+
+
+@pytest.mark.parametrize("index_type", ["flat", "hnsw", "ivf_flat"])
+@pytest.mark.parametrize("storage, ratio", [("float32", 1), ("float16", 2), ("int8", 4)])
+def test_vector_bytes_reflect_storage(index_type, storage, ratio):
+    vectors = np.random.default_rng(0).random((512, DIM), dtype=np.float32)
+    index = build_index(resolve_config({"index_type": index_type, "storage": storage, "nlist": 4}), vectors)
+    assert vector_bytes(index) == DIM * 4 // ratio
+
+
+def test_storage_report_hnsw_float16(corpus):
+    from kb.knowledge_base import KnowledgeBase
+    from kb.storage_report import storage_report
+    config = {"index_type": "hnsw", "storage": "float16"}
+    KnowledgeBase("agent", index_config=config).ingest_docs(corpus, workers=1)
+    report = storage_report(KnowledgeBase("agent", index_config=config, read_only=True), n_queries=20)
+    assert report["storage"] == "float16"
+    assert report["vector_mb"] == pytest.approx(report["float32_mb"] / 2, abs=0.01)
+    assert report["rescored_recall"] >= report["recall"]
@@ -0,0 +1,133 @@
+import os
+import signal
+import subprocess
+import sys
+import time
+import pytest
+from agents.agent_manager import AgentManager
+from agents.ingest_queue import IngestQueue, process_token
+from benchmarks.fakes import BENCH_PROMPT, FAKE_LLM
+from kb.knowledge_base import KnowledgeBase
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Ingests with embedding slowed down, so the parent can kill it partway through
+KILLED_WORKER = """
+import sys, time
+sys.path.insert(0, {root!r})
+from benchmarks.fakes import install_fakes
+install_fakes()
+from kb.knowledge_base import KnowledgeBase
+embed_and_add = KnowledgeBase._embed_and_add
+KnowledgeBase._embed_and_add = lambda self, *args: (time.sleep(0.2), embed_and_add(self, *args))[1]
+from agents.agent_manager import AgentManager
+manager = AgentManager()
+manager.ingest_queue.start()
+time.sleep(60)
+"""
+
+
+def wait_for(condition, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        result = condition()
+        if result:
+            return result
+        time.sleep(0.05)
+    raise AssertionError("timed out")
+
+
+@pytest.fixture
+def manager(corpus):
+    os.makedirs("agents_data")
+    manager = AgentManager()
+    manager.create_agent("agent", BENCH_PROMPT, FAKE_LLM)
+    yield manager
+    manager.ingest_queue.stop(timeout=10)
+
+
+def finished(manager, job_id):
+    job = manager.ingest_queue.job(job_id)
+    return job if job["status"] not in ("queued", "running") else None
+
+
+def test_job_runs_to_done(manager):
+    job_id = manager.ingest_queue.submit("agent", "docs", workers=1, duty_cycle=1.0, nice=0)
+    job = wait_for(lambda: finished(manager, job_id))
+    assert job["status"] == "done", job["error"]
+    assert job["progress"]["stage"] == "done"
+    assert job["progress"]["files_done"] == job["progress"]["files_total"] == 4
+    assert KnowledgeBase("agent", read_only=True).vectorstore.index.ntotal == job["progress"]["chunks"]
+
+
+def test_cancel_queued_and_running_jobs(manager, monkeypatch):
+    embed_and_add = KnowledgeBase._embed_and_add
+    monkeypatch.setattr(KnowledgeBase, "_embed_and_add",
+                        lambda self, *args: (time.sleep(0.1), embed_and_add(self, *args))[1])
+    running = manager.ingest_queue.submit("agent", "docs", workers=1, batch_size=4, duty_cycle=1.0, nice=0)
+    queued = manager.ingest_queue.submit("agent", "docs", workers=1, duty_cycle=1.0, nice=0)
+    wait_for(lambda: manager.ingest_queue.job(running)["progress"].get("chunks"))
+    assert manager.ingest_queue.cancel(queued)
+    assert manager.ingest_queue.job(queued)["status"] == "cancelled"
+    assert manager.ingest_queue.cancel(running)
+    assert wait_for(lambda: finished(manager, running))["status"] == "cancelled"
+
+    # Files cut short by the cancel are redone by the next job
+    monkeypatch.setattr(KnowledgeBase, "_embed_and_add", embed_and_add)
+    rerun = manager.ingest_queue.submit("agent", "docs", workers=1, duty_cycle=1.0, nice=0)
+    assert wait_for(lambda: finished(manager, rerun))["status"] == "done"
+    full = KnowledgeBase("fresh").ingest_docs(sorted(os.path.join("docs", f) for f in os.listdir("docs")), workers=1)
+    assert KnowledgeBase("agent", read_only=True).vectorstore.index.ntotal == full["chunks"]
+
+
+def test_stale_owner_job_is_requeued(manager):
+    db = manager.db
+    # Same pid as this process but another start time: a previous run in a restarted container
+    stale = db.enqueue_ingest_job("agent", "docs", {"workers": 1})
+    assert db.claim_ingest_job(f"{os.getpid()}:0.000", os.getpid())["id"] == stale
+    queue = manager.ingest_queue
+    assert queue.owner == process_token() != f"{os.getpid()}:0.000"
+    queue.start()
+    assert wait_for(lambda: finished(manager, stale))["status"] == "done"
+
+
+def test_own_untracked_job_is_requeued(manager):
+    db = manager.db
+    job_id = db.enqueue_ingest_job("agent", "docs", {"workers": 1})
+    db.claim_ingest_job(process_token(), os.getpid())
+    # A queue in this process that is not running the job treats it as orphaned
+    IngestQueue(manager).start()
+    assert wait_for(lambda: finished(manager, job_id))["status"] == "done"
+
+
+def test_job_resumes_after_kill(manager, workdir):
+    job_id = manager.db.enqueue_ingest_job("agent", "docs", {"workers": 1, "batch_size": 4})
+    env = {**os.environ, "INGEST_CHECKPOINT_SECONDS": "0.1"}
+    worker = subprocess.Popen([sys.executable, "-c", KILLED_WORKER.format(root=REPO_ROOT)], cwd=workdir, env=env,
+                              stdout=subprocess.DEVNULL)
+    try:
+        wait_for(lambda: manager.ingest_queue.job(job_id)["progress"].get("files_done"))
+        assert manager.ingest_queue.job(job_id)["status"] == "running"
+    finally:
+        worker.send_signal(signal.SIGKILL)
+        worker.wait()
+
+    manager.ingest_queue.start()
+    job = wait_for(lambda: finished(manager, job_id))
+    assert job["status"] == "done", job["error"]
+    full = KnowledgeBase("fresh").ingest_docs(sorted(os.path.join("docs", f) for f in os.listdir("docs")), workers=1)
+    assert KnowledgeBase("agent", read_only=True).vectorstore.index.ntotal == full["chunks"]
+
+
+def test_requeue_clears_cancel_request(manager):
+    db = manager.db
+    resumed = db.enqueue_ingest_job("agent", "docs", {"workers": 1})
+    db.claim_ingest_job(process_token(), os.getpid())
+    db.requeue_ingest_job(resumed)
+    assert db.load_ingest_job(resumed)["status"] == "queued"
+
+    # Cancelled by the user, then shut down before the worker saw it
+    db.claim_ingest_job(process_token(), os.getpid())
+    assert db.cancel_ingest_job(resumed)
+    db.requeue_ingest_job(resumed)
+    job = db.load_ingest_job(resumed)
+    assert job["status"] == "cancelled" and not job["cancel_requested"]
@@ -0,0 +1,66 @@
+import pytest
+from kb.knowledge_base import KnowledgeBase
+
+CONFIGS = [
+    {"index_type": "flat"},
+    {"index_type": "hnsw"},
+    {"index_type": "ivf_flat", "nlist": 4, "train_sample": 64},
+    {"index_type": "flat", "storage": "float16"},
+    {"index_type": "flat", "storage": "int8", "train_sample": 64},
+]
+
+
+@pytest.mark.parametrize("config", CONFIGS, ids=lambda config: "-".join(map(str, config.values())))
+def test_ingest_then_reingest(corpus, config):
+    kb = KnowledgeBase("agent", index_config=config)
+    first = kb.ingest_docs(corpus, workers=1, batch_size=16)
+    assert first["files"] == len(corpus)
+    assert first["chunks"] > 0
+    total = kb.vectorstore.index.ntotal
+    assert total == first["chunks"]
+
+    # Unchanged files are skipped, and nothing is lost on the way
+    again = KnowledgeBase("agent", index_config=config).ingest_docs(corpus, workers=1, batch_size=16)
+    assert again["unchanged"] == len(corpus)
+    assert again["chunks"] == 0
+
+    # A modified file is re-embedded in place of its old chunks
+    with open(corpus[0], "a", encoding="utf-8") as f:
+        f.write("\n\nAn appended paragraph about eigenvalues and eigenvectors.")
+    kb = KnowledgeBase("agent", index_config=config)
+    changed = kb.ingest_docs(corpus, workers=1, batch_size=16)
+    assert changed["files"] == 1
+    assert changed["removed_chunks"] > 0
+    assert kb.vectorstore.index.ntotal == total - changed["removed_chunks"] + changed["chunks"]
+
+    reader = KnowledgeBase("agent", index_config=config, read_only=True)
+    assert reader.vectorstore.index.ntotal == kb.vectorstore.index.ntotal
+    assert reader.query("eigenvalues and eigenvectors")
+
+
+def test_resume_after_cancel(corpus):
+    class CancelAfterFirstFile:
+        # Checked once before each wait for a loaded file
+        checks = 0
+
+        def is_set(self):
+            self.checks += 1
+            return self.checks > 1
+
+    kb = KnowledgeBase("agent")
+    cancelled = kb.ingest_docs(corpus, workers=1, batch_size=16, cancel=CancelAfterFirstFile())
+    assert cancelled["cancelled"]
+    assert 0 < cancelled["files"] < len(corpus)
+
+    resumed = KnowledgeBase("agent").ingest_docs(corpus, workers=1, batch_size=16)
+    assert not resumed["cancelled"]
+    assert resumed["unchanged"] + resumed["files"] == len(corpus)
+    full = KnowledgeBase("agent-full").ingest_docs(corpus, workers=1, batch_size=16)
+    assert KnowledgeBase("agent").vectorstore.index.ntotal == full["chunks"]
+
+
+def test_ingest_with_loader_processes(corpus):
+    # Loader processes are spawned, so load_and_split and its arguments must pickle
+    stats = KnowledgeBase("agent").ingest_docs(corpus, workers=2, batch_size=16, nice=5)
+    assert stats["files"] == len(corpus)
+    assert KnowledgeBase("agent", read_only=True).vectorstore.index.ntotal == stats["chunks"]
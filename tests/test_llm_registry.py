@@ -0,0 +1,83 @@
+import asyncio
+import threading
+import time
+from agents.llm_registry import ConcurrencyLimit
+
+
+def test_coroutines_never_exceed_limit():
+    limit = ConcurrencyLimit(3)
+    in_flight, peak = 0, 0
+
+    async def call():
+        nonlocal in_flight, peak
+        await limit.acquire_async()
+        try:
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.005)
+            in_flight -= 1
+        finally:
+            limit.release()
+
+    async def main():
+        await asyncio.gather(*(call() for _ in range(200)))
+
+    asyncio.run(main())
+    assert peak == 3
+    assert limit.active == 0
+
+
+def test_cancelled_waiters_do_not_leak_permits():
+    limit = ConcurrencyLimit(1)
+
+    async def main():
+        await limit.acquire_async()
+        waiters = [asyncio.ensure_future(limit.acquire_async()) for _ in range(5)]
+        await asyncio.sleep(0)
+        waiters[1].cancel()
+        limit.release()  # handed to waiters[0]
+        waiters[0].cancel()  # cancelled after the hand-over was scheduled
+        await asyncio.sleep(0.01)
+        for waiter in waiters[2:]:
+            await waiter
+            limit.release()
+
+    asyncio.run(main())
+    assert limit.active == 0 and not limit._waiters
+
+
+def test_threads_and_coroutines_share_the_limit():
+    limit = ConcurrencyLimit(2)
+    lock = threading.Lock()
+    in_flight, peak = [0], [0]
+
+    def work():
+        with lock:
+            in_flight[0] += 1
+            peak[0] = max(peak[0], in_flight[0])
+        time.sleep(0.002)
+        with lock:
+            in_flight[0] -= 1
+
+    def thread_calls():
+        for _ in range(20):
+            with limit:
+                work()
+
+    async def coroutine_calls():
+        async def call():
+            await limit.acquire_async()
+            try:
+                await asyncio.to_thread(work)
+            finally:
+                limit.release()
+        await asyncio.gather(*(call() for _ in range(40)))
+
+    threads = [threading.Thread(target=thread_calls) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    asyncio.run(coroutine_calls())
+    for thread in threads:
+        thread.join()
+    assert peak[0] <= 2
+    assert limit.active == 0
@@ -0,0 +1,31 @@
+from langchain_core.documents import Document
+from kb.docstore import LazyPositionMap, SQLiteDocstore
+from kb.embedding_cache import EmbeddingCache
+from utils.helpers import SQL_BATCH_SIZE, sqlite_connect
+
+# Enough keys to need several IN (...) batches
+N_KEYS = 2 * SQL_BATCH_SIZE + 7
+
+
+def test_sqlite_connect_uses_wal(workdir):
+    conn = sqlite_connect("nested/dir/app.db")
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    conn.close()
+
+
+def test_docstore_batched_lookups(workdir):
+    docstore = SQLiteDocstore("docstore.sqlite")
+    ids = [f"doc-{i}" for i in range(N_KEYS)]
+    docstore.add({doc_id: Document(page_content=doc_id) for doc_id in ids})
+    docstore.save_positions(dict(enumerate(ids)))
+    assert [doc.page_content for doc in docstore.mget(ids + ["missing"])[:-1]] == ids
+    assert docstore.mget(["missing"]) == [None]
+    assert LazyPositionMap(docstore).many(list(range(N_KEYS))) == ids
+    docstore.close()
+
+
+def test_embedding_cache_batched_lookups(workdir):
+    cache = EmbeddingCache("cache.db")
+    vectors = {f"key-{i}": [float(i), 0.5] for i in range(N_KEYS)}
+    cache.put_many(vectors)
+    assert cache.get_many(list(vectors)) == vectors
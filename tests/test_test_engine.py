@@ -0,0 +1,40 @@
+from langchain_core.documents import Document
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from database.db_manager import DBManager
+from test_engine import test_engine
+
+
+class StubStore:
+    def query_batch(self, queries, k=3, **kwargs):
+        return [[(Document(page_content=f"notes on {query}"), 0.0)] for query in queries]
+
+
+class StubAgent:
+    name = "agent"
+    vector_store = StubStore()
+
+    def __init__(self, replies):
+        self.llm = FakeListChatModel(responses=replies)
+
+
+def test_graded_test_saved_as_one_row(workdir):
+    db = DBManager("app.db")
+    engine = test_engine.TestEngine(StubAgent([
+        '{"question": "What is a limit?", "answer": "The value approached."}',
+        '{"question": "What is a derivative?", "answer": "A rate of change."}',
+    ]), db=db, concurrency=1, rate_limit=0)
+    questions = engine.generate_test("calculus", 2)
+    assert [q["question"] for q in questions] == ["What is a limit?", "What is a derivative?"]
+
+    engine.agent.llm = FakeListChatModel(responses=['{"score": 0.5, "feedback": "Partly."}', "no grade here"])
+    graded = engine.grade_test("calculus", questions, ["It approaches", ""])
+    assert graded["score"] == 50.0
+
+    saved = db.load_test_results("agent")
+    assert len(saved) == 1
+    assert saved[0]["id"] == graded["id"]
+    assert saved[0]["score"] == 50.0
+    assert saved[0]["answers"] == ["It approaches", ""]
+    # The ungraded answer is kept, with no score
+    assert [q["score"] for q in saved[0]["questions"]] == [0.5, None]
+    db.close()
@@ -13,6 +13,7 @@ class AgentEditor(QDialog):
         self.setWindowTitle("Edit Agent" if edit_mode else "Create New Agent")
         self.setMinimumWidth(400)
         self.folder_path = ""
+        self.job_id = None  # background ingestion job started by _create_agent
 
         self._build_ui()
         if edit_mode and agent_name:
@@ -77,10 +78,12 @@ class AgentEditor(QDialog):
             self.agent_manager.create_agent(
                 name=name,
                 base_prompt=prompt,
-                llm_choice="deepseek",
-                ingest_path=self.folder_path
+                llm_choice="deepseek"
             )
-            QMessageBox.information(self, "Agent Created", f"Agent '{name}' successfully created.")
+            # Ingestion runs as a background job; the agent can chat while its knowledge base grows
+            self.job_id = self.agent_manager.ingest_queue.submit(name, self.folder_path)
+            QMessageBox.information(self, "Agent Created",
+                                    f"Agent '{name}' created. Its documents are being ingested in the background.")
             self.accept()
         except Exception as e:
             import traceback
@@ -1,7 +1,18 @@
 from PyQt5 import QtWidgets, QtCore, QtWebEngineWidgets
-from PyQt5.QtWidgets import QApplication, QVBoxLayout, QWidget, QComboBox, QPushButton, QLineEdit
+from PyQt5.QtWebChannel import QWebChannel
+from PyQt5.QtWidgets import (
+    QApplication, QVBoxLayout, QHBoxLayout, QWidget, QComboBox, QPushButton, QLineEdit, QLabel, QProgressBar,
+)
 import sys
 from ui.agent_editor import AgentEditor
+from ui.chat_worker import StreamWorker, WarmupWorker
+from utils.metrics import span
+from utils.startup import get_startup_timer, startup_phase
+from ui.chat_page import (
+    RENDER_PAGE_SIZE, ChatBridge, base_url, chat_page_html, js_call, loading_html, message_header, messages_js,
+)
+
+INGEST_POLL_MS = 500
 
 class ChatInterface(QWidget):
     def __init__(self, agent_manager):
@@ -12,12 +23,25 @@ class ChatInterface(QWidget):
         self.agent_manager = agent_manager
         self.agent_names = self.agent_manager.list_agents()
         self.chat_handlers = {}
+        self.handler = None  # None until the selected agent has finished warming up
+        self.warmup_workers = {}  # agent name -> running WarmupWorker
+        self.stream_workers = {}  # agent name -> running StreamWorker
+        self.streaming_text = {}  # agent name -> reply received so far
+        self.page_ready = False
+        self.render_start = 0  # history indices currently shown in the page
+        self.render_end = 0
+        self.ingest_job_ids = set()  # background ingestion jobs shown in the status row
+        self.shown_job_id = None
 
         self.layout = QVBoxLayout()
         self.setLayout(self.layout)
 
         self._build_widgets()
-        self._set_active_agent(self.agent_names[0])
+        if self.agent_names:
+            self._set_active_agent(self.agent_names[0])
+        # Jobs queued or interrupted in an earlier session resume in the background
+        for job in self.agent_manager.ingest_queue.active_jobs():
+            self._track_ingest_job(job["id"])
 
     def _build_widgets(self):
         self.agent_dropdown = QComboBox()
@@ -30,6 +54,12 @@ class ChatInterface(QWidget):
         self.layout.addWidget(self.clear_btn)
 
         self.chat_display = QtWebEngineWidgets.QWebEngineView()
+        self.chat_display.loadFinished.connect(self._on_page_loaded)
+        self.bridge = ChatBridge(self)
+        self.bridge.older_requested.connect(self._load_older_messages)
+        self.channel = QWebChannel(self)
+        self.channel.registerObject("bridge", self.bridge)
+        self.chat_display.page().setWebChannel(self.channel)
         self.layout.addWidget(self.chat_display, stretch=1)
 
         self.user_input = QLineEdit()
@@ -52,61 +82,241 @@ class ChatInterface(QWidget):
         self.delete_btn.clicked.connect(self._delete_agent)
         self.layout.addWidget(self.delete_btn)
 
+        self.ingest_row = QWidget()
+        ingest_layout = QHBoxLayout(self.ingest_row)
+        ingest_layout.setContentsMargins(0, 0, 0, 0)
+        self.ingest_label = QLabel()
+        self.ingest_bar = QProgressBar()
+        self.cancel_ingest_btn = QPushButton("Cancel Ingestion")
+        self.cancel_ingest_btn.clicked.connect(self._cancel_ingestion)
+        ingest_layout.addWidget(self.ingest_label, stretch=1)
+        ingest_layout.addWidget(self.ingest_bar)
+        ingest_layout.addWidget(self.cancel_ingest_btn)
+        self.ingest_row.hide()
+        self.layout.addWidget(self.ingest_row)
+        self.ingest_timer = QtCore.QTimer(self)
+        self.ingest_timer.setInterval(INGEST_POLL_MS)
+        self.ingest_timer.timeout.connect(self._poll_ingest_jobs)
+
     def _set_active_agent(self, agent_name):
         if not agent_name or agent_name not in self.agent_names:
             return
         self.agent_dropdown.setCurrentText(agent_name)
-        agent = self.agent_manager.get_agent(agent_name)
+        # Agents not built yet load their index and models on a worker so the window stays responsive
+        agent = self.agent_manager.peek_agent(agent_name)
+        if agent is None:
+            self._warm_up(agent_name)
+            return
+        self._activate_agent(agent_name, agent)
+
+    def _activate_agent(self, agent_name, agent):
         if agent_name not in self.chat_handlers:
             from chat.chat_handler import ChatHandler
             self.chat_handlers[agent_name] = ChatHandler(agent)
+        # get_agent serves cached agents, so this only changes after an invalidation
+        self.chat_handlers[agent_name].agent = agent
         self.handler = self.chat_handlers[agent_name]
+        self._set_input_enabled(True)
         self._refresh_display()
 
+    def _warm_up(self, agent_name):
+        self.handler = None
+        self.page_ready = False
+        self._set_input_enabled(False)
+        self.chat_display.setHtml(loading_html(agent_name))
+        if agent_name in self.warmup_workers:
+            return
+        worker = WarmupWorker(self.agent_manager, agent_name, self)
+        worker.ready.connect(self._on_agent_ready)
+        worker.failed.connect(self._on_warmup_failed)
+        self.warmup_workers[agent_name] = worker
+        worker.start()
+
+    def _finish_warmup(self, agent_name):
+        worker = self.warmup_workers.pop(agent_name, None)
+        if worker:
+            worker.wait()
+            worker.deleteLater()
+
+    def _on_agent_ready(self, agent_name, agent):
+        self._finish_warmup(agent_name)
+        # The user may have switched to another agent while this one loaded
+        if agent_name == self.agent_dropdown.currentText():
+            self._activate_agent(agent_name, agent)
+            get_startup_timer().mark("first agent ready")
+            get_startup_timer().print_report()
+
+    def _on_warmup_failed(self, agent_name, error):
+        self._finish_warmup(agent_name)
+        if agent_name == self.agent_dropdown.currentText():
+            self.chat_display.setHtml("")
+            QtWidgets.QMessageBox.critical(self, "Error", f"Failed to load '{agent_name}': {error}")
+
+    def _set_input_enabled(self, enabled):
+        for widget in (self.user_input, self.send_btn, self.clear_btn):
+            widget.setEnabled(enabled)
+
+    def _is_active(self, agent_name):
+        return self.handler is not None and self.handler.agent.name == agent_name
+
     def _on_agent_change(self):
         selected = self.agent_dropdown.currentText()
         if selected:
             self._set_active_agent(selected)
 
     def _refresh_display(self):
-        html = """
-        <!DOCTYPE html>
-        <html>
-        <head>
-        <script src="https://polyfill.io/v3/polyfill.min.js?features=es6"></script>
-        <script id="MathJax-script" async src="https://cdn.jsdelivr.net/npm/mathjax@3/es5/tex-mml-chtml.js"></script>
-        <style>
-            body { font-family: sans-serif; padding: 10px; }
-            .msg { margin-bottom: 20px; }
-            .user { font-weight: bold; color: #007acc; }
-            .agent { font-weight: bold; color: #009900; }
-        </style>
-        </head>
-        <body>
-        """
-        for msg in self.handler.get_history():
-            role = msg['role'].lower()
-            content = msg['content'].replace("\n", "<br>")
-            timestamp = msg['timestamp']
-            html += f'<div class="msg"><span class="{role}">[{timestamp}] {role.capitalize()}:</span><br>{content}</div>'
-
-        html += "</body></html>"
-        self.chat_display.setHtml(html)
+        # Full reload, only on agent switch or clear; new messages go through _append_new_messages
+        self.page_ready = False
+        with span("ui.refresh_display"):
+            self.chat_display.setHtml(chat_page_html(), base_url())
+
+    def _run_js(self, script):
+        self.chat_display.page().runJavaScript(script)
+
+    def _on_page_loaded(self, ok):
+        if not ok or self.handler is None:
+            return
+        self.page_ready = True
+        history = self.handler.get_history()
+        self.render_end = len(history)
+        self.render_start = max(0, self.render_end - RENDER_PAGE_SIZE)
+        with span("ui.render_history", agent=self.handler.agent.name):
+            self._run_js(messages_js("appendMessages", history[self.render_start:self.render_end]))
+        self._run_js(js_call("setHasMore", self.render_start > 0 or self.handler.has_more_history))
+        agent_name = self.handler.agent.name
+        if agent_name in self.stream_workers:
+            self._run_js(js_call("startStream", message_header("agent"), self.streaming_text.get(agent_name, "")))
+
+    def _append_new_messages(self):
+        if not self.page_ready:
+            return  # _on_page_loaded renders everything once the page is up
+        history = self.handler.get_history()
+        if len(history) > self.render_end:
+            with span("ui.append_messages"):
+                self._run_js(messages_js("appendMessages", history[self.render_end:]))
+            self.render_end = len(history)
+
+    def _load_older_messages(self):
+        if not self.page_ready:
+            return
+        if self.render_start == 0 and self.handler.has_more_history:
+            loaded = self.handler.load_older_history(RENDER_PAGE_SIZE)
+            self.render_start += len(loaded)
+            self.render_end += len(loaded)
+        start = max(0, self.render_start - RENDER_PAGE_SIZE)
+        older = self.handler.get_history()[start:self.render_start]
+        self.render_start = start
+        self._run_js(messages_js("prependMessages", older, start > 0 or self.handler.has_more_history))
 
     def _send_message(self):
         user_input = self.user_input.text().strip()
-        if user_input:
-            self.handler.send_message(user_input)
-            self.user_input.clear()
-            self._refresh_display()
+        if not user_input or self.handler is None:
+            return
+        agent_name = self.handler.agent.name
+        if agent_name in self.stream_workers:
+            QtWidgets.QMessageBox.information(self, "Busy", f"'{agent_name}' is still answering.")
+            return
+
+        token_stream = self.handler.stream_message(user_input)
+        worker = StreamWorker(agent_name, token_stream, self)
+        worker.token_received.connect(self._on_token)
+        worker.completed.connect(self._on_stream_finished)
+        worker.failed.connect(self._on_stream_failed)
+        self.stream_workers[agent_name] = worker
+        self.streaming_text[agent_name] = ""
+        self.user_input.clear()
+        self._append_new_messages()
+        if self.page_ready:
+            self._run_js(js_call("startStream", message_header("agent"), ""))
+        worker.start()
+
+    def _on_token(self, agent_name, token):
+        self.streaming_text[agent_name] = self.streaming_text.get(agent_name, "") + token
+        if self._is_active(agent_name) and self.page_ready:
+            self._run_js(js_call("appendToken", token))
+
+    def _finish_stream(self, agent_name):
+        worker = self.stream_workers.pop(agent_name, None)
+        if worker:
+            worker.wait()
+            worker.deleteLater()
+        self.streaming_text.pop(agent_name, None)
+
+    def _on_stream_finished(self, agent_name):
+        self._finish_stream(agent_name)
+        if self._is_active(agent_name) and self.page_ready:
+            self._run_js(js_call("endStream"))
+            self._append_new_messages()
+
+    def _on_stream_failed(self, agent_name, error):
+        self._finish_stream(agent_name)
+        if self._is_active(agent_name) and self.page_ready:
+            self._run_js(js_call("endStream"))
+        QtWidgets.QMessageBox.critical(self, "Error", f"'{agent_name}' failed to respond: {error}")
+
+    def _track_ingest_job(self, job_id):
+        self.ingest_job_ids.add(job_id)
+        self._poll_ingest_jobs()
+        self.ingest_timer.start()
+
+    def _poll_ingest_jobs(self):
+        queue = self.agent_manager.ingest_queue
+        active = {job["id"]: job for job in queue.active_jobs()}
+        for job_id in list(self.ingest_job_ids - set(active)):
+            self.ingest_job_ids.discard(job_id)
+            job = queue.job(job_id)
+            if job is not None and job["status"] == "failed":
+                QtWidgets.QMessageBox.critical(self, "Ingestion Failed",
+                                               f"Ingesting into '{job['agent_name']}' failed: {job['error']}")
+        shown = [active[job_id] for job_id in sorted(self.ingest_job_ids)]
+        if not shown:
+            self.shown_job_id = None
+            self.ingest_row.hide()
+            self.ingest_timer.stop()
+            return
+        job = next((job for job in shown if job["status"] == "running"), shown[0])
+        self.shown_job_id = job["id"]
+        progress = job["progress"]
+        total, done = progress.get("files_total", 0), progress.get("files_done", 0)
+        if job["status"] == "queued":
+            text = f"'{job['agent_name']}': waiting to ingest"
+        elif job["cancel_requested"]:
+            text = f"'{job['agent_name']}': cancelling..."
+        else:
+            text = f"Ingesting '{job['agent_name']}': {done}/{total} files, {progress.get('chunks', 0)} chunks"
+            if progress.get("eta_seconds") is not None:
+                text += f", about {int(progress['eta_seconds'])}s left"
+        if len(shown) > 1:
+            text += f" (+{len(shown) - 1} queued)"
+        self.ingest_label.setText(text)
+        self.ingest_bar.setRange(0, max(total, 1))
+        self.ingest_bar.setValue(done)
+        self.ingest_row.show()
+
+    def _cancel_ingestion(self):
+        if self.shown_job_id is not None:
+            self.agent_manager.ingest_queue.cancel(self.shown_job_id)
+            self._poll_ingest_jobs()
+
+    def closeEvent(self, event):
+        for worker in list(self.stream_workers.values()) + list(self.warmup_workers.values()):
+            worker.wait()
+        # A running job saves what it has finished and is picked up again on the next launch
+        self.ingest_timer.stop()
+        self.agent_manager.ingest_queue.stop(timeout=60)
+        super().closeEvent(event)
 
     def _clear_chat(self):
+        if self.handler is None:
+            return
         self.handler.clear_history()
         self._refresh_display()
 
     def _open_new_agent_dialog(self):
         dialog = AgentEditor(self.agent_manager, self)
         if dialog.exec_():
+            if dialog.job_id is not None:
+                self._track_ingest_job(dialog.job_id)
             self.agent_names = self.agent_manager.list_agents()
             self.agent_dropdown.clear()
             self.agent_dropdown.addItems(self.agent_names)
@@ -137,11 +347,16 @@ class ChatInterface(QWidget):
             if self.agent_names:
                 self._set_active_agent(self.agent_names[0])
             else:
+                self.handler = None
+                self.page_ready = False
                 self.chat_display.setHtml("")
 
 
 def launch_interface(agent_manager):
-    app = QApplication(sys.argv)
-    window = ChatInterface(agent_manager)
+    with startup_phase("QApplication"):
+        app = QApplication(sys.argv)
+    with startup_phase("build main window"):
+        window = ChatInterface(agent_manager)
     window.show()
-    sys.exit(app.exec_())
\ No newline at end of file
+    get_startup_timer().mark("window shown")
+    sys.exit(app.exec_())
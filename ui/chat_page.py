@@ -0,0 +1,183 @@
+import html
+import json
+import os
+from typing import List
+from PyQt5 import QtCore
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+MATHJAX_LOCAL = os.path.join(STATIC_DIR, "mathjax", "tex-mml-chtml.js")
+MATHJAX_CDN = "https://cdn.jsdelivr.net/npm/mathjax@3/es5/tex-mml-chtml.js"
+RENDER_PAGE_SIZE = 50
+
+# The page is loaded once per agent switch; afterwards Python only pushes new
+# message nodes through the JS functions below, and MathJax typesets just those.
+CHAT_PAGE_TEMPLATE = """
+<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<style>
+    body { font-family: sans-serif; padding: 10px; }
+    .msg { margin-bottom: 20px; }
+    .user { font-weight: bold; color: #007acc; }
+    .agent { font-weight: bold; color: #009900; }
+    #stream-text { white-space: pre-wrap; }
+    #history-status { color: #888; font-size: small; text-align: center; }
+    #math-status { color: #b00000; font-size: small; text-align: center; }
+</style>
+<script>
+    window.MathJax = {
+        startup: {
+            typeset: false,
+            ready: function () {
+                MathJax.startup.defaultReady();
+                MathJax.startup.promise.then(flushTypeset);
+            }
+        }
+    };
+    var pendingTypeset = [];
+    var hasMoreHistory = false;
+    var loadingOlder = false;
+
+    // Without MathJax the messages still show, with formulas left as TeX source
+    function mathjaxFailed(src) {
+        if (document.readyState === 'loading') {
+            document.addEventListener('DOMContentLoaded', function () { mathjaxFailed(src); });
+            return;
+        }
+        document.getElementById('math-status').textContent = 'Math rendering is off: MathJax could not be loaded from '
+            + src + '. Formulas are shown as TeX. See "Offline math rendering" in the README.';
+    }
+    function flushTypeset() {
+        var nodes = pendingTypeset;
+        pendingTypeset = [];
+        if (nodes.length) { MathJax.typesetPromise(nodes); }
+    }
+    function typesetNodes(nodes) {
+        pendingTypeset.push.apply(pendingTypeset, nodes);
+        if (window.MathJax && MathJax.typesetPromise) { flushTypeset(); }
+    }
+    function buildNodes(htmlList) {
+        return htmlList.map(function (html) {
+            var node = document.createElement('div');
+            node.className = 'msg';
+            node.innerHTML = html;
+            return node;
+        });
+    }
+    function nearBottom() {
+        return window.innerHeight + window.scrollY >= document.body.scrollHeight - 40;
+    }
+    function setHasMore(more) {
+        hasMoreHistory = more;
+        document.getElementById('history-status').textContent = more ? 'Scroll up for older messages' : '';
+    }
+    function appendMessages(htmlList) {
+        var stick = nearBottom();
+        var container = document.getElementById('messages');
+        var nodes = buildNodes(htmlList);
+        nodes.forEach(function (node) { container.appendChild(node); });
+        typesetNodes(nodes);
+        if (stick) { window.scrollTo(0, document.body.scrollHeight); }
+    }
+    function prependMessages(htmlList, more) {
+        var container = document.getElementById('messages');
+        var oldHeight = document.body.scrollHeight;
+        var nodes = buildNodes(htmlList);
+        for (var i = nodes.length - 1; i >= 0; i--) { container.insertBefore(nodes[i], container.firstChild); }
+        window.scrollTo(0, window.scrollY + document.body.scrollHeight - oldHeight);
+        setHasMore(more);
+        loadingOlder = false;
+        typesetNodes(nodes);
+    }
+    function startStream(header, text) {
+        endStream();
+        var node = document.createElement('div');
+        node.className = 'msg';
+        node.id = 'stream';
+        node.innerHTML = header + '<br><span id="stream-text"></span>';
+        document.body.appendChild(node);
+        appendToken(text);
+    }
+    function appendToken(text) {
+        var stick = nearBottom();
+        var el = document.getElementById('stream-text');
+        if (el && text) { el.insertAdjacentText('beforeend', text); }
+        if (stick) { window.scrollTo(0, document.body.scrollHeight); }
+    }
+    function endStream() {
+        var node = document.getElementById('stream');
+        if (node) { node.parentNode.removeChild(node); }
+    }
+    window.addEventListener('scroll', function () {
+        if (window.scrollY < 50 && hasMoreHistory && !loadingOlder && window.bridge) {
+            loadingOlder = true;
+            window.bridge.loadOlder();
+        }
+    });
+</script>
+<script src="qrc:///qtwebchannel/qwebchannel.js"></script>
+<script id="MathJax-script" async src="%MATHJAX_SRC%" onerror="mathjaxFailed(this.src)"></script>
+</head>
+<body>
+<div id="math-status"></div>
+<div id="history-status"></div>
+<div id="messages"></div>
+<script>
+    new QWebChannel(qt.webChannelTransport, function (channel) { window.bridge = channel.objects.bridge; });
+</script>
+</body>
+</html>
+"""
+
+_warned_cdn = False
+
+
+def mathjax_src() -> str:
+    global _warned_cdn
+    if os.path.exists(MATHJAX_LOCAL):
+        return "mathjax/tex-mml-chtml.js"
+    if not _warned_cdn:
+        print(f"[WARN] No local MathJax at {MATHJAX_LOCAL}; falling back to {MATHJAX_CDN}. "
+              "Without network access math is shown as TeX; see 'Offline math rendering' in the README.")
+        _warned_cdn = True
+    return MATHJAX_CDN
+
+
+def chat_page_html() -> str:
+    return CHAT_PAGE_TEMPLATE.replace("%MATHJAX_SRC%", mathjax_src())
+
+
+def base_url() -> QtCore.QUrl:
+    return QtCore.QUrl.fromLocalFile(STATIC_DIR + os.sep)
+
+
+def message_header(role: str, timestamp: str = None) -> str:
+    role = role.lower()
+    stamp = f"[{timestamp}] " if timestamp else ""
+    return f'<span class="{role}">{stamp}{role.capitalize()}:</span>'
+
+
+def message_html(msg: dict) -> str:
+    content = msg['content'].replace("\n", "<br>")
+    return f"{message_header(msg['role'], msg['timestamp'])}<br>{content}"
+
+
+def loading_html(agent_name: str) -> str:
+    return f"<p style='font-family: sans-serif; color: #666'>Loading {html.escape(agent_name)}...</p>"
+
+
+def js_call(function: str, *args) -> str:
+    return f"{function}({', '.join(json.dumps(arg) for arg in args)});"
+
+
+def messages_js(function: str, messages: List[dict], *args) -> str:
+    return js_call(function, [message_html(msg) for msg in messages], *args)
+
+
+class ChatBridge(QtCore.QObject):
+    older_requested = QtCore.pyqtSignal()
+
+    @QtCore.pyqtSlot()
+    def loadOlder(self):
+        self.older_requested.emit()
@@ -0,0 +1,49 @@
+import traceback
+from PyQt5 import QtCore
+from utils.startup import startup_phase
+
+
+class StreamWorker(QtCore.QThread):
+    # Each signal carries the agent name so the window can route tokens from
+    # several concurrently generating agents.
+    token_received = QtCore.pyqtSignal(str, str)
+    completed = QtCore.pyqtSignal(str)
+    failed = QtCore.pyqtSignal(str, str)
+
+    def __init__(self, agent_name, token_stream, parent=None):
+        super().__init__(parent)
+        self.agent_name = agent_name
+        self.token_stream = token_stream
+
+    def run(self):
+        try:
+            for token in self.token_stream:
+                self.token_received.emit(self.agent_name, token)
+        except Exception as e:
+            traceback.print_exc()
+            self.failed.emit(self.agent_name, str(e))
+            return
+        self.completed.emit(self.agent_name)
+
+
+class WarmupWorker(QtCore.QThread):
+    # Builds an agent (FAISS index, chain, embedding model) off the UI thread
+    ready = QtCore.pyqtSignal(str, object)
+    failed = QtCore.pyqtSignal(str, str)
+
+    def __init__(self, agent_manager, agent_name, parent=None):
+        super().__init__(parent)
+        self.agent_manager = agent_manager
+        self.agent_name = agent_name
+
+    def run(self):
+        try:
+            with startup_phase(f"warm-up: build agent '{self.agent_name}'"):
+                agent = self.agent_manager.get_agent(self.agent_name)
+            with startup_phase("warm-up: embedding model"):
+                agent.vector_store.warm_up()
+        except Exception as e:
+            traceback.print_exc()
+            self.failed.emit(self.agent_name, str(e))
+            return
+        self.ready.emit(self.agent_name, agent)
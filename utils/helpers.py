@@ -0,0 +1,46 @@
+import os
+import re
+import sqlite3
+from typing import Iterator, Sequence
+
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+_encoding = None
+
+
+def count_tokens(text: str) -> int:
+    # Uses tiktoken's cl100k_base when installed; otherwise a word/punctuation count,
+    # which tracks BPE token counts closely enough for budgeting.
+    global _encoding
+    if not text:
+        return 0
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _encoding = False
+    if _encoding:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return len(_TOKEN_PATTERN.findall(text))
+
+
+# SQLite caps the number of bound parameters per statement (999 before 3.32), so IN (...)
+# lookups over many keys are split into batches of this size
+SQL_BATCH_SIZE = 500
+
+
+def sql_batches(values: Sequence, size: int = SQL_BATCH_SIZE) -> Iterator[Sequence]:
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def sqlite_connect(path: str, shared: bool = False, timeout: float = 5.0) -> sqlite3.Connection:
+    # WAL lets readers run while a write is in progress; with WAL, synchronous=NORMAL keeps the
+    # database consistent and only risks the last commits on power loss. shared=True allows one
+    # connection to be used from several threads, guarded by the caller's own lock.
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path, check_same_thread=not shared, timeout=timeout)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
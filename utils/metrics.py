@@ -0,0 +1,229 @@
+import atexit
+import json
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+# Off by default; when off, span() returns a shared no-op and counters return immediately
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "0") == "1"
+# Prometheus text-format file (e.g. for node_exporter's textfile collector), rewritten
+# at most every METRICS_EXPORT_INTERVAL seconds and at exit
+METRICS_PROM_PATH = os.getenv("METRICS_PROM_PATH", "metrics.prom")
+METRICS_EXPORT_INTERVAL = float(os.getenv("METRICS_EXPORT_INTERVAL", "15"))
+# Optional JSON-lines log with one record per finished span
+METRICS_LOG_PATH = os.getenv("METRICS_LOG_PATH")
+METRIC_PREFIX = "modularapp"
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.total += value
+        self.count += 1
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **labels):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    def __init__(self, registry: "MetricsRegistry", name: str, labels: Dict[str, str]):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+        self.parent: Optional[str] = None
+
+    def set(self, **labels):
+        # Labels only known once the stage ran, e.g. whether a cache hit
+        self.labels.update(labels)
+
+    def __enter__(self):
+        stack = self.registry.span_stack()
+        self.parent = stack[-1].name if stack else None
+        stack.append(self)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self.started
+        self.registry.span_stack().pop()
+        if exc_type is not None:
+            self.labels["error"] = exc_type.__name__
+        self.registry.finish_span(self, seconds)
+        return False
+
+
+# Latency histograms per stage plus counters (tokens, cache hits/misses), shared process-wide
+class MetricsRegistry:
+    def __init__(self, enabled: bool = METRICS_ENABLED, prom_path: Optional[str] = METRICS_PROM_PATH,
+                 log_path: Optional[str] = METRICS_LOG_PATH, export_interval: float = METRICS_EXPORT_INTERVAL):
+        self.enabled = enabled
+        self.prom_path = prom_path
+        self.log_path = log_path
+        self.export_interval = export_interval
+        self.histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        self.counters: Dict[Tuple[str, Labels], float] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._log_file = None
+        self._last_export = time.monotonic()
+
+    def span_stack(self) -> list:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def finish_span(self, span: Span, seconds: float):
+        labels = {"stage": span.name, **{k: v for k, v in span.labels.items() if k != "error"}}
+        if "error" in span.labels:
+            labels["outcome"] = "error"
+        self.observe("stage_seconds", seconds, **labels)
+        if self.log_path:
+            self._log({"ts": time.time(), "span": span.name, "parent": span.parent,
+                       "seconds": round(seconds, 6), "thread": threading.current_thread().name, **span.labels})
+        if self.prom_path and time.monotonic() - self._last_export >= self.export_interval:
+            self.export_prometheus()
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def increment(self, name: str, amount: float = 1, **labels):
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def _log(self, record: dict):
+        line = json.dumps(record, default=str) + "\n"
+        with self._lock:
+            if self._log_file is None:
+                self._log_file = open(self.log_path, "a", encoding="utf-8", buffering=1)
+            self._log_file.write(line)
+
+    def prometheus_text(self) -> str:
+        def label_text(labels: Labels, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+            pairs = labels + extra
+            if not pairs:
+                return ""
+            escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+            return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + "}"
+
+        lines = []
+        with self._lock:
+            histograms = sorted(self.histograms.items())
+            counters = sorted(self.counters.items())
+        declared = set()
+        for (name, labels), histogram in histograms:
+            full = f"{METRIC_PREFIX}_{name}"
+            if full not in declared:
+                lines.append(f"# TYPE {full} histogram")
+                declared.add(full)
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f"{full}_bucket{label_text(labels, (('le', repr(float(bound))),))} {cumulative}")
+            lines.append(f"{full}_bucket{label_text(labels, (('le', '+Inf'),))} {histogram.count}")
+            lines.append(f"{full}_sum{label_text(labels)} {histogram.total:.6f}")
+            lines.append(f"{full}_count{label_text(labels)} {histogram.count}")
+        for (name, labels), value in counters:
+            full = f"{METRIC_PREFIX}_{name}"
+            if full not in declared:
+                lines.append(f"# TYPE {full} counter")
+                declared.add(full)
+            lines.append(f"{full}{label_text(labels)} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def export_prometheus(self, path: Optional[str] = None):
+        path = path or self.prom_path
+        self._last_export = time.monotonic()
+        if not path:
+            return
+        tmp_path = path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(self.prometheus_text())
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"[WARN] Failed to export metrics to {path}: {e}")
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "histograms": {
+                    f"{name}{dict(labels)}": {"count": h.count, "sum": round(h.total, 6)}
+                    for (name, labels), h in self.histograms.items()
+                },
+                "counters": {f"{name}{dict(labels)}": value for (name, labels), value in self.counters.items()},
+            }
+
+    def close(self):
+        if self.enabled and self.prom_path:
+            self.export_prometheus()
+        with self._lock:
+            if self._log_file is not None:
+                self._log_file.close()
+                self._log_file = None
+
+
+_registry = MetricsRegistry()
+atexit.register(_registry.close)
+
+
+def get_metrics() -> MetricsRegistry:
+    return _registry
+
+
+def metrics_enabled() -> bool:
+    return _registry.enabled
+
+
+def enable_metrics(prom_path: Optional[str] = None, log_path: Optional[str] = None):
+    _registry.enabled = True
+    if prom_path:
+        _registry.prom_path = prom_path
+    if log_path:
+        _registry.log_path = log_path
+
+
+def span(name: str, **labels):
+    if not _registry.enabled:
+        return _NOOP_SPAN
+    return Span(_registry, name, labels)
+
+
+def increment(name: str, amount: float = 1, **labels):
+    if _registry.enabled:
+        _registry.increment(name, amount, **labels)
+
+
+def observe(name: str, seconds: float, **labels):
+    if _registry.enabled:
+        _registry.observe(name, seconds, **labels)
@@ -0,0 +1,80 @@
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+
+# Print where launch time went once the first agent is ready
+STARTUP_REPORT = os.getenv("STARTUP_REPORT", "0") == "1"
+# Modules whose import cost is worth calling out in the report
+HEAVY_MODULES = ("PyQt5.QtWebEngineWidgets", "langchain", "langchain_community", "langchain_huggingface",
+                 "faiss", "numpy", "torch", "sentence_transformers", "openai", "httpx")
+
+
+def _interpreter_startup() -> Optional[float]:
+    # Seconds between process creation and this module's import, when psutil is available
+    try:
+        import psutil
+        return max(0.0, time.time() - psutil.Process().create_time())
+    except Exception:
+        return None
+
+
+# Records named launch phases (relative to process start) for the startup timing report
+class StartupTimer:
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.before_origin = _interpreter_startup()
+        self.phases: List[Tuple[str, float, float, str]] = []  # (name, start, duration, thread)
+        self.enabled = STARTUP_REPORT
+        self.reported = False
+        self._lock = threading.Lock()
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.origin
+
+    @contextmanager
+    def phase(self, name: str):
+        started = self.elapsed()
+        try:
+            yield
+        finally:
+            self.record(name, started, self.elapsed() - started)
+
+    def record(self, name: str, start: float, duration: float):
+        with self._lock:
+            self.phases.append((name, start, duration, threading.current_thread().name))
+
+    def mark(self, name: str):
+        self.record(name, self.elapsed(), 0.0)
+
+    def report(self) -> str:
+        lines = ["Startup timing (seconds since launch):"]
+        if self.before_origin is not None:
+            lines.append(f"  {'interpreter start':<36} {'':>8} {self.before_origin:>8.3f}")
+        with self._lock:
+            phases = sorted(self.phases, key=lambda phase: phase[1])
+        for name, start, duration, thread in phases:
+            where = "" if thread == "MainThread" else f"  [{thread}]"
+            duration_text = f"{duration:>8.3f}" if duration else f"{'':>8}"
+            lines.append(f"  {name:<36} {duration_text} {start + duration:>8.3f}{where}")
+        loaded = [module for module in HEAVY_MODULES if module in sys.modules]
+        lines.append(f"  heavy modules loaded: {', '.join(loaded) or 'none'}")
+        return "\n".join(lines)
+
+    def print_report(self):
+        if self.enabled and not self.reported:
+            self.reported = True
+            print(self.report())
+
+
+_timer = StartupTimer()
+
+
+def get_startup_timer() -> StartupTimer:
+    return _timer
+
+
+def startup_phase(name: str):
+    return _timer.phase(name)